@@ -0,0 +1,26 @@
+// StockBadge.js
+// Keeps every element with data-stock="<slug>" up to date with the remaining stock of that offer,
+// the text is data-stock-label followed by the number.
+// All offers of a page share one EventSource, the browser reconnects on its own after errors.
+export function connectStockBadges(streamUrl) {
+  const badges = document.querySelectorAll('[data-stock]');
+  if (!badges.length || !window.EventSource) return null;
+
+  const slugs = [...new Set([...badges].map(badge => badge.dataset.stock))];
+  const query = slugs.map(slug => 'angebot=' + encodeURIComponent(slug)).join('&');
+  const source = new EventSource(streamUrl + '?' + query);
+
+  source.addEventListener('stock', event => {
+    const { angebot, verfuegbar } = JSON.parse(event.data);
+    badges.forEach(badge => {
+      if (badge.dataset.stock === angebot) {
+        badge.textContent = (badge.dataset.stockLabel || '') + verfuegbar;
+      }
+    });
+  });
+  // no need to keep the connection when the page is left
+  window.addEventListener('pagehide', () => source.close());
+  return source;
+}
+
+export default connectStockBadges;
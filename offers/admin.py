@@ -1,15 +1,33 @@
-from django.contrib import admin, messages
+from django.contrib import admin
+from django.db.models import Max, Min
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 
-from offers.models import Consent, EmailLog, Offer, Registration
-from offers.services import (
-    export_registrations_csv,
-    export_registrations_excel,
-    export_registrations_pdf,
-)
+from offers.models import AllocationEntry, Consent, EmailLog, ExportJob, Offer, Registration, WaitlistEntry
+from offers.services import EXPORT_WRITERS, PDF_GROUPS, export_response
+from offers.tasks import run_export_job
+
+
+class ChangelistQueryMixin:
+    """Narrows the changelist rows to the columns ``list_display`` actually needs.
+
+    ``list_only`` is only applied on the changelist, the change form keeps loading full objects.
+    """
+
+    list_only = None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if self.list_only and match and match.url_name and match.url_name.endswith("_changelist"):
+            queryset = queryset.only(*self.list_only)
+        return queryset
 
 
 @admin.register(Offer)
-class OfferAdmin(admin.ModelAdmin):
+class OfferAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = (
         "titel",
         "bestell_start",
@@ -18,62 +36,271 @@ class OfferAdmin(admin.ModelAdmin):
         "abhol_bis",
         "limit_gesamt",
         "limit_pro_user",
+        "vergabe",
         "remaining",
+        "downloads",
+    )
+    list_only = (
+        "titel",
+        "slug",
+        "bestell_start",
+        "bestell_ende",
+        "abhol_von",
+        "abhol_bis",
+        "limit_gesamt",
+        "limit_pro_user",
+        "vergabe",
+        "reserved",
     )
     search_fields = ("titel", "beschreibung")
     prepopulated_fields = {"slug": ("titel",)}
-    list_filter = ("bestell_start", "abhol_von")
-    actions = ["export_vorbestellungen_csv", "export_vorbestellungen_excel", "export_vorbestellungen_pdf"]
+    list_filter = ("bestell_start", "abhol_von", "vergabe")
+    actions = [
+        "export_vorbestellungen_csv",
+        "export_vorbestellungen_excel",
+        "export_vorbestellungen_pdf",
+        "export_vorbestellungen_pdf_nachname",
+        "export_vorbestellungen_pdf_plz",
+        "export_abholliste_csv",
+        "export_abholliste_excel",
+        "export_abholliste_pdf",
+        "export_abhol_manifest",
+    ]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stock()
 
-    @admin.display(description="Verfügbar")
+    @admin.display(description="Verfügbar", ordering="remaining")
     def remaining(self, obj):
         return obj.remaining_quantity()
 
-    def _single_offer_action(self, request, queryset, exporter):
-        if queryset.count() != 1:
-            self.message_user(request, "Bitte genau ein Angebot wählen.", level=messages.ERROR)
-            return None
-        offer = queryset.first()
-        return exporter(offer)
+    @admin.display(description="Download")
+    def downloads(self, obj):
+        links = [
+            (reverse("admin:offers_offer_export", args=[obj.pk, format]), label)
+            for format, label in ExportJob.Format.choices
+            if format in EXPORT_WRITERS
+        ]
+        return format_html_join(" · ", '<a href="{}">{}</a>', links)
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:offer_id>/export/<str:format>/",
+                self.admin_site.admin_view(self.export_view),
+                name="offers_offer_export",
+            ),
+            *super().get_urls(),
+        ]
+
+    def export_view(self, request, offer_id, format):
+        """Single offer export, served from the export cache while no order has changed."""
+        group_by = request.GET.get("gruppierung") or None
+        if not self.has_view_permission(request) or format not in EXPORT_WRITERS or group_by not in (None, *PDF_GROUPS):
+            raise Http404
+        offer = get_object_or_404(Offer, pk=offer_id)
+        return export_response(offer, format, group_by, request=request)
+
+    def _enqueue_export(self, request, queryset, format, group_by="", pickup=False):
+        job = ExportJob(format=format, gruppierung=group_by, erstellt_von=request.user)
+        if pickup:
+            # the pickup list covers every offer that can be picked up while any selected one can
+            window = queryset.aggregate(von=Min("abhol_von"), bis=Max("abhol_bis"))
+            job.abholung_von, job.abholung_bis = window["von"], window["bis"]
+            queryset = Offer.objects.filter(abhol_von__lte=job.abholung_bis, abhol_bis__gte=job.abholung_von)
+        job.save()
+        job.offers.set(queryset)
+        run_export_job.enqueue(job.pk)
+        url = reverse("admin:offers_exportjob_changelist")
+        self.message_user(
+            request,
+            format_html('Export gestartet, die Datei steht gleich unter <a href="{}">Exporte</a> bereit.', url),
+        )
 
     @admin.action(description="Vorbestellungen als CSV exportieren")
     def export_vorbestellungen_csv(self, request, queryset):
-        return self._single_offer_action(request, queryset, export_registrations_csv)
+        self._enqueue_export(request, queryset, ExportJob.Format.CSV)
 
     @admin.action(description="Vorbestellungen als Excel exportieren")
     def export_vorbestellungen_excel(self, request, queryset):
-        return self._single_offer_action(request, queryset, export_registrations_excel)
+        self._enqueue_export(request, queryset, ExportJob.Format.EXCEL)
 
     @admin.action(description="Vorbestellungen als PDF exportieren")
     def export_vorbestellungen_pdf(self, request, queryset):
-        return self._single_offer_action(request, queryset, export_registrations_pdf)
+        self._enqueue_export(request, queryset, ExportJob.Format.PDF)
+
+    @admin.action(description="Pickliste als PDF, Seiten nach Nachname gruppiert")
+    def export_vorbestellungen_pdf_nachname(self, request, queryset):
+        self._enqueue_export(request, queryset, ExportJob.Format.PDF, "nachname")
+
+    @admin.action(description="Pickliste als PDF, Seiten nach PLZ gruppiert")
+    def export_vorbestellungen_pdf_plz(self, request, queryset):
+        self._enqueue_export(request, queryset, ExportJob.Format.PDF, "plz")
+
+    @admin.action(description="Abholliste pro Kunde als CSV (Abholfenster der gewählten Angebote)")
+    def export_abholliste_csv(self, request, queryset):
+        self._enqueue_export(request, queryset, ExportJob.Format.CSV, pickup=True)
+
+    @admin.action(description="Abholliste pro Kunde als Excel (Abholfenster der gewählten Angebote)")
+    def export_abholliste_excel(self, request, queryset):
+        self._enqueue_export(request, queryset, ExportJob.Format.EXCEL, pickup=True)
+
+    @admin.action(description="Abholliste pro Kunde als PDF (Abholfenster der gewählten Angebote)")
+    def export_abholliste_pdf(self, request, queryset):
+        self._enqueue_export(request, queryset, ExportJob.Format.PDF, pickup=True)
+
+    @admin.action(description="Offline-Manifest (SQLite) für das Abholfenster der gewählten Angebote")
+    def export_abhol_manifest(self, request, queryset):
+        self._enqueue_export(request, queryset, ExportJob.Format.MANIFEST, pickup=True)
 
 
 @admin.register(Registration)
-class RegistrationAdmin(admin.ModelAdmin):
+class RegistrationAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = (
         "offer",
         "user",
         "menge",
+        "code",
         "zustimmung_verbindlich_at",
+        "abgeholt_at",
         "erstellt_at",
     )
-    search_fields = ("offer__titel", "user__email", "user__last_name")
-    list_filter = ("offer", "zustimmung_verbindlich_at")
+    list_select_related = ("offer", "user")
+    list_only = (
+        "menge",
+        "code",
+        "zustimmung_verbindlich_at",
+        "abgeholt_at",
+        "erstellt_at",
+        "offer__titel",
+        "user__email",
+        "user__first_name",
+        "user__last_name",
+    )
+    # the code is an exact match on a unique index, the pickup counter uses the check-in screen
+    search_fields = ("=code", "offer__titel", "user__email", "user__last_name")
+    list_filter = ("offer", "zustimmung_verbindlich_at", "abgeholt_at")
+    readonly_fields = ("code",)
     autocomplete_fields = ("offer", "user")
     ordering = ("offer", "user__last_name")
 
 
+@admin.register(AllocationEntry)
+class AllocationEntryAdmin(ChangelistQueryMixin, admin.ModelAdmin):
+    list_display = ("offer", "user", "menge", "zugeteilt", "zustimmung_at", "erstellt_at")
+    list_select_related = ("offer", "user")
+    list_only = (
+        "menge",
+        "zugeteilt",
+        "zustimmung_at",
+        "erstellt_at",
+        "offer__titel",
+        "user__email",
+        "user__first_name",
+        "user__last_name",
+    )
+    search_fields = ("offer__titel", "user__email", "user__last_name")
+    list_filter = ("offer",)
+    readonly_fields = ("zugeteilt",)
+    autocomplete_fields = ("offer", "user")
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(ChangelistQueryMixin, admin.ModelAdmin):
+    list_display = ("offer", "user", "menge", "erstellt_at", "nachgerueckt", "nachgerueckt_am")
+    list_select_related = ("offer", "user")
+    list_only = (
+        "menge",
+        "erstellt_at",
+        "nachgerueckt",
+        "nachgerueckt_am",
+        "offer__titel",
+        "user__email",
+        "user__first_name",
+        "user__last_name",
+    )
+    search_fields = ("offer__titel", "user__email", "user__last_name")
+    list_filter = ("offer", "nachgerueckt_am")
+    readonly_fields = ("nachgerueckt", "nachgerueckt_am")
+    autocomplete_fields = ("offer", "user")
+    ordering = ("offer", "erstellt_at")
+
+
 @admin.register(Consent)
-class ConsentAdmin(admin.ModelAdmin):
+class ConsentAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ("user", "offer", "typ", "timestamp")
+    list_select_related = ("user", "offer")
+    list_only = ("typ", "timestamp", "offer__titel", "user__email", "user__first_name", "user__last_name")
     search_fields = ("user__email", "offer__titel")
     list_filter = ("typ", "timestamp")
 
 
 @admin.register(EmailLog)
-class EmailLogAdmin(admin.ModelAdmin):
+class EmailLogAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ("empfaenger", "typ", "offer", "timestamp", "zustellstatus")
+    list_select_related = ("offer",)
+    list_only = ("empfaenger", "typ", "timestamp", "zustellstatus", "offer__titel")
     search_fields = ("empfaenger", "offer__titel")
     list_filter = ("typ", "timestamp")
     readonly_fields = ("timestamp",)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Exports are created by the offer actions and written by the task worker, staff only downloads them."""
+
+    list_display = ("__str__", "angebote", "status", "zeilen", "dauer", "erstellt_von", "erstellt_am", "download")
+    list_select_related = ("erstellt_von",)
+    list_filter = ("status", "format")
+    readonly_fields = (
+        "offers",
+        "format",
+        "gruppierung",
+        "abholung_von",
+        "abholung_bis",
+        "status",
+        "datei",
+        "zeilen",
+        "dauer",
+        "fehler",
+        "erstellt_von",
+        "erstellt_am",
+        "fertig_am",
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("offers")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:job_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="offers_exportjob_download",
+            ),
+            *super().get_urls(),
+        ]
+
+    def download_view(self, request, job_id):
+        if not self.has_view_permission(request):
+            raise Http404
+        job = get_object_or_404(ExportJob, pk=job_id, status=ExportJob.Status.DONE)
+        if not job.datei:
+            raise Http404
+        return FileResponse(job.datei.open("rb"), as_attachment=True, filename=job.filename)
+
+    @admin.display(description="Angebote")
+    def angebote(self, obj):
+        return ", ".join(offer.titel for offer in obj.offers.all())
+
+    @admin.display(description="Datei")
+    def download(self, obj):
+        if obj.status != ExportJob.Status.DONE or not obj.datei:
+            return "–"
+        return format_html('<a href="{}">Herunterladen</a>', reverse("admin:offers_exportjob_download", args=[obj.pk]))
@@ -0,0 +1,102 @@
+"""Allocation of oversubscribed offers after the order window.
+
+During the window customers only leave an ``AllocationEntry``, a single row without any stock claim. Once
+``bestell_ende`` has passed, ``allocate()`` shares ``limit_gesamt`` among the entries in one transaction and creates
+all registrations at once, so the drop opening causes no write spike at all.
+"""
+
+from __future__ import annotations
+
+import random
+import secrets
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from offers.models import AllocationEntry, Offer, Registration
+from offers.reservations import register_many
+
+
+def wanted_quantity(entry: AllocationEntry, offer: Offer) -> int:
+    if offer.limit_pro_user:
+        return min(entry.menge, offer.limit_pro_user)
+    return entry.menge
+
+
+def allocate_lottery(wanted: dict[int, int], available: int, rng: random.Random) -> dict[int, int]:
+    """Entries are drawn in random order and get their full wish while stock lasts, the last one the rest."""
+    order = list(wanted)
+    rng.shuffle(order)
+    shares = {}
+    for entry_id in order:
+        shares[entry_id] = min(wanted[entry_id], available)
+        available -= shares[entry_id]
+    return shares
+
+
+def allocate_pro_rata(wanted: dict[int, int], available: int, rng: random.Random) -> dict[int, int]:
+    """Everybody gets the same fraction of the wish, the pieces left after rounding down go by largest remainder."""
+    total = sum(wanted.values())
+    if total <= available:
+        return dict(wanted)
+    shares = {entry_id: quantity * available // total for entry_id, quantity in wanted.items()}
+    # ties between equal remainders are drawn, not decided by who came first
+    order = sorted(wanted, key=lambda entry_id: (-(wanted[entry_id] * available % total), rng.random()))
+    for entry_id in order[: available - sum(shares.values())]:
+        shares[entry_id] += 1
+    return shares
+
+
+ALLOCATORS = {
+    Offer.Vergabe.LOS: allocate_lottery,
+    Offer.Vergabe.ANTEILIG: allocate_pro_rata,
+}
+
+
+@dataclass
+class AllocationResult:
+    entries: int = 0
+    registrations: int = 0
+    allocated: int = 0
+
+
+def allocate(offer: Offer, seed: int | None = None) -> AllocationResult:
+    """Allocates a closed offer once, repeated calls and offers still open for orders are left alone."""
+    rng = random.Random(secrets.randbits(64) if seed is None else seed)
+    result = AllocationResult()
+    with transaction.atomic():
+        # locked up front where the database supports it, register_many() guards the claim in any case
+        offer = Offer.objects.select_for_update().get(pk=offer.pk)
+        if offer.zugeteilt_am is not None or not offer.is_allocated_later or offer.bestell_ende >= timezone.now():
+            return result
+        entries = list(offer.allocation_entries.order_by("pk"))
+        # registrations that staff entered by hand keep their pieces
+        taken = set(offer.registrations.values_list("user_id", flat=True))
+        open_entries = {entry.pk: entry for entry in entries if entry.user_id not in taken}
+        wanted = {entry_id: wanted_quantity(entry, offer) for entry_id, entry in open_entries.items()}
+        shares = ALLOCATORS[offer.vergabe](wanted, offer.remaining_quantity(), rng)
+
+        registrations = [
+            Registration(
+                user_id=entry.user_id,
+                offer=offer,
+                menge=shares[entry_id],
+                zustimmung_verbindlich_at=entry.zustimmung_at,
+            )
+            for entry_id, entry in open_entries.items()
+            if shares.get(entry_id)
+        ]
+        result.allocated = register_many(offer, registrations, zugeteilt_am=timezone.now())
+        for entry in entries:
+            entry.zugeteilt = shares.get(entry.pk, 0)
+        AllocationEntry.objects.bulk_update(entries, ["zugeteilt"], batch_size=500)
+        result.entries = len(entries)
+        result.registrations = len(registrations)
+    return result
+
+
+def offers_due_for_allocation():
+    return Offer.objects.exclude(vergabe=Offer.Vergabe.DIREKT).filter(
+        bestell_ende__lt=timezone.now(), zugeteilt_am__isnull=True
+    )
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def stock_stream(_request):
+    """Whether the pages may open the live stock stream, only true where an ASGI server answers it."""
+    return {"stock_stream": settings.STOCK_STREAM_ASGI}
@@ -1,6 +1,8 @@
 from django import forms
+from django.db import transaction
+from django.utils import timezone
 
-from offers.models import Registration
+from offers.models import AllocationEntry, Consent, ConsentTexts, OfferAvailability, Registration, WaitlistEntry
 
 
 class RegistrationForm(forms.ModelForm):
@@ -10,17 +12,16 @@ class RegistrationForm(forms.ModelForm):
         model = Registration
         fields = ["menge"]
 
-    def __init__(self, user, offer, *args, **kwargs):
+    def __init__(self, user, offer, *args, availability=None, **kwargs):
         self.user = user
         self.offer = offer
         super().__init__(*args, **kwargs)
-        current_quantity = self.instance.menge if self.instance.pk else 0
-        exclude = self.instance if self.instance.pk else None
-        remaining_additional = offer.remaining_quantity(exclude_registration=exclude)
-        max_quantity = current_quantity + remaining_additional
-        if offer.limit_pro_user:
-            max_quantity = min(max_quantity, offer.limit_pro_user)
-        max_quantity = max(max_quantity, current_quantity)
+        if availability is None:
+            availability = OfferAvailability(offer, self.instance if self.instance.pk else None)
+        self.availability = availability
+        self.instance.availability = availability
+        current_quantity = availability.current_quantity
+        max_quantity = availability.max_quantity
 
         min_quantity = current_quantity or 1
         widget_attrs = {"min": min_quantity}
@@ -52,7 +53,7 @@ class RegistrationForm(forms.ModelForm):
     def clean(self):
         cleaned_data = super().clean()
         menge = cleaned_data.get("menge")
-        current_quantity = self.instance.menge if self.instance.pk else 0
+        current_quantity = self.availability.current_quantity
 
         if not self.user.is_authenticated:
             raise forms.ValidationError("Bitte melde dich zuerst an.")
@@ -65,11 +66,7 @@ class RegistrationForm(forms.ModelForm):
             raise forms.ValidationError({"menge": "Du kannst deine Reservierung nur erhöhen, nicht verringern."})
 
         if menge:
-            exclude = self.instance if self.instance.pk else None
-            remaining_additional = self.offer.remaining_quantity(exclude_registration=exclude)
-            max_quantity = current_quantity + remaining_additional
-            if self.offer.limit_pro_user:
-                max_quantity = min(max_quantity, self.offer.limit_pro_user)
+            max_quantity = self.availability.max_quantity
             if menge > max_quantity:
                 if current_quantity:
                     additional_available = max(0, max_quantity - current_quantity)
@@ -96,3 +93,64 @@ class RegistrationForm(forms.ModelForm):
         if commit:
             registration.confirm()
         return registration
+
+
+class AllocationEntryForm(forms.ModelForm):
+    """Wish for an offer with allocation after the order window, saved without touching the stock."""
+
+    consent = staticmethod(ConsentTexts.zuteilung)
+
+    class Meta:
+        model = AllocationEntry
+        fields = ["menge"]
+
+    def __init__(self, user, offer, *args, **kwargs):
+        self.user = user
+        self.offer = offer
+        super().__init__(*args, **kwargs)
+        self.max_quantity = min(offer.limit_pro_user or offer.limit_gesamt, offer.limit_gesamt)
+        self.fields["menge"].widget = forms.NumberInput(attrs={"min": 1, "max": self.max_quantity})
+        self.fields["menge"].help_text = f"Du kannst dir bis zu {self.max_quantity} Stück wünschen."
+        self.consent_text = self.consent(offer)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        menge = cleaned_data.get("menge")
+        if not self.user.email_verified_at:
+            raise forms.ValidationError("Bitte bestätige zuerst deine E-Mail-Adresse.")
+        if not self.offer.is_within_order_window():
+            raise forms.ValidationError("Dieses Angebot kann derzeit nicht bestellt werden.")
+        if menge is not None and not 1 <= menge <= self.max_quantity:
+            raise forms.ValidationError({"menge": f"Du kannst dir 1 bis {self.max_quantity} Stück wünschen."})
+        return cleaned_data
+
+    @transaction.atomic
+    def save(self, commit=True):
+        entry = super().save(commit=False)
+        entry.user = self.user
+        entry.offer = self.offer
+        entry.zustimmung_at = timezone.now()
+        if commit:
+            entry.save()
+            Consent.objects.create(
+                user=self.user, offer=self.offer, typ=Consent.Type.VERBINDLICH, text_version=self.consent_text
+            )
+        return entry
+
+
+class WaitlistEntryForm(AllocationEntryForm):
+    """Place on the waitlist of a sold-out offer, with the consent to be promoted to a binding order."""
+
+    consent = staticmethod(ConsentTexts.warteliste)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ["menge"]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.offer.remaining_quantity() > 0:
+            raise forms.ValidationError("Es ist noch Ware verfügbar, du kannst direkt bestellen.")
+        if Registration.objects.filter(user=self.user, offer=self.offer).exists():
+            raise forms.ValidationError("Du hast dieses Angebot bereits verbindlich bestellt.")
+        return cleaned_data
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from offers.allocation import allocate, offers_due_for_allocation
+
+
+class Command(BaseCommand):
+    help = "Teilt Angebote mit Losverfahren oder anteiliger Vergabe nach Ende des Bestellfensters zu."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Startwert für den Zufall, nur zum Nachvollziehen einer Verlosung.",
+        )
+
+    def handle(self, *args, **options):
+        offers = list(offers_due_for_allocation())
+        if not offers:
+            self.stdout.write("Keine Angebote zuzuteilen.")
+            return
+        for offer in offers:
+            result = allocate(offer, seed=options["seed"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{offer.titel}: {result.allocated} Stück an {result.registrations} von {result.entries} "
+                    "Interessent:innen zugeteilt."
+                )
+            )
@@ -0,0 +1,72 @@
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+
+from offers.services import HEADER, write_registrations_workbook
+
+
+def sample_rows(count):
+    for index in range(1, count + 1):
+        yield [
+            index,
+            "Wildschwein Bratwurst",
+            index % 5 + 1,
+            f"Nachname {index}",
+            "Vorname",
+            "Dorfstraße",
+            "1",
+            "14806",
+            "Bad Belzig",
+        ]
+
+
+def write_in_memory(count, target):
+    """The previous implementation: a regular workbook keeping every cell in memory."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in sample_rows(count):
+        sheet.append(row)
+    workbook.save(target)
+
+
+class Command(BaseCommand):
+    help = "Misst Laufzeit und Spitzenspeicher des Excel-Exports für synthetische Bestellmengen."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Zusätzlich den klassischen In-Memory-Workbook-Export messen.",
+        )
+
+    def handle(self, *args, **options):
+        variants = [("write-only", self._write_only)]
+        if options["compare"]:
+            variants.append(("in-memory", write_in_memory))
+
+        for count in options["rows"]:
+            for name, writer in variants:
+                duration, peak = self._measure(writer, count)
+                self.stdout.write(
+                    f"{count:>8} Zeilen  {name:<10}  {duration:6.2f} s  Spitze {peak / 1024 / 1024:7.1f} MiB"
+                )
+
+    @staticmethod
+    def _write_only(count, target):
+        write_registrations_workbook("Benchmark", "01.01.2026 – 03.01.2026", sample_rows(count), target)
+
+    @staticmethod
+    def _measure(writer, count):
+        with tempfile.TemporaryFile() as target:
+            tracemalloc.start()
+            started = time.perf_counter()
+            writer(count, target)
+            duration = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return duration, peak
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from offers.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = "Löscht Exporte, die älter als die angegebene Anzahl Tage sind, samt ihrer Dateien."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Exporte erst nach so vielen Tagen löschen.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        # post_delete is still sent for every job, see offers.signals.delete_export_file
+        _, deleted = ExportJob.objects.filter(erstellt_am__lt=cutoff).delete()
+        self.stdout.write(f"{deleted.get(ExportJob._meta.label, 0)} Exporte gelöscht.")
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from offers.manifest import write_manifest
+
+
+class Command(BaseCommand):
+    help = "Schreibt das Offline-Manifest (SQLite) aller Bestellungen eines Abholzeitraums."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--von", type=date.fromisoformat, help="Erster Abholtag (JJJJ-MM-TT), Standard: heute.")
+        parser.add_argument("--bis", type=date.fromisoformat, help="Letzter Abholtag (JJJJ-MM-TT), Standard: --von.")
+        parser.add_argument("-o", "--output", help="Zieldatei, Standard: abholung-<von>-<bis>.sqlite3")
+
+    def handle(self, *args, **options):
+        start = options["von"] or timezone.localdate()
+        end = options["bis"] or start
+        if end < start:
+            raise CommandError("--bis liegt vor --von.")
+        output = options["output"] or f"abholung-{start.isoformat()}-{end.isoformat()}.sqlite3"
+        with open(output, "wb") as target:
+            count = write_manifest(start, end, target)
+        self.stdout.write(self.style.SUCCESS(f"{count} Bestellungen in {output} geschrieben."))
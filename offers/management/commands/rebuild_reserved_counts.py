@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from offers.models import Offer
+from offers.pagecache import LIST_SCOPE, bump_stock_version
+
+
+class Command(BaseCommand):
+    help = "Gleicht den reservierten Bestand der Angebote mit der Summe der Bestellungen ab."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Nur prüfen, nichts korrigieren. Beendet sich mit Fehler, wenn Abweichungen gefunden werden.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            offers = Offer.objects.annotate(actual=Coalesce(Sum("registrations__menge"), 0)).order_by("pk")
+            mismatches = [offer for offer in offers if offer.reserved != offer.actual]
+            for offer in mismatches:
+                self.stdout.write(f"{offer.titel} (#{offer.pk}): Zähler {offer.reserved}, tatsächlich {offer.actual}")
+                if not options["check"]:
+                    Offer.objects.filter(pk=offer.pk).update(reserved=offer.actual)
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Alle Bestandszähler sind korrekt."))
+        elif options["check"]:
+            raise CommandError(f"{len(mismatches)} Angebot(e) mit abweichendem Bestandszähler.")
+        else:
+            # the queryset update bypasses the signals, the cached pages still show the old stock
+            bump_stock_version(LIST_SCOPE, *(offer.slug for offer in mismatches))
+            self.stdout.write(self.style.SUCCESS(f"{len(mismatches)} Bestandszähler korrigiert."))
@@ -3,38 +3,67 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from offers.models import EmailLog, Registration
-from offers.services import send_reminder_email
+from offers.models import EmailLog
+from offers.services import DispatchSummary, ReminderDispatcher, pending_reminders
 
 
 class Command(BaseCommand):
     help = "Verschickt Erinnerungs-Mails vor und zum Start des Abholfensters."
 
-    def handle(self, *args, **options):
-        today = timezone.localdate()
-        pre_reminder_date = today + timedelta(days=2)
-
-        pre_registrations = Registration.objects.select_related("offer", "user").filter(
-            offer__abhol_von=pre_reminder_date
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Anzahl Mails, die gemeinsam verschickt und protokolliert werden.",
         )
-        start_registrations = Registration.objects.select_related("offer", "user").filter(
-            offer__abhol_von=today
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Anzahl paralleler Versand-Threads, jeder mit eigener SMTP-Verbindung.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Maximale Anzahl Mails pro Sekunde über alle Threads.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Mails nur rendern, weder versenden noch protokollieren.",
         )
 
-        sent_count = 0
-
-        for registration in pre_registrations:
-            if not self._already_sent(registration, EmailLog.Typ.REMINDER_PRE):
-                send_reminder_email(registration, EmailLog.Typ.REMINDER_PRE)
-                sent_count += 1
-
-        for registration in start_registrations:
-            if not self._already_sent(registration, EmailLog.Typ.REMINDER_START):
-                send_reminder_email(registration, EmailLog.Typ.REMINDER_START)
-                sent_count += 1
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        pre_reminder_date = today + timedelta(days=2)
+        chunk_size = options["chunk_size"]
 
-        self.stdout.write(self.style.SUCCESS(f"{sent_count} Erinnerungs-Mails versendet."))
+        total = DispatchSummary()
+        for reminder_type, abhol_von in (
+            (EmailLog.Typ.REMINDER_PRE, pre_reminder_date),
+            (EmailLog.Typ.REMINDER_START, today),
+        ):
+            dispatcher = ReminderDispatcher(
+                reminder_type,
+                workers=options["workers"],
+                rate=options["rate"],
+                dry_run=options["dry_run"],
+            )
+            registrations = pending_reminders(reminder_type, abhol_von).iterator(chunk_size=chunk_size)
+            summary = dispatcher.dispatch(registrations, chunk_size=chunk_size)
+            total.sent += summary.sent
+            total.failed += summary.failed
+            total.duration += summary.duration
+            total.latencies.extend(summary.latencies)
 
-    @staticmethod
-    def _already_sent(registration, reminder_type):
-        return EmailLog.objects.filter(registration=registration, typ=reminder_type).exists()
+        verb = "gerendert (Testlauf)" if options["dry_run"] else "versendet"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total.sent} Erinnerungs-Mails {verb} ({total.duration:.1f} s, {total.rate:.1f} Mails/s, "
+                f"p50 {total.percentile(50) * 1000:.0f} ms, p95 {total.percentile(95) * 1000:.0f} ms)."
+            )
+        )
+        if total.failed:
+            self.stdout.write(self.style.ERROR(f"{total.failed} Erinnerungs-Mails fehlgeschlagen."))
@@ -0,0 +1,24 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from offers.manifest import apply_checkins, read_manifest_checkins
+
+
+class Command(BaseCommand):
+    help = "Überträgt die Abholungen aus einem Offline-Manifest. Mehrfaches Einspielen ist unschädlich."
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="Pfad zur Manifest-Datei.")
+
+    def handle(self, *args, **options):
+        try:
+            result = apply_checkins(read_manifest_checkins(options["manifest"]))
+        except ValidationError as exc:
+            raise CommandError(exc.messages[0])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{result.picked_up} Abholungen übernommen, {result.already_picked_up} waren bereits erfasst."
+            )
+        )
+        if result.unknown:
+            self.stdout.write(self.style.WARNING(f"Unbekannte Codes: {', '.join(result.unknown)}"))
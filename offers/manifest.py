@@ -0,0 +1,170 @@
+"""Offline pickup manifest: a self-contained SQLite snapshot of a pickup window and the sync of its check-ins.
+
+The pickup point works on the file alone, a check-in sets ``registrations.abgeholt_at`` (ISO 8601) in it.
+Uploading the file again applies all check-ins in one transaction; check-ins that are already known are skipped.
+"""
+
+from __future__ import annotations
+
+import shutil
+import sqlite3
+import tempfile
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from offers.models import Registration, normalize_code
+from offers.services import EXPORT_FIELDS, chunked, pickup_range, pickup_registrations
+
+MANIFEST_VERSION = 1
+MANIFEST_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE offers (id INTEGER PRIMARY KEY, titel TEXT NOT NULL);
+CREATE TABLE customers (
+    id INTEGER PRIMARY KEY,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    street TEXT NOT NULL,
+    house_number TEXT NOT NULL,
+    postal_code TEXT NOT NULL,
+    city TEXT NOT NULL
+);
+CREATE TABLE registrations (
+    code TEXT PRIMARY KEY,
+    customer_id INTEGER NOT NULL REFERENCES customers (id),
+    offer_id INTEGER NOT NULL REFERENCES offers (id),
+    menge INTEGER NOT NULL,
+    abgeholt_at TEXT
+) WITHOUT ROWID;
+CREATE INDEX customers_last_name ON customers (last_name COLLATE NOCASE);
+CREATE INDEX registrations_customer ON registrations (customer_id);
+"""
+MANIFEST_FIELDS = (*EXPORT_FIELDS, "code", "abgeholt_at")
+SYNC_BATCH_SIZE = 500
+
+
+def write_manifest(start: date, end: date, target) -> int:
+    """Writes the manifest of all registrations picked up between ``start`` and ``end`` into ``target``."""
+    registrations = pickup_registrations(start, end).only(*MANIFEST_FIELDS).iterator(chunk_size=2000)
+    count = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "manifest.sqlite3"
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                connection.executescript(MANIFEST_SCHEMA)
+                connection.executemany(
+                    "INSERT INTO meta VALUES (?, ?)",
+                    [
+                        ("version", str(MANIFEST_VERSION)),
+                        ("abholung", pickup_range(start, end)),
+                        ("abholung_von", start.isoformat()),
+                        ("abholung_bis", end.isoformat()),
+                        ("erstellt_am", timezone.now().isoformat()),
+                    ],
+                )
+                for batch in chunked(registrations, SYNC_BATCH_SIZE):
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO offers VALUES (?, ?)",
+                        {(registration.offer_id, registration.offer.titel) for registration in batch},
+                    )
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO customers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (
+                                registration.user_id,
+                                registration.user.last_name,
+                                registration.user.first_name,
+                                registration.user.street,
+                                registration.user.house_number,
+                                registration.user.postal_code,
+                                registration.user.city,
+                            )
+                            for registration in batch
+                        ],
+                    )
+                    connection.executemany(
+                        "INSERT INTO registrations VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (
+                                registration.code,
+                                registration.user_id,
+                                registration.offer_id,
+                                registration.menge,
+                                registration.abgeholt_at.isoformat() if registration.abgeholt_at else None,
+                            )
+                            for registration in batch
+                        ],
+                    )
+                    count += len(batch)
+        finally:
+            connection.close()
+        with path.open("rb") as source:
+            shutil.copyfileobj(source, target)
+    return count
+
+
+def parse_timestamp(value: str) -> datetime:
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Ungültiger Zeitpunkt: {value!r}")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def read_manifest_checkins(path) -> list[tuple[str, datetime]]:
+    """Check-ins recorded in a manifest file, the file is opened read-only."""
+    try:
+        connection = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(
+                "SELECT code, abgeholt_at FROM registrations WHERE abgeholt_at IS NOT NULL"
+            ).fetchall()
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError as exc:
+        raise ValidationError(f"Keine gültige Manifest-Datei: {exc}")
+    return [(code, parse_timestamp(value)) for code, value in rows]
+
+
+@dataclass
+class SyncResult:
+    picked_up: int = 0
+    already_picked_up: int = 0
+    unknown: list[str] = field(default_factory=list)
+
+
+def apply_checkins(checkins: Iterable[tuple[str, datetime]]) -> SyncResult:
+    """Writes offline check-ins back, keeping the first pickup time of every registration.
+
+    Idempotent: uploading the same check-ins again only counts them as already picked up.
+    """
+    first_seen = {}
+    for code, picked_up_at in checkins:
+        code = normalize_code(code)
+        if code not in first_seen or picked_up_at < first_seen[code]:
+            first_seen[code] = picked_up_at
+    result = SyncResult()
+    found = set()
+    with transaction.atomic():
+        for codes in chunked(first_seen, SYNC_BATCH_SIZE):
+            registrations = Registration.objects.filter(code__in=codes).only("pk", "code", "abgeholt_at").order_by()
+            open_registrations = []
+            for registration in registrations:
+                found.add(registration.code)
+                if registration.abgeholt_at is None:
+                    registration.abgeholt_at = first_seen[registration.code]
+                    open_registrations.append(registration)
+                else:
+                    result.already_picked_up += 1
+            Registration.objects.bulk_update(open_registrations, ["abgeholt_at"])
+            result.picked_up += len(open_registrations)
+    result.unknown = sorted(set(first_seen) - found)
+    return result
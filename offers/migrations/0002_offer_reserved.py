@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_reserved(apps, schema_editor):
+    Offer = apps.get_model("offers", "Offer")
+    for offer in Offer.objects.annotate(actual=Sum("registrations__menge")):
+        Offer.objects.filter(pk=offer.pk).update(reserved=offer.actual or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offer",
+            name="reserved",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Reserviert"),
+        ),
+        migrations.RunPython(fill_reserved, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+import django.db.models.deletion
+import offers.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0002_offer_reserved"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("format", models.CharField(choices=[("csv", "CSV"), ("xlsx", "Excel"), ("pdf", "PDF")], max_length=8, verbose_name="Format")),
+                ("gruppierung", models.CharField(blank=True, max_length=16, verbose_name="Gruppierung")),
+                ("status", models.CharField(choices=[("pending", "Wartend"), ("running", "Läuft"), ("done", "Fertig"), ("failed", "Fehlgeschlagen")], default="pending", max_length=16, verbose_name="Status")),
+                ("datei", models.FileField(blank=True, upload_to=offers.models.export_upload_to, verbose_name="Datei")),
+                ("zeilen", models.PositiveIntegerField(default=0, verbose_name="Zeilen")),
+                ("dauer", models.DurationField(blank=True, null=True, verbose_name="Dauer")),
+                ("fehler", models.TextField(blank=True, verbose_name="Fehler")),
+                ("erstellt_am", models.DateTimeField(auto_now_add=True)),
+                ("fertig_am", models.DateTimeField(blank=True, null=True, verbose_name="Fertig am")),
+                ("erstellt_von", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="export_jobs", to=settings.AUTH_USER_MODEL)),
+                ("offers", models.ManyToManyField(related_name="export_jobs", to="offers.offer", verbose_name="Angebote")),
+            ],
+            options={
+                "verbose_name": "Export",
+                "verbose_name_plural": "Exporte",
+                "ordering": ["-erstellt_am"],
+            },
+        ),
+    ]
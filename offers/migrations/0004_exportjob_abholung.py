@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0003_exportjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportjob",
+            name="abholung_bis",
+            field=models.DateField(blank=True, null=True, verbose_name="Abholung bis"),
+        ),
+        migrations.AddField(
+            model_name="exportjob",
+            name="abholung_von",
+            field=models.DateField(blank=True, null=True, verbose_name="Abholung ab"),
+        ),
+    ]
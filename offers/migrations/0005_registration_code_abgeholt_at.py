@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+from django.db import migrations, models
+
+import offers.models
+
+
+def fill_codes(apps, schema_editor):
+    Registration = apps.get_model("offers", "Registration")
+    used = set()
+    registrations = list(Registration.objects.only("pk"))
+    for registration in registrations:
+        code = offers.models.generate_code()
+        while code in used:
+            code = offers.models.generate_code()
+        used.add(code)
+        registration.code = code
+    Registration.objects.bulk_update(registrations, ["code"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0004_exportjob_abholung"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="registration",
+            name="code",
+            field=models.CharField(editable=False, max_length=8, null=True, verbose_name="Abholcode"),
+        ),
+        migrations.AddField(
+            model_name="registration",
+            name="abgeholt_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Abgeholt am"),
+        ),
+        migrations.RunPython(fill_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="registration",
+            name="code",
+            field=models.CharField(
+                default=offers.models.generate_code,
+                editable=False,
+                max_length=8,
+                unique=True,
+                verbose_name="Abholcode",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0005_registration_code_abgeholt_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="exportjob",
+            name="format",
+            field=models.CharField(choices=[("csv", "CSV"), ("xlsx", "Excel"), ("pdf", "PDF"), ("sqlite3", "SQLite-Manifest")], max_length=8, verbose_name="Format"),
+        ),
+    ]
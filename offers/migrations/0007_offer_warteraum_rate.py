@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0006_exportjob_manifest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offer",
+            name="warteraum_rate",
+            field=models.PositiveIntegerField(blank=True, help_text="Leer lassen für keinen Warteraum. Sonst werden angemeldete Kund:innen in der Reihenfolge ihres Eintreffens mit dieser Rate zum Bestellformular zugelassen.", null=True, verbose_name="Warteraum: Einlass pro Sekunde"),
+        ),
+    ]
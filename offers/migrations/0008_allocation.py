@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0007_offer_warteraum_rate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offer",
+            name="vergabe",
+            field=models.CharField(choices=[("direkt", "Wer zuerst bestellt"), ("los", "Losverfahren"), ("anteilig", "Anteilig")], default="direkt", help_text="Bei Losverfahren oder anteiliger Vergabe werden Wünsche gesammelt und erst nach dem Bestellfenster zugeteilt.", max_length=16, verbose_name="Vergabe"),
+        ),
+        migrations.AddField(
+            model_name="offer",
+            name="zugeteilt_am",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="Zugeteilt am"),
+        ),
+        migrations.CreateModel(
+            name="AllocationEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("menge", models.PositiveIntegerField(verbose_name="Gewünschte Menge")),
+                ("zustimmung_at", models.DateTimeField(verbose_name="Zustimmung am")),
+                ("zugeteilt", models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name="Zugeteilt")),
+                ("erstellt_at", models.DateTimeField(auto_now_add=True)),
+                ("offer", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="allocation_entries", to="offers.offer")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="allocation_entries", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "verbose_name": "Zuteilungswunsch",
+                "verbose_name_plural": "Zuteilungswünsche",
+                "ordering": ["offer", "erstellt_at"],
+                "constraints": [models.UniqueConstraint(fields=("user", "offer"), name="unique_allocation_entry_per_offer"), models.CheckConstraint(condition=models.Q(("menge__gte", 1)), name="allocation_entry_min_one")],
+            },
+        ),
+    ]
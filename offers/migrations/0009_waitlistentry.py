@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("offers", "0008_allocation"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("menge", models.PositiveIntegerField(verbose_name="Gewünschte Menge")),
+                ("zustimmung_at", models.DateTimeField(verbose_name="Zustimmung am")),
+                ("erstellt_at", models.DateTimeField(auto_now_add=True)),
+                ("nachgerueckt", models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name="Nachgerückt mit")),
+                ("nachgerueckt_am", models.DateTimeField(blank=True, editable=False, null=True, verbose_name="Nachgerückt am")),
+                ("offer", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="waitlist_entries", to="offers.offer")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="waitlist_entries", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "verbose_name": "Wartelisteneintrag",
+                "verbose_name_plural": "Warteliste",
+                "ordering": ["offer", "erstellt_at", "pk"],
+                "indexes": [models.Index(fields=["offer", "erstellt_at"], name="waitlist_offer_order_idx")],
+                "constraints": [models.UniqueConstraint(fields=("user", "offer"), name="unique_waitlist_entry_per_offer"), models.CheckConstraint(condition=models.Q(("menge__gte", 1)), name="waitlist_entry_min_one")],
+            },
+        ),
+    ]
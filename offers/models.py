@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import secrets
+import uuid
 from dataclasses import dataclass
 from datetime import date, timedelta
 from typing import Optional
@@ -7,7 +9,8 @@ from typing import Optional
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import CheckConstraint, Q, Sum, UniqueConstraint
+from django.db.models import CheckConstraint, F, Q, UniqueConstraint, Value
+from django.db.models.functions import Greatest, Lower
 from django.template.defaultfilters import slugify
 from django.urls import reverse
 from django.utils import timezone
@@ -23,8 +26,16 @@ class OfferQuerySet(models.QuerySet):
         now = timezone.now()
         return self.filter(bestell_start__gt=now)
 
+    def with_stock(self):
+        return self.annotate(remaining=Greatest(F("limit_gesamt") - F("reserved"), Value(0)))
+
 
 class Offer(models.Model):
+    class Vergabe(models.TextChoices):
+        DIREKT = "direkt", "Wer zuerst bestellt"
+        LOS = "los", "Losverfahren"
+        ANTEILIG = "anteilig", "Anteilig"
+
     titel = models.CharField("Titel", max_length=200)
     slug = models.SlugField(unique=True, max_length=200, blank=True)
     beschreibung = models.TextField("Beschreibung", blank=True)
@@ -34,6 +45,23 @@ class Offer(models.Model):
     abhol_bis = models.DateField("Abholung bis")
     limit_gesamt = models.PositiveIntegerField("Verfügbare Menge insgesamt")
     limit_pro_user = models.PositiveIntegerField("Maximal pro Kunde", null=True, blank=True)
+    warteraum_rate = models.PositiveIntegerField(
+        "Warteraum: Einlass pro Sekunde",
+        null=True,
+        blank=True,
+        help_text="Leer lassen für keinen Warteraum. Sonst werden angemeldete Kund:innen in der Reihenfolge ihres "
+        "Eintreffens mit dieser Rate zum Bestellformular zugelassen.",
+    )
+    vergabe = models.CharField(
+        "Vergabe",
+        max_length=16,
+        choices=Vergabe.choices,
+        default=Vergabe.DIREKT,
+        help_text="Bei Losverfahren oder anteiliger Vergabe werden Wünsche gesammelt und erst nach dem "
+        "Bestellfenster zugeteilt.",
+    )
+    zugeteilt_am = models.DateTimeField("Zugeteilt am", null=True, blank=True, editable=False)
+    reserved = models.PositiveIntegerField("Reserviert", default=0, editable=False)
     erstellt_am = models.DateTimeField(auto_now_add=True)
     aktualisiert_am = models.DateTimeField(auto_now=True)
 
@@ -47,6 +75,18 @@ class Offer(models.Model):
     def __str__(self):
         return self.titel
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_limit = instance.__dict__.get("limit_gesamt")
+        return instance
+
+    @property
+    def limit_raised(self) -> bool:
+        """True after saving a higher ``limit_gesamt`` than the one loaded from the database."""
+        stored = getattr(self, "_stored_limit", None)
+        return stored is not None and self.limit_gesamt > stored
+
     def clean(self):
         errors = {}
         if self.bestell_start and self.bestell_ende and self.bestell_start >= self.bestell_ende:
@@ -59,38 +99,102 @@ class Offer(models.Model):
             errors["limit_gesamt"] = "Das Bestandslimit muss größer als 0 sein."
         if self.limit_pro_user is not None and self.limit_pro_user == 0:
             errors["limit_pro_user"] = "Das Limit pro Nutzer muss mindestens 1 betragen."
+        if self.warteraum_rate is not None and self.warteraum_rate == 0:
+            errors["warteraum_rate"] = "Der Warteraum muss mindestens 1 Person pro Sekunde einlassen."
         if errors:
             raise ValidationError(errors)
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.titel)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # the reserved counter is maintained by Registration only, never write back a stale copy
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != "reserved"
+            ]
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse("offers:detail", kwargs={"slug": self.slug})
 
     def remaining_quantity(self, exclude_registration: Optional["Registration"] = None):
-        qs = self.registrations.all()
+        if "remaining" in self.__dict__ and not exclude_registration:
+            # annotated by OfferQuerySet.with_stock()
+            return self.remaining
+        reserved = self.reserved
         if exclude_registration and exclude_registration.pk:
-            qs = qs.exclude(pk=exclude_registration.pk)
-        reserved = qs.aggregate(total=Sum("menge")).get("total") or 0
+            reserved -= exclude_registration.stored_quantity
         return max(self.limit_gesamt - reserved, 0)
 
+    def adjust_reserved(self, delta: int):
+        if not delta:
+            return
+        Offer.objects.filter(pk=self.pk).update(reserved=F("reserved") + delta)
+        self.refresh_from_db(fields=["reserved"])
+
     def is_within_order_window(self):
         now = timezone.now()
         return self.bestell_start <= now <= self.bestell_ende
 
+    @property
+    def is_allocated_later(self) -> bool:
+        return self.vergabe != self.Vergabe.DIREKT
+
+    def uses_waiting_room(self):
+        return bool(self.warteraum_rate) and timezone.now() <= self.bestell_ende
+
     def next_reminder_dates(self):
         return ReminderWindow(self.abhol_von, self.abhol_bis)
 
 
+# no 0/O or 1/I, the code is read out loud and typed at the counter
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 8
+
+
+def generate_code() -> str:
+    return "".join(secrets.choice(CODE_ALPHABET) for _index in range(CODE_LENGTH))
+
+
+def normalize_code(value: str) -> str:
+    return "".join(value.split()).replace("-", "").upper()
+
+
+class RegistrationQuerySet(models.QuerySet):
+    def lookup(self, term: str):
+        """Check-in lookup by exact code or last name prefix, both resolved through an index."""
+        code = normalize_code(term)
+        if len(code) == CODE_LENGTH and set(code) <= set(CODE_ALPHABET):
+            return self.filter(code=code)
+        # SQLite's lower() only folds ASCII, the prefix has to be folded the same way to hit the index
+        prefix = "".join(char.lower() if char.isascii() else char for char in term.strip())
+        if not prefix:
+            return self.none()
+        # a range instead of LIKE, LIKE is case-insensitive in SQLite and cannot use the expression index
+        upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.alias(last_name_lower=Lower("user__last_name")).filter(
+            last_name_lower__gte=prefix, last_name_lower__lt=upper_bound
+        )
+
+    def mark_picked_up(self) -> int:
+        return self.filter(abgeholt_at__isnull=True).update(abgeholt_at=timezone.now())
+
+
 class Registration(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="offer_registrations")
     offer = models.ForeignKey(Offer, on_delete=models.PROTECT, related_name="registrations")
     menge = models.PositiveIntegerField("Menge")
     zustimmung_verbindlich_at = models.DateTimeField("Verbindlich bestätigt am")
     erstellt_at = models.DateTimeField(auto_now_add=True)
+    code = models.CharField("Abholcode", max_length=CODE_LENGTH, unique=True, default=generate_code, editable=False)
+    abgeholt_at = models.DateTimeField("Abgeholt am", null=True, blank=True)
+
+    objects = RegistrationQuerySet.as_manager()
+
+    # advisory check against the cached counter, the reservation service claims stock atomically instead
+    check_stock = True
+    # set by OfferAvailability, lets clean() skip the duplicate lookup
+    availability = None
 
     class Meta:
         ordering = ["offer", "user__last_name", "user__postal_code"]
@@ -104,37 +208,133 @@ class Registration(models.Model):
     def __str__(self):
         return f"{self.user.email} → {self.offer.titel} ({self.menge})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_menge = instance.__dict__.get("menge")
+        instance._stored_offer_id = instance.__dict__.get("offer_id")
+        return instance
+
+    @property
+    def stored_quantity(self) -> int:
+        """Quantity as currently counted in ``Offer.reserved``."""
+        return getattr(self, "_stored_menge", None) or 0
+
+    @property
+    def previous_offer_id(self) -> Optional[int]:
+        """Offer the stored quantity is counted on, when the registration was moved to another one."""
+        stored = getattr(self, "_stored_offer_id", None)
+        return stored if stored and stored != self.offer_id else None
+
     def clean(self):
         errors = {}
         if self.offer_id:
             if not self.offer.is_within_order_window():
                 errors["offer"] = "Dieses Angebot kann aktuell nicht mehr vorbestellt werden."
-            remaining = self.offer.remaining_quantity(exclude_registration=self if self.pk else None)
-            if self.menge > remaining:
-                errors["menge"] = f"Nur noch {remaining} Stück verfügbar."
+            if self.check_stock:
+                # after a move the stored quantity is counted on the previous offer, not on this one
+                own = self if self.pk and not self.previous_offer_id else None
+                remaining = self.offer.remaining_quantity(exclude_registration=own)
+                if self.menge > remaining:
+                    errors["menge"] = f"Nur noch {remaining} Stück verfügbar."
             if self.offer.limit_pro_user is not None and self.menge > self.offer.limit_pro_user:
                 errors["menge"] = f"Maximal {self.offer.limit_pro_user} Stück pro Person möglich."
         if self.user_id and self.offer_id:
-            exists = (
-                Registration.objects.filter(user=self.user, offer=self.offer)
-                .exclude(pk=self.pk)
-                .exists()
-            )
+            if self.availability is not None:
+                existing = self.availability.registration
+                exists = existing is not None and existing.pk != self.pk
+            else:
+                exists = (
+                    Registration.objects.filter(user=self.user, offer=self.offer)
+                    .exclude(pk=self.pk)
+                    .exists()
+                )
             if exists:
                 errors["user"] = "Du hast dieses Angebot bereits verbindlich bestellt."
         if errors:
             raise ValidationError(errors)
 
     @transaction.atomic
+    def save(self, *args, **kwargs):
+        previous_offer_id = self.previous_offer_id
+        if previous_offer_id:
+            from offers.reservations import claim_stock, release_stock
+
+            # moved in the admin: the old offer gets its stock back, the new one has to hold the full quantity
+            release_stock(previous_offer_id, self.stored_quantity)
+            if self.menge and not claim_stock(self.offer_id, self.menge):
+                raise ValidationError({"menge": f"Nur noch {self.offer.remaining_quantity()} Stück verfügbar."})
+            self.offer.refresh_from_db(fields=["reserved"])
+            delta = 0
+        else:
+            delta = (self.menge or 0) - self.stored_quantity
+        super().save(*args, **kwargs)
+        self.offer.adjust_reserved(delta)
+        self._stored_menge = self.menge
+        self._stored_offer_id = self.offer_id
+
     def confirm(self):
-        self.zustimmung_verbindlich_at = timezone.now()
-        self.full_clean()
-        self.save()
-        Consent.objects.create(
-            user=self.user,
-            offer=self.offer,
-            typ=Consent.Type.VERBINDLICH,
-            text_version=ConsentTexts.verbindlichkeit(self.offer)
+        from offers.reservations import reserve
+
+        reservation = reserve(self)
+        if not reservation.ok:
+            raise ValidationError({"menge": reservation.message})
+        return reservation
+
+
+class AllocationEntry(models.Model):
+    """Wish for an offer that is allocated after the order window, no stock is claimed until then."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="allocation_entries")
+    offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name="allocation_entries")
+    menge = models.PositiveIntegerField("Gewünschte Menge")
+    zustimmung_at = models.DateTimeField("Zustimmung am")
+    zugeteilt = models.PositiveIntegerField("Zugeteilt", null=True, blank=True, editable=False)
+    erstellt_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["offer", "erstellt_at"]
+        verbose_name = "Zuteilungswunsch"
+        verbose_name_plural = "Zuteilungswünsche"
+        constraints = [
+            UniqueConstraint(fields=["user", "offer"], name="unique_allocation_entry_per_offer"),
+            CheckConstraint(check=Q(menge__gte=1), name="allocation_entry_min_one"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} → {self.offer.titel} ({self.menge})"
+
+
+class WaitlistEntry(models.Model):
+    """Place on the waitlist of a sold-out offer, turned into a registration once stock is released."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="waitlist_entries")
+    offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name="waitlist_entries")
+    menge = models.PositiveIntegerField("Gewünschte Menge")
+    zustimmung_at = models.DateTimeField("Zustimmung am")
+    erstellt_at = models.DateTimeField(auto_now_add=True)
+    nachgerueckt = models.PositiveIntegerField("Nachgerückt mit", null=True, blank=True, editable=False)
+    nachgerueckt_am = models.DateTimeField("Nachgerückt am", null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ["offer", "erstellt_at", "pk"]
+        verbose_name = "Wartelisteneintrag"
+        verbose_name_plural = "Warteliste"
+        constraints = [
+            UniqueConstraint(fields=["user", "offer"], name="unique_waitlist_entry_per_offer"),
+            CheckConstraint(check=Q(menge__gte=1), name="waitlist_entry_min_one"),
+        ]
+        indexes = [models.Index(fields=["offer", "erstellt_at"], name="waitlist_offer_order_idx")]
+
+    def __str__(self):
+        return f"{self.user.email} → {self.offer.titel} ({self.menge})"
+
+    @property
+    def position(self) -> int:
+        return (
+            WaitlistEntry.objects.filter(offer_id=self.offer_id, nachgerueckt_am__isnull=True)
+            .filter(Q(erstellt_at__lt=self.erstellt_at) | Q(erstellt_at=self.erstellt_at, pk__lte=self.pk))
+            .count()
         )
 
 
@@ -182,6 +382,63 @@ class EmailLog(models.Model):
         return f"{self.empfaenger} ({self.get_typ_display()})"
 
 
+def export_upload_to(instance, filename):
+    # the random part keeps the files from being guessable, downloads go through the admin anyway
+    return f"exports/{timezone.now():%Y/%m}/{uuid.uuid4().hex[:12]}-{filename}"
+
+
+class ExportJob(models.Model):
+    class Format(models.TextChoices):
+        CSV = "csv", "CSV"
+        EXCEL = "xlsx", "Excel"
+        PDF = "pdf", "PDF"
+        MANIFEST = "sqlite3", "SQLite-Manifest"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Wartend"
+        RUNNING = "running", "Läuft"
+        DONE = "done", "Fertig"
+        FAILED = "failed", "Fehlgeschlagen"
+
+    offers = models.ManyToManyField(Offer, related_name="export_jobs", verbose_name="Angebote")
+    format = models.CharField("Format", max_length=8, choices=Format.choices)
+    gruppierung = models.CharField("Gruppierung", max_length=16, blank=True)
+    # set for a pickup list, one row per customer over all offers picked up in this range
+    abholung_von = models.DateField("Abholung ab", null=True, blank=True)
+    abholung_bis = models.DateField("Abholung bis", null=True, blank=True)
+    status = models.CharField("Status", max_length=16, choices=Status.choices, default=Status.PENDING)
+    datei = models.FileField("Datei", upload_to=export_upload_to, blank=True)
+    zeilen = models.PositiveIntegerField("Zeilen", default=0)
+    dauer = models.DurationField("Dauer", null=True, blank=True)
+    fehler = models.TextField("Fehler", blank=True)
+    erstellt_von = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="export_jobs"
+    )
+    erstellt_am = models.DateTimeField(auto_now_add=True)
+    fertig_am = models.DateTimeField("Fertig am", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Export"
+        verbose_name_plural = "Exporte"
+        ordering = ["-erstellt_am"]
+
+    def __str__(self):
+        return f"Export {self.pk} ({self.get_format_display()})"
+
+    @property
+    def filename(self) -> str:
+        if self.abholung_von:
+            return f"abholliste-{self.abholung_von:%Y-%m-%d}-{self.abholung_bis:%Y-%m-%d}.{self.format}"
+        offers = list(self.offers.all())
+        if len(offers) == 1:
+            name = f"vorbestellungen-{offers[0].slug}"
+        else:
+            name = f"vorbestellungen-{len(offers)}-angebote"
+        if self.gruppierung:
+            name = f"{name}-{self.gruppierung}"
+        return f"{name}.{self.format}"
+
+
 @dataclass
 class ReminderWindow:
     abhol_von: date
@@ -196,6 +453,58 @@ class ReminderWindow:
         return self.abhol_von
 
 
+@dataclass
+class OfferAvailability:
+    """Stock and per-user limits of one offer as seen by one user, loaded once per request."""
+
+    offer: Offer
+    registration: Optional[Registration] = None
+
+    @classmethod
+    def load(cls, user, slug: str) -> "OfferAvailability":
+        if user.is_authenticated:
+            registration = Registration.objects.select_related("offer").filter(user=user, offer__slug=slug).first()
+            if registration:
+                registration.user = user
+                return cls(registration.offer, registration)
+        return cls(Offer.objects.get(slug=slug))
+
+    def __post_init__(self):
+        if self.registration is not None:
+            self.registration.availability = self
+
+    def new_registration(self, user) -> Registration:
+        registration = Registration(user=user, offer=self.offer)
+        registration.availability = self
+        return registration
+
+    @property
+    def current_quantity(self) -> int:
+        return self.registration.stored_quantity if self.registration else 0
+
+    @property
+    def remaining(self) -> int:
+        return self.offer.remaining_quantity()
+
+    @property
+    def max_quantity(self) -> int:
+        # the own registration is already part of the reserved counter
+        max_quantity = self.offer.remaining_quantity(exclude_registration=self.registration)
+        if self.offer.limit_pro_user:
+            max_quantity = min(max_quantity, self.offer.limit_pro_user)
+        return max(max_quantity, self.current_quantity)
+
+    @property
+    def additional_quantity(self) -> int:
+        return self.max_quantity - self.current_quantity
+
+    @property
+    def per_user_headroom(self) -> Optional[int]:
+        if not self.offer.limit_pro_user:
+            return None
+        return max(self.offer.limit_pro_user - self.current_quantity, 0)
+
+
 class ConsentTexts:
     @staticmethod
     def verbindlichkeit(offer: Offer) -> str:
@@ -206,3 +515,24 @@ class ConsentTexts:
             "nicht möglich. Das Produkt ist im Zeitraum "
             f"{start} bis {end} abholbereit und wird von mir innerhalb dieses Fensters abgeholt."
         )
+
+    @staticmethod
+    def warteliste(offer: Offer) -> str:
+        start = offer.abhol_von.strftime("%d.%m.%Y")
+        end = offer.abhol_bis.strftime("%d.%m.%Y")
+        return (
+            "Ich bestätige, dass meine Bestellung verbindlich wird, sobald ich von der Warteliste nachrücke. "
+            "Ich erhalte dann höchstens meine gewünschte Menge, auch wenn nur weniger frei wird, und werde per "
+            f"Mail benachrichtigt. Das Produkt ist im Zeitraum {start} bis {end} abholbereit und wird von mir "
+            "innerhalb dieses Fensters abgeholt."
+        )
+
+    @staticmethod
+    def zuteilung(offer: Offer) -> str:
+        start = offer.abhol_von.strftime("%d.%m.%Y")
+        end = offer.abhol_bis.strftime("%d.%m.%Y")
+        return (
+            "Ich bestätige, dass die mir nach dem Bestellfenster zugeteilte Menge (höchstens meine gewünschte Menge) "
+            "verbindlich ist. Bis zum Ende des Bestellfensters kann ich meinen Wunsch ändern. Das Produkt ist im "
+            f"Zeitraum {start} bis {end} abholbereit und wird von mir innerhalb dieses Fensters abgeholt."
+        )
@@ -0,0 +1,115 @@
+"""Full-response cache of the public offer pages for anonymous visitors.
+
+Cache keys contain a stock version per scope (the list and every offer slug). Saving or deleting an offer or a
+registration bumps the versions after commit, so a cached page is never served after the data changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+PAGE_CACHE_TIMEOUT = 300
+# versions expire, the next one starts fresh and only costs a cache miss; drops those of slugs that never existed
+VERSION_TIMEOUT = 24 * 60 * 60
+LIST_SCOPE = "list"
+
+
+def _version_key(scope: str) -> str:
+    return f"offers:stock-version:{scope}"
+
+
+def _initial_version() -> int:
+    # a fresh start value, pages cached under an evicted version are never matched again
+    return time.time_ns() // 1000
+
+
+def stock_version(scope: str) -> int:
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+async def astock_versions(scopes: Iterable[str]) -> dict[str, int]:
+    """Current versions of several scopes at once, scopes that were never bumped are missing."""
+    keys = {_version_key(scope): scope for scope in scopes}
+    return {keys[key]: version for key, version in (await cache.aget_many(keys)).items()}
+
+
+def bump_stock_version(*scopes: str):
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), _initial_version(), timeout=VERSION_TIMEOUT)
+
+
+def seconds_until_next_change(offers: Iterable) -> float:
+    """Pages also change when an order window opens or closes, cached copies must not outlive that."""
+    now = timezone.now()
+    boundaries = [moment for offer in offers for moment in (offer.bestell_start, offer.bestell_ende) if moment > now]
+    if not boundaries:
+        return PAGE_CACHE_TIMEOUT
+    return min(PAGE_CACHE_TIMEOUT, (min(boundaries) - now).total_seconds())
+
+
+@dataclass
+class CachedPage:
+    content: bytes
+    content_type: str
+    etag: str
+
+    def response(self, request) -> HttpResponse:
+        if self.etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(self.content, content_type=self.content_type)
+        response["ETag"] = self.etag
+        response["Cache-Control"] = "public, max-age=0, must-revalidate"
+        # logged in visitors get a different page under the same url
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+
+class AnonymousPageCacheMixin:
+    """Serves anonymous GET requests from the shared cache, keyed by the stock version of the page."""
+
+    def page_cache_key(self) -> str:
+        raise NotImplementedError
+
+    def page_cache_offers(self) -> Iterable:
+        """Offers shown on the rendered page, their order windows limit the cache lifetime."""
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        # flash messages are rendered into the page, those responses are not shared
+        if request.method != "GET" or request.user.is_authenticated or len(get_messages(request)):
+            return super().dispatch(request, *args, **kwargs)
+        key = self.page_cache_key()
+        page = cache.get(key)
+        if page is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+            timeout = seconds_until_next_change(self.page_cache_offers())
+            if response.status_code != 200 or timeout <= 0:
+                return response
+            page = CachedPage(
+                content=response.content,
+                content_type=response["Content-Type"],
+                etag=f'"{hashlib.md5(response.content, usedforsecurity=False).hexdigest()}"',
+            )
+            cache.set(key, page, timeout)
+        return page.response(request)
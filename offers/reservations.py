@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from offers.models import Consent, ConsentTexts, Offer, Registration
+from offers.pagecache import LIST_SCOPE, bump_stock_version
+from offers.services import clear_export_cache
+from offers.tasks import send_pending_confirmations
+from utils.db import retry_on_lock
+
+
+def claim_stock(offer_id: int, quantity: int) -> bool:
+    """Reserve ``quantity`` pieces with a single guarded UPDATE. Returns False if not enough is left."""
+    updated = Offer.objects.filter(pk=offer_id, reserved__lte=F("limit_gesamt") - quantity).update(
+        reserved=F("reserved") + quantity
+    )
+    return updated == 1
+
+
+def release_stock(offer_id: int, quantity: int):
+    Offer.objects.filter(pk=offer_id).update(reserved=F("reserved") - quantity)
+
+
+class StockExhausted(Exception):
+    """Less stock was left than the caller read before, raised to roll back its transaction."""
+
+
+def register_many(offer: Offer, registrations: list[Registration], **offer_updates) -> int:
+    """Creates the registrations of one offer at once and confirms them through the mail queue.
+
+    Must run inside the transaction that decided the quantities. The whole quantity is claimed with one guarded
+    UPDATE like ``claim_stock()``, if another writer took stock since the caller read it ``StockExhausted`` is
+    raised and nothing is created. ``bulk_create`` skips ``Registration.save()`` and its signals, so the caches are
+    cleared here.
+    """
+    quantity = sum(registration.menge for registration in registrations)
+    offers = Offer.objects.filter(pk=offer.pk)
+    if quantity:
+        offers = offers.filter(reserved__lte=F("limit_gesamt") - quantity)
+    if not offers.update(reserved=F("reserved") + quantity, **offer_updates):
+        raise StockExhausted(f"Für {offer.titel} sind keine {quantity} Stück mehr frei.")
+    Registration.objects.bulk_create(registrations, batch_size=500)
+    if registrations:
+        send_pending_confirmations.enqueue(offer.pk)
+    transaction.on_commit(lambda: bump_stock_version(LIST_SCOPE, offer.slug), robust=True)
+    transaction.on_commit(lambda: clear_export_cache(offer.pk))
+    return quantity
+
+
+@dataclass
+class Reservation:
+    RESERVED = "reserved"
+    PARTIAL = "partial"
+    SOLD_OUT = "sold_out"
+
+    status: str
+    requested: int
+    available: int
+    registration: Optional[Registration] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status != self.SOLD_OUT
+
+    @property
+    def message(self) -> str:
+        if self.status == self.RESERVED:
+            return "Deine Reservierung wurde gespeichert."
+        if self.status == self.PARTIAL:
+            return f"Es waren nur noch {self.registration.menge} Stück verfügbar, diese wurden für dich reserviert."
+        if self.available <= 0:
+            return "Dieses Angebot ist leider ausverkauft."
+        return f"Nur noch {self.available} Stück verfügbar."
+
+
+@retry_on_lock
+def reserve(registration: Registration, allow_partial: bool = False) -> Reservation:
+    """Create or raise a registration without overselling.
+
+    Validation runs outside of any lock. The stock itself is claimed with a conditional UPDATE on the
+    offer row, so the write transaction only spans the claim, the registration row and the consent.
+    With ``allow_partial`` whatever is left gets reserved instead of failing the whole request.
+    A busy write lock fails ``BEGIN`` before anything was changed, so the whole call is retried then.
+    """
+    registration.zustimmung_verbindlich_at = timezone.now()
+    registration.check_stock = False
+    # user and offer were loaded together with the availability snapshot, the unique pair is
+    # still guarded by the database constraint below
+    registration.full_clean(exclude=["user", "offer"] if registration.availability else None)
+
+    offer = registration.offer
+    requested = registration.menge
+    stored = registration.stored_quantity
+    adding = registration._state.adding
+    delta = requested - stored
+    try:
+        with transaction.atomic():
+            if delta > 0 and not claim_stock(offer.pk, delta):
+                offer.refresh_from_db(fields=["reserved"])
+                available = offer.remaining_quantity()
+                if not allow_partial or available <= 0 or not claim_stock(offer.pk, available):
+                    return Reservation(Reservation.SOLD_OUT, requested, available)
+                delta = available
+                registration.menge = stored + available
+            elif delta < 0:
+                release_stock(offer.pk, -delta)
+            # the claim above already counted the new quantity
+            registration._stored_menge = registration.menge
+            registration.save()
+            Consent.objects.create(
+                user=registration.user,
+                offer=offer,
+                typ=Consent.Type.VERBINDLICH,
+                text_version=ConsentTexts.verbindlichkeit(offer),
+            )
+    except BaseException as exc:
+        # rolled back, a retry after "database is locked" has to claim the stock again
+        registration._stored_menge, registration.menge = stored, requested
+        if adding:
+            registration.pk, registration._state.adding = None, True
+        if isinstance(exc, IntegrityError):
+            # a concurrent request inserted the same user/offer pair, the claim was rolled back with it
+            raise ValidationError({"user": "Du hast dieses Angebot bereits verbindlich bestellt."})
+        raise
+
+    offer.reserved += delta
+    status = Reservation.RESERVED if registration.menge == requested else Reservation.PARTIAL
+    return Reservation(status, requested, offer.remaining_quantity(), registration)
@@ -0,0 +1,14 @@
+from rest_framework import serializers
+
+from offers.models import Registration
+
+
+class CheckInSerializer(serializers.ModelSerializer):
+    angebot = serializers.CharField(source="offer.titel")
+    name = serializers.CharField(source="user.get_full_name")
+    plz = serializers.CharField(source="user.postal_code")
+
+    class Meta:
+        model = Registration
+        fields = ("code", "angebot", "menge", "name", "plz", "abgeholt_at")
+        read_only_fields = fields
@@ -1,35 +1,143 @@
 from __future__ import annotations
 
 import csv
-from io import BytesIO, StringIO
-from typing import Iterable
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import date
+from email.mime.image import MIMEImage
+from functools import lru_cache
+from itertools import groupby, islice
+from operator import attrgetter
+from pathlib import Path
+from typing import BinaryIO, Iterable
+from xml.sax.saxutils import escape
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Count, Exists, F, Max, OuterRef, Sum
+from django.db.models.functions import Lower
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.template import Context, Engine, Node, Template, engines
+from django.template.base import TokenType
+from django.template.loader_tags import ExtendsNode, IncludeNode
 from django.utils import timezone
+from django.utils.http import parse_etags
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from PIL import Image, ImageDraw
+from reportlab.graphics.barcode.qrencoder import QRCode, QRErrorCorrectLevel
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
 
 from offers.models import EmailLog, Registration
+from utils.routers import read_only
 
+logger = logging.getLogger(__name__)
 
-def _build_message(subject: str, template_prefix: str, to: list[str], context: dict) -> EmailMultiAlternatives:
-    context = {**context, "subject": subject}
-    html_body = render_to_string(f"email/{template_prefix}.html", context)
-    text_body = render_to_string(f"email/{template_prefix}.txt", context)
-    message = EmailMultiAlternatives(
-        subject=subject,
-        body=text_body,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=to,
+
+RECIPIENT_VARIABLES = re.compile(r"\b(user|registration)\b")
+
+
+@lru_cache(maxsize=None)
+def email_engine() -> Engine:
+    """Template engine for mails with a cached loader, so mail templates are only compiled once per process."""
+    default = engines["django"].engine
+    return Engine(
+        dirs=default.dirs,
+        loaders=[
+            (
+                "django.template.loaders.cached.Loader",
+                ["django.template.loaders.filesystem.Loader", "django.template.loaders.app_directories.Loader"],
+            )
+        ],
+        libraries=default.libraries,
+        builtins=default.builtins,
+        string_if_invalid=default.string_if_invalid,
     )
-    message.attach_alternative(html_body, "text/html")
-    return message
+
+
+def _constant(filter_expression) -> str | None:
+    if filter_expression is None or filter_expression.filters:
+        return None
+    # quoted strings are resolved to plain str at parse time
+    return filter_expression.var if isinstance(filter_expression.var, str) else None
+
+
+def uses_recipient(template: Template) -> bool:
+    """Whether a template (including parents and includes) references ``user`` or ``registration``."""
+    for node in template.nodelist.get_nodes_by_type(Node):
+        token = getattr(node, "token", None)
+        if token is not None and token.token_type != TokenType.TEXT and RECIPIENT_VARIABLES.search(token.contents):
+            return True
+        related = None
+        if isinstance(node, ExtendsNode):
+            related = _constant(node.parent_name)
+        elif isinstance(node, IncludeNode):
+            related = _constant(node.template)
+        else:
+            continue
+        # dynamic parents/includes cannot be inspected, assume they are personalized
+        if related is None or uses_recipient(email_engine().get_template(related)):
+            return True
+    return False
+
+
+class EmailRenderer:
+    """Renders one kind of mail for many recipients of the same offer.
+
+    Templates are compiled once and the offer context is built once per batch. If the templates do not
+    reference the recipient at all, the bodies are rendered a single time and reused for everyone.
+    """
+
+    def __init__(self, template_prefix: str, subject: str, offer):
+        engine = email_engine()
+        self.subject = subject
+        self.html_template = engine.get_template(f"email/{template_prefix}.html")
+        self.text_template = engine.get_template(f"email/{template_prefix}.txt")
+        self.offer_context = {
+            "offer": offer,
+            "subject": subject,
+            "abhol_von": offer.abhol_von.strftime("%d.%m.%Y"),
+            "abhol_bis": offer.abhol_bis.strftime("%d.%m.%Y"),
+        }
+        self.personalized = uses_recipient(self.html_template) or uses_recipient(self.text_template)
+        self._bodies = None
+
+    def render(self, registration: Registration | None = None) -> tuple[str, str]:
+        if not self.personalized and self._bodies is not None:
+            return self._bodies
+        context = {**self.offer_context}
+        if registration is not None:
+            context.update({"registration": registration, "user": registration.user})
+        bodies = (self.html_template.render(Context(context)), self.text_template.render(Context(context)))
+        if not self.personalized:
+            self._bodies = bodies
+        return bodies
+
+    def build(self, registration: Registration) -> EmailMultiAlternatives:
+        html_body, text_body = self.render(registration)
+        message = EmailMultiAlternatives(
+            subject=self.subject,
+            body=text_body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[registration.user.email],
+        )
+        message.attach_alternative(html_body, "text/html")
+        return message
 
 
 def log_email(registration: Registration | None, offer, recipient: str, typ: str, message_id: str = "gesendet"):
@@ -42,45 +150,225 @@ def log_email(registration: Registration | None, offer, recipient: str, typ: str
     )
 
 
-def send_registration_confirmation(registration: Registration):
-    offer = registration.offer
-    user = registration.user
-    context = {
-        "registration": registration,
-        "offer": offer,
-        "user": user,
-        "abhol_von": offer.abhol_von.strftime("%d.%m.%Y"),
-        "abhol_bis": offer.abhol_bis.strftime("%d.%m.%Y"),
-    }
-    subject = f"Bestätigung deiner Vorbestellung: {offer.titel}"
-    message = _build_message(subject, "order_confirmation", [user.email], context)
+def confirmation_renderer(offer) -> EmailRenderer:
+    return EmailRenderer("order_confirmation", f"Bestätigung deiner Vorbestellung: {offer.titel}", offer)
+
+
+def qr_png(data: str, scale: int = 8, border: int = 4) -> bytes:
+    """QR code as PNG, encoded with reportlab's QR encoder and drawn with Pillow."""
+    qr = QRCode(None, QRErrorCorrectLevel.M)
+    qr.addData(data)
+    qr.make()
+    modules = qr.getModuleCount()
+    size = (modules + 2 * border) * scale
+    image = Image.new("1", (size, size), 1)
+    draw = ImageDraw.Draw(image)
+    for row in range(modules):
+        for column in range(modules):
+            if qr.isDark(row, column):
+                x, y = (column + border) * scale, (row + border) * scale
+                draw.rectangle([x, y, x + scale - 1, y + scale - 1], fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def attach_pickup_code(message: EmailMultiAlternatives, registration: Registration):
+    """Inline QR code of the pickup code, referenced as ``cid:abholcode`` in the mail template."""
+    image = MIMEImage(qr_png(registration.code), "png")
+    image.add_header("Content-ID", "<abholcode>")
+    image.add_header("Content-Disposition", "inline", filename="abholcode.png")
+    message.attach(image)
+    message.mixed_subtype = "related"
+
+
+def send_registration_confirmation(registration: Registration, renderer: EmailRenderer | None = None):
+    renderer = renderer or confirmation_renderer(registration.offer)
+    message = renderer.build(registration)
+    attach_pickup_code(message, registration)
     message.send()
-    log_email(registration, offer, user.email, EmailLog.Typ.CONFIRM)
+    log_email(registration, registration.offer, registration.user.email, EmailLog.Typ.CONFIRM)
+
+
+REMINDER_SUBJECTS = {
+    EmailLog.Typ.REMINDER_PRE: "Erinnerung: Deine Abholung startet bald ({titel})",
+    EmailLog.Typ.REMINDER_START: "Heute startet die Abholung ({titel})",
+}
+REMINDER_TEMPLATES = {
+    EmailLog.Typ.REMINDER_PRE: "reminder_pre",
+    EmailLog.Typ.REMINDER_START: "reminder_start",
+}
+
+
+def reminder_renderer(offer, reminder_type: str) -> EmailRenderer:
+    subject = REMINDER_SUBJECTS.get(reminder_type, "Information zu {titel}").format(titel=offer.titel)
+    template_prefix = REMINDER_TEMPLATES.get(reminder_type, "reminder_pre")
+    return EmailRenderer(template_prefix, subject, offer)
+
+
+def build_reminder_message(
+    registration: Registration, reminder_type: str, renderer: EmailRenderer | None = None
+) -> EmailMultiAlternatives:
+    renderer = renderer or reminder_renderer(registration.offer, reminder_type)
+    return renderer.build(registration)
 
 
 def send_reminder_email(registration: Registration, reminder_type: str):
-    offer = registration.offer
-    user = registration.user
-    context = {
-        "registration": registration,
-        "offer": offer,
-        "user": user,
-        "abhol_von": offer.abhol_von.strftime("%d.%m.%Y"),
-        "abhol_bis": offer.abhol_bis.strftime("%d.%m.%Y"),
-    }
-    subjects = {
-        EmailLog.Typ.REMINDER_PRE: f"Erinnerung: Deine Abholung startet bald ({offer.titel})",
-        EmailLog.Typ.REMINDER_START: f"Heute startet die Abholung ({offer.titel})",
-    }
-    template_map = {
-        EmailLog.Typ.REMINDER_PRE: "reminder_pre",
-        EmailLog.Typ.REMINDER_START: "reminder_start",
-    }
-    subject = subjects.get(reminder_type, f"Information zu {offer.titel}")
-    template_prefix = template_map.get(reminder_type, "reminder_pre")
-    message = _build_message(subject, template_prefix, [user.email], context)
+    message = build_reminder_message(registration, reminder_type)
     message.send()
-    log_email(registration, offer, user.email, reminder_type)
+    log_email(registration, registration.offer, registration.user.email, reminder_type)
+
+
+def pending_reminders(reminder_type: str, abhol_von: date):
+    """Registrations of offers starting pickup on ``abhol_von`` that did not get this reminder yet."""
+    already_sent = EmailLog.objects.filter(registration=OuterRef("pk"), typ=reminder_type)
+    return (
+        Registration.objects.filter(offer__abhol_von=abhol_von)
+        .exclude(Exists(already_sent))
+        .select_related("offer", "user")
+        .order_by("pk")
+    )
+
+
+def chunked(iterable: Iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class RateLimiter:
+    """Spaces calls across all threads so that at most ``rate`` happen per second."""
+
+    def __init__(self, rate: float | None):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+@dataclass
+class DispatchSummary:
+    sent: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    def percentile(self, percent: int) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.duration if self.duration else 0.0
+
+
+class ReminderDispatcher:
+    """Renders and sends reminders on a bounded thread pool.
+
+    Every worker keeps its own mail connection, ``rate`` caps the messages per second over all workers.
+    Only the calling thread touches EmailLog, one bulk INSERT per chunk of finished messages.
+    """
+
+    def __init__(self, reminder_type: str, workers: int = 1, rate: float | None = None, dry_run: bool = False):
+        self.reminder_type = reminder_type
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate)
+        self.dry_run = dry_run
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._renderers = {}
+        self._renderers_lock = threading.Lock()
+
+    def _renderer(self, offer) -> EmailRenderer:
+        with self._renderers_lock:
+            renderer = self._renderers.get(offer.pk)
+            if renderer is None:
+                renderer = self._renderers[offer.pk] = reminder_renderer(offer, self.reminder_type)
+            return renderer
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _discard_connection(self):
+        """Closes the connection of this worker after a failed send, the next message opens a fresh one."""
+        connection = self._local.connection
+        self._local.connection = None
+        with self._connections_lock:
+            self._connections.remove(connection)
+        with suppress(Exception):
+            connection.close()
+
+    def _send(self, registration: Registration) -> float:
+        self.limiter.wait()
+        started = time.monotonic()
+        message = build_reminder_message(registration, self.reminder_type, self._renderer(registration.offer))
+        if not self.dry_run:
+            connection = self._connection()
+            try:
+                connection.send_messages([message])
+            except Exception:
+                self._discard_connection()
+                raise
+        return time.monotonic() - started
+
+    def _log(self, registrations: list[Registration]):
+        if self.dry_run or not registrations:
+            return
+        EmailLog.objects.bulk_create(
+            [
+                EmailLog(
+                    registration=registration,
+                    offer=registration.offer,
+                    empfaenger=registration.user.email,
+                    typ=self.reminder_type,
+                    nachricht_id="gesendet",
+                )
+                for registration in registrations
+            ]
+        )
+
+    def dispatch(self, registrations: Iterable[Registration], chunk_size: int = 200) -> DispatchSummary:
+        summary = DispatchSummary()
+        started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for chunk in chunked(registrations, chunk_size):
+                    futures = {pool.submit(self._send, registration): registration for registration in chunk}
+                    delivered = []
+                    for future in as_completed(futures):
+                        try:
+                            summary.latencies.append(future.result())
+                        except Exception:
+                            logger.exception("Erinnerung an %s fehlgeschlagen", futures[future].user.email)
+                            summary.failed += 1
+                        else:
+                            delivered.append(futures[future])
+                    self._log(delivered)
+                    summary.sent += len(delivered)
+        finally:
+            for connection in self._connections:
+                connection.close()
+        summary.duration = time.monotonic() - started
+        return summary
 
 
 HEADER = [
@@ -112,85 +400,498 @@ def registration_rows(registrations: Iterable[Registration]):
         ]
 
 
+# columns read by registration_rows, everything else stays in the database
+EXPORT_FIELDS = (
+    "menge",
+    "offer__titel",
+    "user__last_name",
+    "user__first_name",
+    "user__street",
+    "user__house_number",
+    "user__postal_code",
+    "user__city",
+)
+
+
 def ordered_registrations(queryset):
-    return queryset.select_related("user", "offer").order_by("user__last_name", "user__postal_code")
+    return (
+        queryset.select_related("user", "offer").only(*EXPORT_FIELDS).order_by("user__last_name", "user__postal_code")
+    )
 
 
-def export_registrations_csv(offer):
-    queryset = ordered_registrations(offer.registrations.all())
-    buffer = StringIO()
-    writer = csv.writer(buffer, delimiter=";")
-    writer.writerow(["Angebot", offer.titel])
-    writer.writerow([
-        "Abholfenster",
-        f"{offer.abhol_von.strftime('%d.%m.%Y')} – {offer.abhol_bis.strftime('%d.%m.%Y')}",
-    ])
-    writer.writerow([])
-    writer.writerow(HEADER)
-    for row in registration_rows(queryset):
-        writer.writerow(row)
-    response = HttpResponse(buffer.getvalue(), content_type="text/csv")
-    response["Content-Disposition"] = f"attachment; filename=vorbestellungen-{offer.slug}.csv"
-    return response
+def pickup_window(offer) -> str:
+    return f"{offer.abhol_von.strftime('%d.%m.%Y')} – {offer.abhol_bis.strftime('%d.%m.%Y')}"
 
 
-def export_registrations_excel(offer):
+def offer_rows(offer, ordering: Iterable[str] | None = None, chunk_size: int = 2000):
     queryset = ordered_registrations(offer.registrations.all())
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "Vorbestellungen"
-    sheet.append(["Angebot", offer.titel])
-    sheet.append([
-        "Abholfenster",
-        f"{offer.abhol_von.strftime('%d.%m.%Y')} – {offer.abhol_bis.strftime('%d.%m.%Y')}",
-    ])
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    return registration_rows(queryset.iterator(chunk_size=chunk_size))
+
+
+class RowCounter:
+    """Passes rows through and counts them, the writers consume the rows lazily."""
+
+    def __init__(self, rows: Iterable[list]):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+def csv_preamble(offer) -> list[list]:
+    return [["Angebot", offer.titel], ["Abholfenster", pickup_window(offer)], [], HEADER]
+
+
+class Echo:
+    """File-like object whose write() returns the value, lets csv.writer produce lines for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(offer, chunk_size: int = 2000):
+    """The lines of ``write_registrations_csv`` for one offer, produced while the rows are read."""
+    writer = csv.writer(Echo(), delimiter=";")
+    for row in csv_preamble(offer):
+        yield writer.writerow(row)
+    for row in offer_rows(offer, chunk_size=chunk_size):
+        yield writer.writerow(row)
+
+
+def write_registrations_csv(offers: Iterable, target, group_by: str | None = None) -> int:
+    """Writes one block per offer into the binary ``target``, separated by an empty line."""
+    text = io.TextIOWrapper(target, encoding="utf-8", newline="")
+    writer = csv.writer(text, delimiter=";")
+    count = 0
+    for position, offer in enumerate(offers):
+        if position:
+            writer.writerow([])
+        writer.writerows(csv_preamble(offer))
+        rows = RowCounter(offer_rows(offer))
+        writer.writerows(rows)
+        count += rows.count
+    text.flush()
+    text.detach()
+    return count
+
+
+EXCEL_COLUMN_WIDTHS = [6, 32, 8, 20, 18, 26, 8, 8, 20]
+EXCEL_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXCEL_SHEET_TITLE = re.compile(r"[\\*?:/\[\]]")
+
+
+def append_registrations_sheet(
+    workbook: Workbook,
+    sheet_title: str,
+    preamble: list[tuple[str, str]],
+    rows: Iterable[list],
+    header: list[str] = HEADER,
+    widths: list[int] = EXCEL_COLUMN_WIDTHS,
+) -> int:
+    sheet = workbook.create_sheet(sheet_title)
+    for index, width in enumerate(widths, start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+    sheet.freeze_panes = f"A{len(preamble) + 3}"
+
+    def bold(value):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True)
+        return cell
+
+    for label, value in preamble:
+        sheet.append([bold(label), value])
     sheet.append([])
-    sheet.append(HEADER)
-    for row in registration_rows(queryset):
+    sheet.append([bold(column) for column in header])
+    count = 0
+    for row in rows:
         sheet.append(row)
-    output = BytesIO()
-    workbook.save(output)
-    response = HttpResponse(
-        output.getvalue(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = f"attachment; filename=vorbestellungen-{offer.slug}.xlsx"
-    return response
+        count += 1
+    return count
 
 
-def export_registrations_pdf(offer):
-    queryset = ordered_registrations(offer.registrations.all())
-    output = BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+def offer_preamble(title: str, window: str) -> list[tuple[str, str]]:
+    return [("Angebot", title), ("Abholfenster", window)]
+
+
+def write_registrations_workbook(title: str, window: str, rows: Iterable[list], target) -> int:
+    """Writes the pick list with openpyxl's write-only mode, rows are flushed instead of kept as cells."""
+    workbook = Workbook(write_only=True)
+    count = append_registrations_sheet(workbook, "Vorbestellungen", offer_preamble(title, window), rows)
+    workbook.save(target)
+    return count
+
+
+def write_offers_workbook(offers: Iterable, target, group_by: str | None = None) -> int:
+    """One sheet per offer, named after the offer (Excel allows 31 characters, openpyxl numbers duplicates)."""
+    workbook = Workbook(write_only=True)
+    count = 0
+    for offer in offers:
+        sheet_title = EXCEL_SHEET_TITLE.sub("-", offer.titel)[:28]
+        preamble = offer_preamble(offer.titel, pickup_window(offer))
+        count += append_registrations_sheet(workbook, sheet_title, preamble, offer_rows(offer))
+    workbook.save(target)
+    return count
+
+
+PDF_ROWS_PER_TABLE = 35
+# fixed widths keep the columns aligned across the page-sized tables (A4 minus margins)
+PDF_COLUMN_WIDTHS = [26, 110, 36, 72, 62, 80, 34, 36, 67]
+# product, names, street and city wrap inside their column instead of running into the next one
+PDF_TEXT_COLUMNS = (1, 3, 4, 5, 8)
+PDF_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f0f0f0")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -2), [colors.white, colors.HexColor("#fafafa")]),
+        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+        ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#f0f0f0")),
+    ]
+)
+
+
+def initial(name: str) -> str:
+    # folds the case like SQLite's lower() in PDF_ORDERING, only ASCII, so every group is one run of rows
+    letter = name[:1] or "#"
+    return letter.upper() if letter.isascii() else letter
+
+
+PDF_GROUPS = {
+    "nachname": ("Nachname", lambda row: initial(row[3])),
+    "plz": ("PLZ", lambda row: row[7] or "ohne PLZ"),
+}
+PDF_ORDERING = {
+    "nachname": (Lower("user__last_name"), "user__postal_code"),
+    "plz": ("user__postal_code", "user__last_name"),
+}
+
+
+def pick_list_story(offer, rows: Iterable[list], group_by: str | None = None) -> list:
+    """Page-sized tables with running totals, optionally starting a new page per group."""
     styles = getSampleStyleSheet()
+    cell_style = styles["BodyText"].clone("PickListCell", fontSize=8, leading=10)
+    story = [
+        Paragraph(escape(offer.titel), styles["Title"]),
+        Spacer(1, 12),
+        Paragraph(f"Abholfenster: {pickup_window(offer)}", styles["Normal"]),
+        Spacer(1, 12),
+    ]
+    group_label, group_key = PDF_GROUPS.get(group_by, (None, None))
+    running_total = 0
+    current_group = None
+    chunk = []
+
+    def flush():
+        if chunk:
+            total_row = ["", "Summe bisher", running_total] + [""] * (len(HEADER) - 3)
+            table = Table([HEADER, *chunk, total_row], colWidths=PDF_COLUMN_WIDTHS, style=PDF_TABLE_STYLE, repeatRows=1)
+            story.append(table)
+            story.append(Spacer(1, 12))
+            chunk.clear()
+
+    for row in rows:
+        if group_key and group_key(row) != current_group:
+            flush()
+            if current_group is not None:
+                story.append(PageBreak())
+            current_group = group_key(row)
+            story.append(Paragraph(escape(f"{group_label}: {current_group}"), styles["Heading2"]))
+        for index in PDF_TEXT_COLUMNS:
+            row[index] = Paragraph(escape(str(row[index])), cell_style)
+        chunk.append(row)
+        running_total += row[2]
+        if len(chunk) >= PDF_ROWS_PER_TABLE:
+            flush()
+    flush()
+    story.append(Paragraph(f"Gesamtmenge: {running_total}", styles["Heading3"]))
+    return story
+
+
+def pdf_document(target) -> SimpleDocTemplate:
+    return SimpleDocTemplate(target, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+
+
+def write_registrations_pdf(offers: Iterable, target, group_by: str | None = None) -> int:
+    """One pick list per offer, each starting on a new page."""
     story = []
+    counters = []
+    for offer in offers:
+        if story:
+            story.append(PageBreak())
+        rows = RowCounter(offer_rows(offer, PDF_ORDERING.get(group_by)))
+        counters.append(rows)
+        story.extend(pick_list_story(offer, rows, group_by))
+    pdf_document(target).build(story)
+    return sum(rows.count for rows in counters)
 
-    title = Paragraph(f"{offer.titel}", styles["Title"])
-    window = Paragraph(
-        f"Abholfenster: {offer.abhol_von.strftime('%d.%m.%Y')} – {offer.abhol_bis.strftime('%d.%m.%Y')}",
-        styles["Normal"],
-    )
-    story.extend([title, Spacer(1, 12), window, Spacer(1, 12)])
 
-    data = [HEADER]
-    data.extend(registration_rows(queryset))
+EXPORT_WRITERS = {
+    "csv": write_registrations_csv,
+    "xlsx": write_offers_workbook,
+    "pdf": write_registrations_pdf,
+}
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": EXCEL_CONTENT_TYPE,
+    "pdf": "application/pdf",
+}
 
-    table = Table(data, repeatRows=1)
-    table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f0f0f0")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#fafafa")]),
-            ]
+
+def export_version(offer) -> str:
+    """Fingerprint of the registrations of an offer and of their customers.
+
+    Changes with every new, changed or deleted order and whenever one of the customers edits the name or address
+    printed in the export.
+    """
+    state = offer.registrations.aggregate(
+        count=Count("pk"),
+        latest=Max("erstellt_at"),
+        confirmed=Max("zustimmung_verbindlich_at"),
+        checksum=Sum(F("pk") * F("menge")),
+        customers=Max("user__modified"),
+    )
+    key = "|".join(
+        str(value)
+        for value in (
+            offer.aktualisiert_am,
+            state["count"],
+            state["latest"],
+            state["confirmed"],
+            state["checksum"],
+            state["customers"],
         )
     )
-    story.append(table)
+    return hashlib.sha256(key.encode()).hexdigest()[:20]
+
+
+def export_cache_dir(offer_id: int) -> Path:
+    return Path(settings.EXPORT_CACHE_DIR) / str(offer_id)
+
 
-    doc.build(story)
-    response = HttpResponse(output.getvalue(), content_type="application/pdf")
-    response["Content-Disposition"] = f"attachment; filename=vorbestellungen-{offer.slug}.pdf"
+def clear_export_cache(offer_id: int):
+    shutil.rmtree(export_cache_dir(offer_id), ignore_errors=True)
+
+
+def export_spool():
+    # outside the directories of the offers, clearing a cache must not pull the file away from a running render
+    directory = Path(settings.EXPORT_CACHE_DIR) / "tmp"
+    directory.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False)
+
+
+def keep_export(spool_name: str, path: Path):
+    """Renames a finished spool to its cache entry, or drops it when the cache was cleared in that very moment."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(spool_name, path)
+    except FileNotFoundError:
+        with suppress(FileNotFoundError):
+            os.unlink(spool_name)
+
+
+def open_cached(path: Path) -> BinaryIO | None:
+    try:
+        return path.open("rb")
+    except FileNotFoundError:
+        return None
+
+
+def export_path(offer, format: str, version: str, group_by: str | None = None) -> Path:
+    name = f"{format}-{group_by}" if group_by else format
+    return export_cache_dir(offer.pk) / f"{name}-{version}.{format}"
+
+
+def cached_export(offer, format: str, version: str, group_by: str | None = None) -> BinaryIO:
+    """Opens the export file for this version, rendering it only if it is not on disk yet."""
+    path = export_path(offer, format, version, group_by)
+    handle = open_cached(path)
+    if handle is not None:
+        return handle
+    # written aside and renamed, a concurrent download never sees a half written file
+    spool = export_spool()
+    try:
+        with spool:
+            EXPORT_WRITERS[format]([offer], spool, group_by)
+        # opened before the rename, this download gets the file even if it never becomes the cache entry
+        handle = open(spool.name, "rb")
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(spool.name)
+        raise
+    keep_export(spool.name, path)
+    return handle
+
+
+def streamed_csv(offer, path: Path):
+    """Sends the CSV while it is read and keeps a copy, which becomes the cache entry once the last line is out.
+
+    Every new order clears the cache, so during a drop a large CSV is rendered again and again. Streamed, its first
+    bytes go out right away instead of after the whole file, and no request runs into the worker timeout.
+    """
+    spool = export_spool()
+    try:
+        with read_only(), spool:
+            for line in csv_lines(offer):
+                data = line.encode()
+                spool.write(data)
+                yield data
+    except BaseException:
+        # also an aborted download, a half written file must never become the cache entry
+        with suppress(FileNotFoundError):
+            os.unlink(spool.name)
+        raise
+    keep_export(spool.name, path)
+
+
+def export_response(offer, format: str, group_by: str | None = None, request=None):
+    # fingerprint and file from one snapshot of the read-only connection, a running drop keeps writing meanwhile
+    with read_only(snapshot=True):
+        version = export_version(offer)
+        etag = f'"{offer.pk}-{format}-{group_by or "alle"}-{version}"'
+        not_modified = request is not None and etag in parse_etags(request.headers.get("If-None-Match", ""))
+        path = export_path(offer, format, version, group_by)
+        handle = None
+        if not not_modified:
+            # Excel and PDF are only complete at the end, they are rendered to disk before the first byte is sent
+            handle = open_cached(path) if format == "csv" else cached_export(offer, format, version, group_by)
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        if handle is not None:
+            response = FileResponse(handle, content_type=EXPORT_CONTENT_TYPES[format])
+        else:
+            response = StreamingHttpResponse(streamed_csv(offer, path), content_type=EXPORT_CONTENT_TYPES[format])
+        suffix = f"-{group_by}" if group_by else ""
+        response["Content-Disposition"] = f"attachment; filename=vorbestellungen-{offer.slug}{suffix}.{format}"
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
     return response
+
+
+def export_registrations_csv(offer, request=None):
+    return export_response(offer, "csv", request=request)
+
+
+def export_registrations_excel(offer, request=None):
+    return export_response(offer, "xlsx", request=request)
+
+
+def export_registrations_pdf(offer, group_by: str | None = None, request=None):
+    return export_response(offer, "pdf", group_by, request=request)
+
+
+# one row per customer over all offers of a pickup window
+PICKUP_HEADER = [
+    "Nr.",
+    "Nachname",
+    "Vorname",
+    "Straße",
+    "Hausnr.",
+    "PLZ",
+    "Stadt",
+    "Artikel",
+    "Menge",
+]
+PICKUP_EXCEL_COLUMN_WIDTHS = [6, 20, 18, 26, 8, 8, 20, 60, 8]
+PICKUP_PDF_COLUMN_WIDTHS = [24, 62, 52, 70, 30, 34, 55, 166, 30]
+# names, street, city and articles wrap inside their column like in the pick list
+PICKUP_PDF_TEXT_COLUMNS = (1, 2, 3, 6, 7)
+
+
+def pickup_registrations(start: date, end: date):
+    """All registrations of offers that can be picked up between ``start`` and ``end``, grouped by customer."""
+    return (
+        Registration.objects.filter(offer__abhol_von__lte=end, offer__abhol_bis__gte=start)
+        .select_related("user", "offer")
+        .only(*EXPORT_FIELDS)
+        .order_by("user__last_name", "user__first_name", "user_id", "offer__titel")
+    )
+
+
+def customer_rows(registrations: Iterable[Registration]):
+    for index, (_, group) in enumerate(groupby(registrations, key=attrgetter("user_id")), start=1):
+        items = list(group)
+        user = items[0].user
+        yield [
+            index,
+            user.last_name,
+            user.first_name,
+            user.street,
+            user.house_number,
+            user.postal_code,
+            user.city,
+            ", ".join(f"{item.menge}× {item.offer.titel}" for item in items),
+            sum(item.menge for item in items),
+        ]
+
+
+def pickup_rows(start: date, end: date, chunk_size: int = 2000):
+    return customer_rows(pickup_registrations(start, end).iterator(chunk_size=chunk_size))
+
+
+def pickup_range(start: date, end: date) -> str:
+    return f"{start.strftime('%d.%m.%Y')} – {end.strftime('%d.%m.%Y')}"
+
+
+def write_pickup_csv(start: date, end: date, target) -> int:
+    text = io.TextIOWrapper(target, encoding="utf-8", newline="")
+    writer = csv.writer(text, delimiter=";")
+    writer.writerows([["Abholliste", pickup_range(start, end)], [], PICKUP_HEADER])
+    rows = RowCounter(pickup_rows(start, end))
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+    return rows.count
+
+
+def write_pickup_workbook(start: date, end: date, target) -> int:
+    workbook = Workbook(write_only=True)
+    count = append_registrations_sheet(
+        workbook,
+        "Abholliste",
+        [("Abholliste", pickup_range(start, end))],
+        pickup_rows(start, end),
+        header=PICKUP_HEADER,
+        widths=PICKUP_EXCEL_COLUMN_WIDTHS,
+    )
+    workbook.save(target)
+    return count
+
+
+def pickup_story(start: date, end: date, rows: Iterable[list]) -> list:
+    styles = getSampleStyleSheet()
+    cell_style = styles["BodyText"].clone("PickupCell", fontSize=8, leading=10)
+    story = [Paragraph(f"Abholliste {pickup_range(start, end)}", styles["Title"]), Spacer(1, 12)]
+    running_total = 0
+    for chunk in chunked(rows, PDF_ROWS_PER_TABLE):
+        for row in chunk:
+            running_total += row[-1]
+            for index in PICKUP_PDF_TEXT_COLUMNS:
+                row[index] = Paragraph(escape(str(row[index])), cell_style)
+        total_row = [""] * (len(PICKUP_HEADER) - 2) + ["Summe bisher", running_total]
+        table = Table(
+            [PICKUP_HEADER, *chunk, total_row], colWidths=PICKUP_PDF_COLUMN_WIDTHS, style=PDF_TABLE_STYLE, repeatRows=1
+        )
+        story.extend([table, Spacer(1, 12)])
+    story.append(Paragraph(f"Gesamtmenge: {running_total}", styles["Heading3"]))
+    return story
+
+
+def write_pickup_pdf(start: date, end: date, target) -> int:
+    rows = RowCounter(pickup_rows(start, end))
+    pdf_document(target).build(pickup_story(start, end, rows))
+    return rows.count
+
+
+PICKUP_WRITERS = {
+    "csv": write_pickup_csv,
+    "xlsx": write_pickup_workbook,
+    "pdf": write_pickup_pdf,
+}
@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from offers.models import ExportJob, Offer, Registration, WaitlistEntry
+from offers.pagecache import LIST_SCOPE, bump_stock_version
+from offers.services import clear_export_cache
+from offers.tasks import promote_waitlist
+
+
+@receiver(post_delete, sender=Registration)
+def release_reserved_quantity(sender, instance, **kwargs):
+    if instance.stored_quantity:
+        Offer.objects.filter(pk=instance.offer_id).update(reserved=F("reserved") - instance.stored_quantity)
+
+
+@receiver(post_save, sender=Registration)
+@receiver(post_delete, sender=Registration)
+def invalidate_export_cache(sender, instance, **kwargs):
+    # the cached files are keyed by version anyway, this only drops the outdated ones of this offer
+    offer_id = instance.offer_id
+    transaction.on_commit(lambda: clear_export_cache(offer_id))
+
+
+def bump_pages(slug):
+    # only after commit: a page rendered from the old data meanwhile was cached under the old version and is not
+    # served afterwards, and a failing cache write is logged instead of rolling back the order
+    transaction.on_commit(lambda: bump_stock_version(LIST_SCOPE, slug), robust=True)
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_offer_pages(sender, instance, **kwargs):
+    bump_pages(instance.slug)
+
+
+@receiver(post_save, sender=Registration)
+@receiver(post_delete, sender=Registration)
+def invalidate_registration_pages(sender, instance, **kwargs):
+    # the remaining stock is shown on the list and on the offer page
+    bump_pages(instance.offer.slug)
+
+
+@receiver(post_save, sender=Registration)
+def invalidate_previous_offer(sender, instance, **kwargs):
+    # moved to another offer in the admin, the old offer got its stock back
+    previous_offer_id = instance.previous_offer_id
+    if previous_offer_id:
+        transaction.on_commit(lambda: clear_export_cache(previous_offer_id))
+        bump_pages(Offer.objects.values_list("slug", flat=True).get(pk=previous_offer_id))
+        enqueue_waitlist_promotion(previous_offer_id)
+
+
+def enqueue_waitlist_promotion(offer_id):
+    if WaitlistEntry.objects.filter(offer_id=offer_id, nachgerueckt_am__isnull=True).exists():
+        promote_waitlist.enqueue(offer_id)
+
+
+@receiver(post_delete, sender=Registration)
+def promote_waitlist_after_release(sender, instance, **kwargs):
+    enqueue_waitlist_promotion(instance.offer_id)
+
+
+@receiver(post_save, sender=Offer)
+def promote_waitlist_after_restock(sender, instance, created, **kwargs):
+    if instance.limit_raised:
+        enqueue_waitlist_promotion(instance.pk)
+    instance._stored_limit = instance.limit_gesamt
+
+
+@receiver(post_delete, sender=ExportJob)
+def delete_export_file(sender, instance, **kwargs):
+    # only once the row is really gone, a rolled back delete keeps its file
+    if instance.datei:
+        transaction.on_commit(lambda: instance.datei.delete(save=False))
@@ -0,0 +1,101 @@
+"""Live remaining stock for the offer pages, streamed as Server-Sent Events.
+
+Every reservation bumps the stock version of its offer in the shared cache (see ``offers.signals``). One loop per
+process watches the versions of all offers that currently have listeners and reads the changed offers with a
+single query, so a thousand open pages cost the same as one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Iterable
+
+from offers.models import Offer
+from offers.pagecache import astock_versions
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+
+
+async def remaining_by_slug(slugs: Iterable[str]) -> dict[str, int]:
+    offers = Offer.objects.filter(slug__in=list(slugs)).with_stock().values_list("slug", "remaining")
+    return {slug: remaining async for slug, remaining in offers}
+
+
+def stock_event(slug: str, remaining: int) -> str:
+    data = json.dumps({"angebot": slug, "verfuegbar": remaining})
+    return f"event: stock\ndata: {data}\n\n"
+
+
+class Subscription:
+    """Changes for one client, coalesced: a slow client only gets the latest value of every offer."""
+
+    def __init__(self, slugs: Iterable[str]):
+        self.slugs = frozenset(slugs)
+        self.pending: dict[str, int] = {}
+        self.changed = asyncio.Event()
+
+    def push(self, slug: str, remaining: int):
+        self.pending[slug] = remaining
+        self.changed.set()
+
+    async def next_changes(self) -> dict[str, int]:
+        await self.changed.wait()
+        self.changed.clear()
+        changes, self.pending = self.pending, {}
+        return changes
+
+
+class StockBroadcaster:
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.subscriptions: set[Subscription] = set()
+        self.versions: dict[str, int] = {}
+        self.task: asyncio.Task | None = None
+
+    @property
+    def slugs(self) -> set[str]:
+        return {slug for subscription in self.subscriptions for slug in subscription.slugs}
+
+    async def subscribe(self, slugs: Iterable[str]) -> Subscription:
+        subscription = Subscription(slugs)
+        new_slugs = subscription.slugs - self.slugs
+        self.subscriptions.add(subscription)
+        # the baseline is read before the client takes its snapshot, a change in between is sent again
+        self.versions.update(await astock_versions(new_slugs))
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+        for slug in set(self.versions) - self.slugs:
+            del self.versions[slug]
+
+    async def poll(self):
+        slugs = self.slugs
+        versions = await astock_versions(slugs)
+        changed = {slug for slug in slugs if versions.get(slug) != self.versions.get(slug)}
+        if not changed:
+            return
+        self.versions.update(versions)
+        remaining = await remaining_by_slug(changed)
+        for subscription in list(self.subscriptions):
+            for slug in subscription.slugs & remaining.keys():
+                subscription.push(slug, remaining[slug])
+
+    async def run(self):
+        while self.subscriptions:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception:
+                # a failing poll must not end the streams, the next round tries again
+                logger.exception("Polling the stock versions failed")
+
+
+broadcaster = StockBroadcaster()
@@ -0,0 +1,105 @@
+import logging
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.files import File
+from django.utils import timezone
+from django_tasks import task
+
+from offers.manifest import write_manifest
+from offers.models import EmailLog, ExportJob, Offer, Registration
+from offers.services import (
+    EXPORT_WRITERS,
+    PICKUP_WRITERS,
+    confirmation_renderer,
+    send_registration_confirmation,
+)
+from utils.routers import read_only
+
+logger = logging.getLogger(__name__)
+
+# the offline manifest only exists for a pickup window
+JOB_PICKUP_WRITERS = {**PICKUP_WRITERS, ExportJob.Format.MANIFEST: write_manifest}
+
+
+@task(enqueue_on_commit=True)
+def send_confirmation_mail(registration_id: int) -> bool:
+    """Sends the confirmation for the latest binding confirmation of a registration.
+
+    Safe to retry: a mail already logged after the last confirmation is not sent again.
+    """
+    registration = Registration.objects.select_related("offer", "user").filter(pk=registration_id).first()
+    if registration is None:
+        return False
+    already_sent = EmailLog.objects.filter(
+        registration=registration,
+        typ=EmailLog.Typ.CONFIRM,
+        timestamp__gte=registration.zustimmung_verbindlich_at,
+    ).exists()
+    if already_sent:
+        return False
+    send_registration_confirmation(registration)
+    return True
+
+
+@task(enqueue_on_commit=True)
+def send_pending_confirmations(offer_id: int) -> int:
+    """Sends the confirmations for all registrations of an offer that have none yet, with one renderer.
+
+    Used after registrations were created in bulk by the allocation or the waitlist.
+
+    Safe to retry: registrations with a logged confirmation are skipped.
+    """
+    offer = Offer.objects.filter(pk=offer_id).first()
+    if offer is None:
+        return 0
+    confirmed = EmailLog.objects.filter(offer=offer, typ=EmailLog.Typ.CONFIRM, registration__isnull=False)
+    registrations = (
+        offer.registrations.select_related("user").exclude(pk__in=confirmed.values("registration_id")).order_by("pk")
+    )
+    renderer = confirmation_renderer(offer)
+    sent = 0
+    for registration in registrations.iterator(chunk_size=200):
+        registration.offer = offer
+        send_registration_confirmation(registration, renderer)
+        sent += 1
+    return sent
+
+
+@task(enqueue_on_commit=True)
+def promote_waitlist(offer_id: int) -> int:
+    """Hands released stock of an offer to its waitlist, safe to run repeatedly."""
+    from offers.waitlist import promote
+
+    return promote(offer_id)
+
+
+@task(enqueue_on_commit=True)
+def run_export_job(job_id: int) -> str:
+    """Writes the export file of a job to MEDIA_ROOT and records row count and duration."""
+    job = ExportJob.objects.filter(pk=job_id).first()
+    if job is None or job.status == ExportJob.Status.DONE:
+        return job.status if job else ""
+    ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.Status.RUNNING)
+    offers = job.offers.order_by("abhol_von", "titel")
+    started = time.monotonic()
+    try:
+        with tempfile.TemporaryFile() as spool, read_only(snapshot=True):
+            if job.abholung_von:
+                job.zeilen = JOB_PICKUP_WRITERS[job.format](job.abholung_von, job.abholung_bis, spool)
+            else:
+                job.zeilen = EXPORT_WRITERS[job.format](offers, spool, job.gruppierung or None)
+            spool.seek(0)
+            job.datei.save(job.filename, File(spool), save=False)
+    except Exception as exc:
+        logger.exception("Export %s fehlgeschlagen", job.pk)
+        job.status = ExportJob.Status.FAILED
+        job.fehler = str(exc)
+    else:
+        job.status = ExportJob.Status.DONE
+        job.fehler = ""
+    job.dauer = timedelta(seconds=time.monotonic() - started)
+    job.fertig_am = timezone.now()
+    job.save()
+    return job.status
@@ -0,0 +1,158 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_tasks import default_task_backend
+
+from offers.models import Consent, EmailLog, ExportJob, Offer, Registration
+from offers.tasks import run_export_job
+from users.models import User
+
+
+# the admin base template compresses sass, which is not available in the test environment
+@override_settings(COMPRESS_ENABLED=False, COMPRESS_OFFLINE=False, COMPRESS_PRECOMPILERS=())
+class AdminChangelistQueryTests(TestCase):
+    """The number of queries of a changelist must not depend on the number of rows."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="testpass123")
+        self.client.force_login(self.admin)
+        self.counter = 0
+
+    def _create_rows(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            self.counter += 1
+            offer = Offer.objects.create(
+                titel=f"Wildpaket {self.counter}",
+                bestell_start=now - timedelta(hours=1),
+                bestell_ende=now + timedelta(hours=1),
+                abhol_von=(now + timedelta(days=3)).date(),
+                abhol_bis=(now + timedelta(days=5)).date(),
+                limit_gesamt=10,
+            )
+            user = User.objects.create_user(email=f"kunde{self.counter}@example.com", password="testpass123")
+            registration = Registration(user=user, offer=offer, menge=2)
+            registration.confirm()
+            EmailLog.objects.create(
+                registration=registration, offer=offer, empfaenger=user.email, typ=EmailLog.Typ.CONFIRM
+            )
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def _assert_constant_queries(self, url):
+        self._create_rows(1)
+        single = self._count_queries(url)
+        self._create_rows(5)
+        self.assertEqual(self._count_queries(url), single)
+
+    def test_offer_changelist(self):
+        self._assert_constant_queries(reverse("admin:offers_offer_changelist"))
+
+    def test_registration_changelist(self):
+        self._assert_constant_queries(reverse("admin:offers_registration_changelist"))
+
+    def test_consent_changelist(self):
+        self._assert_constant_queries(reverse("admin:offers_consent_changelist"))
+        self.assertEqual(Consent.objects.count(), 6)
+
+    def test_emaillog_changelist(self):
+        self._assert_constant_queries(reverse("admin:offers_emaillog_changelist"))
+
+    def test_offer_changelist_shows_remaining(self):
+        self._create_rows(1)
+        response = self.client.get(reverse("admin:offers_offer_changelist"))
+        self.assertContains(response, '<td class="field-remaining">8</td>', html=True)
+
+
+@override_settings(
+    COMPRESS_ENABLED=False,
+    COMPRESS_OFFLINE=False,
+    COMPRESS_PRECOMPILERS=(),
+    TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}},
+)
+class ExportJobAdminTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, EXPORT_CACHE_DIR=f"{media_root}/export-cache"))
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="testpass123")
+        self.client.force_login(self.admin)
+        now = timezone.now()
+        self.offers = [
+            Offer.objects.create(
+                titel=f"Wildpaket {index}",
+                bestell_start=now - timedelta(hours=1),
+                bestell_ende=now + timedelta(hours=1),
+                abhol_von=(now + timedelta(days=3)).date(),
+                abhol_bis=(now + timedelta(days=5)).date(),
+                limit_gesamt=10,
+            )
+            for index in range(2)
+        ]
+
+    def test_action_enqueues_one_job_for_all_selected_offers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("admin:offers_offer_changelist"),
+                {"action": "export_vorbestellungen_excel", "_selected_action": [offer.pk for offer in self.offers]},
+                follow=True,
+            )
+
+        self.assertContains(response, "Export gestartet")
+        job = ExportJob.objects.get()
+        self.assertEqual(job.format, ExportJob.Format.EXCEL)
+        self.assertEqual(job.erstellt_von, self.admin)
+        self.assertCountEqual(job.offers.all(), self.offers)
+        self.assertEqual([result.args for result in default_task_backend.results], [[job.pk]])
+
+    def test_pickup_action_covers_the_pickup_window_of_the_selection(self):
+        self.offers[1].abhol_von = self.offers[0].abhol_bis + timedelta(days=10)
+        self.offers[1].abhol_bis = self.offers[1].abhol_von
+        self.offers[1].save()
+
+        self.client.post(
+            reverse("admin:offers_offer_changelist"),
+            {"action": "export_abholliste_pdf", "_selected_action": [self.offers[0].pk]},
+        )
+
+        job = ExportJob.objects.get()
+        self.assertEqual((job.abholung_von, job.abholung_bis), (self.offers[0].abhol_von, self.offers[0].abhol_bis))
+        self.assertEqual(list(job.offers.all()), self.offers[:1])
+
+    def test_finished_job_can_be_downloaded(self):
+        job = ExportJob.objects.create(format=ExportJob.Format.CSV)
+        job.offers.set(self.offers[:1])
+        download_url = reverse("admin:offers_exportjob_download", args=[job.pk])
+        self.assertEqual(self.client.get(download_url).status_code, 404)
+
+        run_export_job.call(job.pk)
+
+        response = self.client.get(reverse("admin:offers_exportjob_changelist"))
+        self.assertContains(response, download_url)
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("vorbestellungen-wildpaket-0.csv", response["Content-Disposition"])
+        self.assertTrue(b"".join(response.streaming_content).startswith("Angebot;Wildpaket 0".encode()))
+
+    def test_single_offer_download_uses_etag(self):
+        url = reverse("admin:offers_offer_export", args=[self.offers[0].pk, "pdf"])
+        self.assertContains(self.client.get(reverse("admin:offers_offer_changelist")), url)
+
+        response = self.client.get(url, {"gruppierung": "plz"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("vorbestellungen-wildpaket-0-plz.pdf", response["Content-Disposition"])
+        response.close()
+
+        response = self.client.get(url, {"gruppierung": "plz"}, headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, {"gruppierung": "alles"}).status_code, 404)
@@ -0,0 +1,144 @@
+import random
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_tasks import default_task_backend
+
+from offers.allocation import allocate, allocate_lottery, allocate_pro_rata
+from offers.models import AllocationEntry, Consent, EmailLog, Offer, Registration
+from offers.tasks import send_pending_confirmations
+from users.models import User
+
+
+class AllocatorTests(TestCase):
+    def test_lottery_hands_out_the_stock_in_drawn_order(self):
+        wanted = {1: 2, 2: 2, 3: 2, 4: 1}
+
+        shares = allocate_lottery(wanted, 5, random.Random(7))
+
+        self.assertEqual(sum(shares.values()), 5)
+        self.assertTrue(all(shares[entry_id] <= wanted[entry_id] for entry_id in wanted))
+        self.assertEqual(shares, allocate_lottery(wanted, 5, random.Random(7)))
+
+    def test_pro_rata_shares_the_same_fraction(self):
+        self.assertEqual(allocate_pro_rata({1: 4, 2: 2, 3: 2}, 4, random.Random(1)), {1: 2, 2: 1, 3: 1})
+        self.assertEqual(allocate_pro_rata({1: 1, 2: 3}, 10, random.Random(1)), {1: 1, 2: 3})
+
+        shares = allocate_pro_rata({1: 1, 2: 1, 3: 1}, 2, random.Random(1))
+
+        self.assertEqual(sorted(shares.values()), [0, 1, 1])
+
+
+@override_settings(TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}})
+class AllocationTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Hirschkeule",
+            bestell_start=now - timedelta(days=2),
+            bestell_ende=now - timedelta(minutes=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=5,
+            limit_pro_user=2,
+            vergabe=Offer.Vergabe.LOS,
+        )
+        self.users = []
+        for index, menge in enumerate([3, 2, 2, 1]):
+            user = User.objects.create_user(email=f"kunde{index}@example.com", password="testpass123")
+            AllocationEntry.objects.create(user=user, offer=self.offer, menge=menge, zustimmung_at=now)
+            self.users.append(user)
+
+    def test_closed_offer_is_allocated_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = allocate(self.offer, seed=3)
+
+        self.assertEqual((result.entries, result.allocated), (4, 5))
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 5)
+        self.assertIsNotNone(self.offer.zugeteilt_am)
+        self.assertEqual(Registration.objects.count(), result.registrations)
+        self.assertTrue(all(registration.menge <= 2 for registration in Registration.objects.all()))
+        self.assertEqual(sum(AllocationEntry.objects.values_list("zugeteilt", flat=True)), 5)
+        self.assertEqual([task.args for task in default_task_backend.results], [[self.offer.pk]])
+        self.assertEqual(allocate(self.offer).registrations, 0)
+        call_command("rebuild_reserved_counts", "--check", stdout=StringIO())
+
+    def test_open_offer_is_not_allocated(self):
+        Offer.objects.filter(pk=self.offer.pk).update(bestell_ende=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(allocate(self.offer).entries, 0)
+        self.assertFalse(Registration.objects.exists())
+
+    def test_command_allocates_due_offers(self):
+        out = StringIO()
+
+        call_command("allocate_offers", "--seed", "1", stdout=out)
+
+        self.assertIn("Hirschkeule: 5 Stück an", out.getvalue())
+        self.assertIn("Keine Angebote zuzuteilen.", self._run_again())
+
+    def _run_again(self):
+        out = StringIO()
+        call_command("allocate_offers", stdout=out)
+        return out.getvalue()
+
+    def test_confirmations_are_sent_once(self):
+        allocate(self.offer, seed=3)
+
+        sent = send_pending_confirmations.call(self.offer.pk)
+
+        self.assertEqual(sent, Registration.objects.count())
+        self.assertEqual(len(mail.outbox), sent)
+        self.assertEqual(send_pending_confirmations.call(self.offer.pk), 0)
+        self.assertEqual(EmailLog.objects.filter(typ=EmailLog.Typ.CONFIRM).count(), sent)
+
+
+class AllocationEntryViewTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Wildschwein im Ganzen",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=3,
+            vergabe=Offer.Vergabe.ANTEILIG,
+        )
+        self.user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+        self.user.email_verified_at = now
+        self.user.save(update_fields=["email_verified_at"])
+        self.client.force_login(self.user)
+        self.url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
+
+    def test_wish_is_stored_without_claiming_stock(self):
+        self.assertContains(self.client.get(self.url), "Wunsch vormerken")
+
+        response = self.client.post(self.url, {"menge": 3})
+
+        self.assertRedirects(response, self.url)
+        self.assertEqual(AllocationEntry.objects.get(user=self.user).menge, 3)
+        self.assertFalse(Registration.objects.exists())
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 0)
+        self.assertTrue(Consent.objects.filter(user=self.user, offer=self.offer).exists())
+
+    def test_wish_can_be_changed_until_the_end(self):
+        self.client.post(self.url, {"menge": 3})
+
+        self.client.post(self.url, {"menge": 1})
+
+        self.assertEqual(AllocationEntry.objects.get(user=self.user).menge, 1)
+        self.assertContains(self.client.get(self.url), "Wunsch ändern")
+
+    def test_wish_is_limited_to_the_stock(self):
+        response = self.client.post(self.url, {"menge": 4})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AllocationEntry.objects.exists())
@@ -0,0 +1,138 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from offers.models import CODE_ALPHABET, CODE_LENGTH, Offer, Registration
+from offers.services import qr_png, send_registration_confirmation
+from users.models import User
+
+
+class CheckInTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Wildschweinbraten",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=now.date(),
+            abhol_bis=(now + timedelta(days=2)).date(),
+            limit_gesamt=50,
+        )
+        self.registrations = {}
+        for last_name in ["Müller", "Mueller", "Meier", "Bauer"]:
+            user = User.objects.create_user(
+                email=f"{last_name.lower()}@example.com", password="testpass123", last_name=last_name
+            )
+            registration = Registration(user=user, offer=self.offer, menge=2)
+            registration.confirm()
+            self.registrations[last_name] = registration
+
+
+class RegistrationLookupTests(CheckInTestCase):
+    def test_codes_are_unique_and_readable(self):
+        codes = {registration.code for registration in self.registrations.values()}
+
+        self.assertEqual(len(codes), 4)
+        for code in codes:
+            self.assertEqual(len(code), CODE_LENGTH)
+            self.assertLessEqual(set(code), set(CODE_ALPHABET))
+
+    def test_lookup_by_code_ignores_case_and_spaces(self):
+        code = self.registrations["Bauer"].code
+        term = f" {code[:4].lower()} {code[4:]} "
+
+        self.assertEqual(list(Registration.objects.lookup(term)), [self.registrations["Bauer"]])
+
+    def test_lookup_by_last_name_prefix(self):
+        def last_names(term):
+            return sorted(Registration.objects.lookup(term).values_list("user__last_name", flat=True))
+
+        self.assertEqual(last_names("m"), ["Meier", "Mueller", "Müller"])
+        self.assertEqual(last_names("MUE"), ["Mueller"])
+        self.assertEqual(last_names("Mü"), ["Müller"])
+        self.assertEqual(last_names(""), [])
+
+    def test_mark_picked_up_only_once(self):
+        queryset = Registration.objects.filter(pk=self.registrations["Meier"].pk)
+
+        self.assertEqual(queryset.mark_picked_up(), 1)
+        self.assertEqual(queryset.mark_picked_up(), 0)
+        self.assertIsNotNone(queryset.get().abgeholt_at)
+
+
+class CheckInApiTests(CheckInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user(email="theke@example.com", password="testpass123", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_search(self):
+        response = self.client.get(reverse("checkin-list"), {"q": "bau"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "code": self.registrations["Bauer"].code,
+                    "angebot": "Wildschweinbraten",
+                    "menge": 2,
+                    "name": "Bauer",
+                    "plz": "",
+                    "abgeholt_at": None,
+                }
+            ],
+        )
+
+    def test_pick_up_is_a_single_update(self):
+        registration = self.registrations["Müller"]
+        url = reverse("checkin-abholen", kwargs={"code": registration.code.lower()})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"code": registration.code, "abgeholt": True})
+        statements = [query["sql"] for query in queries if "offers_registration" in query["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("UPDATE"))
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNotNone(response.json()["abgeholt_at"])
+        self.assertEqual(self.client.post(reverse("checkin-abholen", kwargs={"code": "XXXXXXXX"})).status_code, 404)
+
+    def test_customers_cannot_use_the_api(self):
+        self.client.force_login(self.registrations["Bauer"].user)
+
+        self.assertEqual(self.client.get(reverse("checkin-list"), {"q": "m"}).status_code, 403)
+        url = reverse("checkin-abholen", kwargs={"code": self.registrations["Meier"].code})
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+    @override_settings(COMPRESS_ENABLED=False, COMPRESS_OFFLINE=False, COMPRESS_PRECOMPILERS=())
+    def test_check_in_page_is_staff_only(self):
+        self.assertContains(self.client.get(reverse("offers:checkin")), "checkin-term")
+
+        self.client.force_login(self.registrations["Bauer"].user)
+        self.assertEqual(self.client.get(reverse("offers:checkin")).status_code, 302)
+
+
+class PickupCodeMailTests(CheckInTestCase):
+    def test_qr_code_is_a_png(self):
+        self.assertTrue(qr_png("ABCDEFGH").startswith(b"\x89PNG"))
+
+    def test_confirmation_contains_code_and_inline_qr_code(self):
+        registration = self.registrations["Bauer"]
+
+        send_registration_confirmation(registration)
+
+        message = mail.outbox[0]
+        self.assertIn(registration.code, message.body)
+        self.assertIn('src="cid:abholcode"', message.alternatives[0][0])
+        image = message.attachments[0]
+        self.assertEqual(image["Content-ID"], "<abholcode>")
+        self.assertEqual(image.get_content_type(), "image/png")
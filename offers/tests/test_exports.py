@@ -0,0 +1,433 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.http import FileResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from reportlab.platypus import PageBreak, Paragraph, Table
+
+from offers.models import ExportJob, Offer, Registration
+from offers.services import (
+    EXPORT_WRITERS,
+    HEADER,
+    PDF_COLUMN_WIDTHS,
+    PDF_ORDERING,
+    PDF_ROWS_PER_TABLE,
+    PICKUP_HEADER,
+    clear_export_cache,
+    csv_lines,
+    export_cache_dir,
+    export_registrations_csv,
+    export_registrations_excel,
+    export_registrations_pdf,
+    offer_rows,
+    pick_list_story,
+    pickup_rows,
+    pickup_story,
+    write_offers_workbook,
+    write_pickup_pdf,
+)
+from offers.tasks import run_export_job
+from users.models import User
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, EXPORT_CACHE_DIR=f"{media_root}/export-cache"))
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Hirschsalami",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=100,
+        )
+
+    def _create_registrations(self, names, offer=None):
+        for index, last_name in enumerate(names):
+            user = User.objects.create_user(
+                email=f"kunde{index}-{(offer or self.offer).pk}@example.com",
+                password="testpass123",
+                first_name="Kim",
+                last_name=last_name,
+                street="Dorfstraße",
+                house_number=str(index + 1),
+                postal_code=f"1480{index}",
+                city="Bad Belzig",
+            )
+            Registration(user=user, offer=offer or self.offer, menge=index + 1).confirm()
+
+    def _spool_dir(self):
+        return Path(settings.EXPORT_CACHE_DIR) / "tmp"
+
+
+class CsvExportTests(ExportTestCase):
+    def test_csv_is_written_in_name_order(self):
+        self._create_registrations(["Zander", "Albrecht", "Meier"])
+
+        # only the version is read up front, the rows are read while the file is sent
+        with self.assertNumQueries(1):
+            response = export_registrations_csv(self.offer)
+
+        self.assertTrue(response.streaming)
+        self.assertIn("vorbestellungen-hirschsalami.csv", response["Content-Disposition"])
+        with self.assertNumQueries(1):
+            content = b"".join(response.streaming_content)
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], "Angebot;Hirschsalami")
+        self.assertEqual(lines[3], ";".join(HEADER))
+        self.assertEqual(
+            lines[4:],
+            [
+                "1;Hirschsalami;2;Albrecht;Kim;Dorfstraße;2;14801;Bad Belzig",
+                "2;Hirschsalami;3;Meier;Kim;Dorfstraße;3;14802;Bad Belzig",
+                "3;Hirschsalami;1;Zander;Kim;Dorfstraße;1;14800;Bad Belzig",
+            ],
+        )
+
+    def test_streamed_csv_becomes_the_cache_entry(self):
+        self._create_registrations(["Zander", "Albrecht"])
+        aborted = export_registrations_csv(self.offer)
+        next(iter(aborted.streaming_content))
+        aborted.close()
+        self.assertFalse(export_cache_dir(self.offer.pk).exists())
+        self.assertEqual(list(self._spool_dir().iterdir()), [])
+
+        content = b"".join(export_registrations_csv(self.offer).streaming_content)
+
+        with self.assertNumQueries(1):
+            cached = export_registrations_csv(self.offer)
+        self.assertIsInstance(cached, FileResponse)
+        self.assertEqual(b"".join(cached.streaming_content), content)
+
+    def test_cache_cleared_while_streaming(self):
+        self._create_registrations(["Zander", "Albrecht"])
+        b"".join(export_registrations_excel(self.offer).streaming_content)
+        lines = csv_lines
+
+        def clearing_lines(offer):
+            for index, line in enumerate(lines(offer)):
+                if index == 1:
+                    clear_export_cache(offer.pk)
+                yield line
+
+        with patch("offers.services.csv_lines", clearing_lines):
+            content = b"".join(export_registrations_csv(self.offer).streaming_content)
+
+        self.assertEqual(len(content.decode().splitlines()), 6)
+        self.assertEqual(list(self._spool_dir().iterdir()), [])
+
+
+class ExportCacheTests(ExportTestCase):
+    def setUp(self):
+        super().setUp()
+        self._create_registrations(["Zander", "Albrecht"])
+
+    def _download(self, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        response = export_registrations_excel(self.offer, request=request)
+        content = b"".join(response.streaming_content) if response.status_code == 200 else b""
+        return response, content
+
+    def test_repeated_export_is_served_from_disk(self):
+        first, content = self._download()
+
+        with self.assertNumQueries(1):
+            second, cached = self._download()
+
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual(content, cached)
+        self.assertEqual(len(list(export_cache_dir(self.offer.pk).iterdir())), 1)
+
+    def test_cache_cleared_during_a_render(self):
+        self._download()
+        write_pdf = EXPORT_WRITERS["pdf"]
+
+        def clearing_writer(offers, target, group_by):
+            clear_export_cache(self.offer.pk)
+            return write_pdf(offers, target, group_by)
+
+        with patch.dict(EXPORT_WRITERS, pdf=clearing_writer):
+            response = export_registrations_pdf(self.offer)
+
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        response.close()
+        self.assertEqual(list(self._spool_dir().iterdir()), [])
+
+    def test_matching_etag_is_not_modified(self):
+        first, _ = self._download()
+
+        response, _ = self._download(if_none_match=first["ETag"])
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+    def test_changed_customer_address_changes_the_version(self):
+        first, _ = self._download()
+        user = Registration.objects.filter(offer=self.offer).first().user
+        user.street = "Lindenallee"
+        user.save()
+
+        response, content = self._download(if_none_match=first["ETag"])
+
+        self.assertEqual(response.status_code, 200)
+        streets = [row[5] for row in load_workbook(BytesIO(content)).active.iter_rows(min_row=5, values_only=True)]
+        self.assertIn("Lindenallee", streets)
+
+    def test_changed_registration_invalidates_only_its_offer(self):
+        other_offer = Offer.objects.create(
+            titel="Rehrücken",
+            bestell_start=self.offer.bestell_start,
+            bestell_ende=self.offer.bestell_ende,
+            abhol_von=self.offer.abhol_von,
+            abhol_bis=self.offer.abhol_bis,
+            limit_gesamt=10,
+        )
+        first, _ = self._download()
+        b"".join(export_registrations_csv(other_offer).streaming_content)
+        registration = Registration.objects.filter(offer=self.offer).first()
+        registration.menge += 1
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registration.confirm()
+
+        self.assertFalse(export_cache_dir(self.offer.pk).exists())
+        self.assertTrue(export_cache_dir(other_offer.pk).exists())
+        response, content = self._download(if_none_match=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        quantities = [row[2] for row in load_workbook(BytesIO(content)).active.iter_rows(min_row=5, values_only=True)]
+        self.assertIn(registration.menge, quantities)
+
+
+class ExcelExportTests(ExportTestCase):
+    def test_excel_keeps_header_block_and_rows(self):
+        self._create_registrations(["Zander", "Albrecht"])
+
+        response = export_registrations_excel(self.offer)
+
+        self.assertTrue(response.streaming)
+        self.assertIn("vorbestellungen-hirschsalami.xlsx", response["Content-Disposition"])
+        sheet = load_workbook(BytesIO(b"".join(response.streaming_content))).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:2], ("Angebot", "Hirschsalami"))
+        self.assertEqual(rows[1][0], "Abholfenster")
+        self.assertEqual(list(rows[3]), HEADER)
+        self.assertEqual(rows[4][:4], (1, "Hirschsalami", 2, "Albrecht"))
+        self.assertEqual(rows[5][3], "Zander")
+        self.assertTrue(sheet["A4"].font.bold)
+        self.assertEqual(sheet.column_dimensions["B"].width, 32)
+
+
+class PdfExportTests(ExportTestCase):
+    def _rows(self, count):
+        for index in range(1, count + 1):
+            last_name = "Albrecht" if index <= count // 2 else "Bauer"
+            yield [index, "Hirschsalami", 2, last_name, "Kim", "Weg", "1", "14806", "Bad Belzig"]
+
+    def test_rows_are_split_into_page_sized_tables_with_running_totals(self):
+        story = pick_list_story(self.offer, self._rows(PDF_ROWS_PER_TABLE * 2 + 5))
+
+        tables = [flowable for flowable in story if isinstance(flowable, Table)]
+        self.assertEqual(len(tables), 3)
+        self.assertEqual(tables[0]._cellvalues[-1][2], PDF_ROWS_PER_TABLE * 2)
+        self.assertEqual(tables[-1]._cellvalues[-1][2], (PDF_ROWS_PER_TABLE * 2 + 5) * 2)
+        self.assertEqual(list(tables[1]._cellvalues[0]), HEADER)
+
+    def test_text_cells_wrap_inside_their_column(self):
+        rows = [[1, "Hirschsalami & Rehwurst im Doppelpack", 2, "Albrecht-Müller", "Kim", "Weg", "1", "", "Bad Belzig"]]
+
+        [table] = [flowable for flowable in pick_list_story(self.offer, rows) if isinstance(flowable, Table)]
+
+        product = table._cellvalues[1][1]
+        self.assertIsInstance(product, Paragraph)
+        self.assertEqual(product.text, "Hirschsalami &amp; Rehwurst im Doppelpack")
+        self.assertEqual(table._cellvalues[1][2], 2)
+        _, height = product.wrap(PDF_COLUMN_WIDTHS[1], 1000)
+        self.assertGreater(height, product.style.leading)
+
+    def test_grouping_by_last_name_starts_new_pages(self):
+        story = pick_list_story(self.offer, self._rows(10), group_by="nachname")
+
+        headings = [flowable.text for flowable in story if isinstance(flowable, Paragraph)]
+        self.assertIn("Nachname: A", headings)
+        self.assertIn("Nachname: B", headings)
+        self.assertEqual(sum(isinstance(flowable, PageBreak) for flowable in story), 1)
+
+    def test_last_name_groups_ignore_the_case(self):
+        self._create_registrations(["müller", "Bauer", "Müller", "meier"])
+
+        story = pick_list_story(self.offer, offer_rows(self.offer, PDF_ORDERING["nachname"]), group_by="nachname")
+
+        headings = [flowable.text for flowable in story if isinstance(flowable, Paragraph)]
+        self.assertEqual(
+            [heading for heading in headings if heading.startswith("Nachname")], ["Nachname: B", "Nachname: M"]
+        )
+        [_, table] = [flowable for flowable in story if isinstance(flowable, Table)]
+        self.assertEqual(len(table._cellvalues), 5)
+        self.assertEqual(table.repeatRows, 1)
+
+    def test_grouped_pdf_export(self):
+        self._create_registrations(["Zander", "Albrecht", "Meier"])
+
+        response = export_registrations_pdf(self.offer, group_by="plz")
+
+        self.assertIn("application/pdf", response["Content-Type"])
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+
+class ExportJobTests(ExportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.second_offer = Offer.objects.create(
+            titel="Wildschwein: Keule",
+            bestell_start=self.offer.bestell_start,
+            bestell_ende=self.offer.bestell_ende,
+            abhol_von=self.offer.abhol_von,
+            abhol_bis=self.offer.abhol_bis,
+            limit_gesamt=100,
+        )
+        self._create_registrations(["Zander", "Albrecht"])
+        self._create_registrations(["Meier"], offer=self.second_offer)
+
+    def _run(self, format, group_by=""):
+        job = ExportJob.objects.create(format=format, gruppierung=group_by)
+        job.offers.set([self.offer, self.second_offer])
+        self.assertEqual(run_export_job.call(job.pk), ExportJob.Status.DONE)
+        job.refresh_from_db()
+        self.assertEqual(job.zeilen, 3)
+        self.assertIsNotNone(job.dauer)
+        suffix = f"-{group_by}" if group_by else ""
+        self.assertTrue(job.datei.name.endswith(f"vorbestellungen-2-angebote{suffix}.{format}"))
+        with job.datei.open("rb") as handle:
+            return handle.read()
+
+    def test_csv_job_writes_one_block_per_offer(self):
+        lines = self._run(ExportJob.Format.CSV).decode().splitlines()
+
+        self.assertEqual(lines.count(";".join(HEADER)), 2)
+        self.assertIn("Angebot;Wildschwein: Keule", lines)
+        self.assertIn("1;Wildschwein: Keule;1;Meier;Kim;Dorfstraße;1;14800;Bad Belzig", lines)
+
+    def test_excel_job_writes_one_sheet_per_offer(self):
+        workbook = load_workbook(BytesIO(self._run(ExportJob.Format.EXCEL)))
+
+        self.assertEqual(workbook.sheetnames, ["Hirschsalami", "Wildschwein- Keule"])
+        self.assertEqual(workbook["Wildschwein- Keule"]["D5"].value, "Meier")
+
+    def test_pdf_job(self):
+        self.assertTrue(self._run(ExportJob.Format.PDF, "plz").startswith(b"%PDF"))
+
+    def test_failure_is_recorded(self):
+        job = ExportJob.objects.create(format="unbekannt")
+        job.offers.set([self.offer])
+
+        with self.assertLogs("offers.tasks", level="ERROR"):
+            self.assertEqual(run_export_job.call(job.pk), ExportJob.Status.FAILED)
+
+        job.refresh_from_db()
+        self.assertEqual(job.fehler, "'unbekannt'")
+        self.assertFalse(job.datei)
+
+    def test_old_jobs_are_deleted_with_their_files(self):
+        self._run(ExportJob.Format.CSV)
+        old, recent = ExportJob.objects.get(), ExportJob.objects.create(format=ExportJob.Format.CSV)
+        ExportJob.objects.filter(pk=old.pk).update(erstellt_am=timezone.now() - timedelta(days=31))
+        path = Path(old.datei.path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("cleanup_exports", "--days", "30", stdout=(out := StringIO()))
+
+        self.assertEqual(out.getvalue().strip(), "1 Exporte gelöscht.")
+        self.assertEqual(list(ExportJob.objects.all()), [recent])
+        self.assertFalse(path.exists())
+
+    def test_workbook_numbers_duplicate_sheet_titles(self):
+        self.second_offer.titel = self.offer.titel
+
+        write_offers_workbook([self.offer, self.second_offer], target := BytesIO())
+
+        self.assertEqual(load_workbook(target).sheetnames, ["Hirschsalami", "Hirschsalami1"])
+
+
+class PickupListTests(ExportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start, self.end = self.offer.abhol_von, self.offer.abhol_bis
+        self.second_offer = Offer.objects.create(
+            titel="Rehkeule",
+            bestell_start=self.offer.bestell_start,
+            bestell_ende=self.offer.bestell_ende,
+            abhol_von=self.end,
+            abhol_bis=self.end + timedelta(days=1),
+            limit_gesamt=100,
+        )
+        later_offer = Offer.objects.create(
+            titel="Wildgulasch",
+            bestell_start=self.offer.bestell_start,
+            bestell_ende=self.offer.bestell_ende,
+            abhol_von=self.end + timedelta(days=7),
+            abhol_bis=self.end + timedelta(days=8),
+            limit_gesamt=100,
+        )
+        for last_name, items in [("Zander", [self.offer]), ("Albrecht", [self.offer, self.second_offer, later_offer])]:
+            user = User.objects.create_user(
+                email=f"{last_name.lower()}@example.com",
+                password="testpass123",
+                first_name="Kim",
+                last_name=last_name,
+                postal_code="14806",
+            )
+            for offer in items:
+                Registration(user=user, offer=offer, menge=2).confirm()
+
+    def test_one_row_per_customer_from_one_query(self):
+        with self.assertNumQueries(1):
+            rows = list(pickup_rows(self.start, self.end))
+
+        self.assertEqual([row[:2] for row in rows], [[1, "Albrecht"], [2, "Zander"]])
+        self.assertEqual(rows[0][-2:], ["2× Hirschsalami, 2× Rehkeule", 4])
+        self.assertEqual(rows[1][-2:], ["2× Hirschsalami", 2])
+
+    def test_pickup_job_writes_csv(self):
+        job = ExportJob.objects.create(format=ExportJob.Format.CSV, abholung_von=self.start, abholung_bis=self.end)
+
+        run_export_job.call(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.Status.DONE)
+        self.assertEqual(job.zeilen, 2)
+        self.assertIn(f"abholliste-{self.start:%Y-%m-%d}-{self.end:%Y-%m-%d}", job.datei.name)
+        with job.datei.open("rb") as handle:
+            lines = handle.read().decode().splitlines()
+        self.assertEqual(lines[2], ";".join(PICKUP_HEADER))
+        self.assertEqual(lines[3], "1;Albrecht;Kim;;;14806;;2× Hirschsalami, 2× Rehkeule;4")
+
+    def test_pickup_pdf_wraps_every_text_cell(self):
+        [table] = [
+            flowable
+            for flowable in pickup_story(self.start, self.end, pickup_rows(self.start, self.end))
+            if isinstance(flowable, Table)
+        ]
+
+        first = table._cellvalues[1]
+        self.assertEqual([cell.text for cell in first[1:4]], ["Albrecht", "Kim", ""])
+        self.assertEqual(first[7].text, "2× Hirschsalami, 2× Rehkeule")
+        self.assertEqual((first[0], first[-1]), (1, 4))
+        self.assertEqual(table.repeatRows, 1)
+
+    def test_pickup_pdf(self):
+        target = BytesIO()
+
+        self.assertEqual(write_pickup_pdf(self.start, self.end, target), 2)
+        self.assertTrue(target.getvalue().startswith(b"%PDF"))
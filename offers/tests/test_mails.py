@@ -0,0 +1,228 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPServerDisconnected
+from unittest.mock import Mock, patch
+
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_tasks import default_task_backend
+
+from offers.models import EmailLog, Offer, Registration
+from offers.services import (
+    RateLimiter,
+    ReminderDispatcher,
+    confirmation_renderer,
+    pending_reminders,
+    reminder_renderer,
+)
+from offers.tasks import send_confirmation_mail
+from users.models import User
+
+
+class MailTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Wildschwein Salami",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=20,
+        )
+        self.user = User.objects.create_user(
+            email="kunde@example.com", password="testpass123", first_name="Erika", last_name="Muster"
+        )
+        self.user.email_verified_at = now
+        self.user.save(update_fields=["email_verified_at"])
+
+
+@override_settings(TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}})
+class ConfirmationQueueTests(MailTestCase):
+    def test_post_enqueues_confirmation_after_commit(self):
+        self.client.force_login(self.user)
+        url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"menge": 2})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        results = default_task_backend.results
+        self.assertEqual(len(results), 1)
+        registration = Registration.objects.get(user=self.user)
+        self.assertEqual(results[0].args, [registration.pk])
+
+    def test_task_is_idempotent(self):
+        registration = Registration(user=self.user, offer=self.offer, menge=2)
+        registration.confirm()
+
+        self.assertTrue(send_confirmation_mail.call(registration.pk))
+        self.assertFalse(send_confirmation_mail.call(registration.pk))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(EmailLog.objects.filter(registration=registration, typ=EmailLog.Typ.CONFIRM).count(), 1)
+
+    def test_new_confirmation_is_sent_again(self):
+        registration = Registration(user=self.user, offer=self.offer, menge=2)
+        registration.confirm()
+        send_confirmation_mail.call(registration.pk)
+
+        registration = Registration.objects.get(pk=registration.pk)
+        registration.menge = 3
+        registration.confirm()
+
+        self.assertTrue(send_confirmation_mail.call(registration.pk))
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class ReminderCommandTests(MailTestCase):
+    def _create_registrations(self, count, offset=0):
+        for index in range(offset, offset + count):
+            user = User.objects.create_user(email=f"kunde{index}@example.com", password="testpass123")
+            Registration(user=user, offer=self.offer, menge=1).confirm()
+
+    def _run(self):
+        out = StringIO()
+        call_command("send_offer_reminders", stdout=out)
+        return out.getvalue()
+
+    def test_reminders_are_sent_once(self):
+        Offer.objects.filter(pk=self.offer.pk).update(abhol_von=timezone.localdate() + timedelta(days=2))
+        self._create_registrations(3)
+
+        self.assertIn("3 Erinnerungs-Mails versendet", self._run())
+        self.assertIn("0 Erinnerungs-Mails versendet", self._run())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailLog.objects.filter(typ=EmailLog.Typ.REMINDER_PRE).count(), 3)
+
+    def test_query_count_does_not_grow_with_recipients(self):
+        Offer.objects.filter(pk=self.offer.pk).update(abhol_von=timezone.localdate())
+        self._create_registrations(2)
+        with CaptureQueriesContext(connection) as few:
+            self._run()
+
+        self._create_registrations(8, offset=2)
+        with CaptureQueriesContext(connection) as many:
+            self._run()
+
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(EmailLog.objects.filter(typ=EmailLog.Typ.REMINDER_START).count(), 10)
+
+    def test_concurrent_dispatch(self):
+        Offer.objects.filter(pk=self.offer.pk).update(abhol_von=timezone.localdate())
+        self._create_registrations(6)
+
+        out = StringIO()
+        call_command("send_offer_reminders", "--workers", "3", "--rate", "500", "--chunk-size", "4", stdout=out)
+
+        self.assertIn("6 Erinnerungs-Mails versendet", out.getvalue())
+        self.assertIn("p95", out.getvalue())
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(EmailLog.objects.filter(typ=EmailLog.Typ.REMINDER_START).count(), 6)
+
+    def test_dry_run_neither_sends_nor_logs(self):
+        Offer.objects.filter(pk=self.offer.pk).update(abhol_von=timezone.localdate())
+        self._create_registrations(2)
+
+        out = StringIO()
+        call_command("send_offer_reminders", "--dry-run", stdout=out)
+
+        self.assertIn("2 Erinnerungs-Mails gerendert", out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(EmailLog.objects.filter(typ=EmailLog.Typ.REMINDER_START).exists())
+
+    def test_failed_messages_are_not_logged(self):
+        Offer.objects.filter(pk=self.offer.pk).update(abhol_von=timezone.localdate())
+        self._create_registrations(2)
+
+        with (
+            patch("offers.services.build_reminder_message", side_effect=RuntimeError("smtp down")),
+            self.assertLogs("offers.services", level="ERROR"),
+        ):
+            summary = ReminderDispatcher(EmailLog.Typ.REMINDER_START, workers=2).dispatch(
+                pending_reminders(EmailLog.Typ.REMINDER_START, timezone.localdate())
+            )
+
+        self.assertEqual((summary.sent, summary.failed), (0, 2))
+        self.assertFalse(EmailLog.objects.filter(typ=EmailLog.Typ.REMINDER_START).exists())
+
+    def test_connection_is_replaced_after_a_send_error(self):
+        Offer.objects.filter(pk=self.offer.pk).update(abhol_von=timezone.localdate())
+        self._create_registrations(2)
+        broken, fresh = Mock(), Mock()
+        broken.send_messages.side_effect = SMTPServerDisconnected("Connection unexpectedly closed")
+
+        with (
+            patch("offers.services.get_connection", side_effect=[broken, fresh]),
+            self.assertLogs("offers.services", level="ERROR"),
+        ):
+            summary = ReminderDispatcher(EmailLog.Typ.REMINDER_START).dispatch(
+                pending_reminders(EmailLog.Typ.REMINDER_START, timezone.localdate())
+            )
+
+        self.assertEqual((summary.sent, summary.failed), (1, 1))
+        broken.close.assert_called_once()
+        fresh.send_messages.assert_called_once()
+        fresh.close.assert_called_once()
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_calls_are_spaced(self):
+        limiter = RateLimiter(rate=50)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 5 / 50 - 0.01)
+
+
+class EmailRendererTests(MailTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registration = Registration(user=self.user, offer=self.offer, menge=3)
+        self.registration.confirm()
+
+    def test_output_matches_template_rendering(self):
+        renderer = reminder_renderer(self.offer, EmailLog.Typ.REMINDER_PRE)
+        context = {
+            "offer": self.offer,
+            "registration": self.registration,
+            "user": self.user,
+            "subject": renderer.subject,
+            "abhol_von": self.offer.abhol_von.strftime("%d.%m.%Y"),
+            "abhol_bis": self.offer.abhol_bis.strftime("%d.%m.%Y"),
+        }
+
+        html_body, text_body = renderer.render(self.registration)
+
+        self.assertEqual(html_body, render_to_string("email/reminder_pre.html", context))
+        self.assertEqual(text_body, render_to_string("email/reminder_pre.txt", context))
+
+    def test_reminder_bodies_are_rendered_once_per_offer(self):
+        renderer = reminder_renderer(self.offer, EmailLog.Typ.REMINDER_START)
+        self.assertFalse(renderer.personalized)
+
+        with patch.object(renderer.html_template, "render", wraps=renderer.html_template.render) as render:
+            first = renderer.build(self.registration)
+            second = renderer.build(self.registration)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.body, second.body)
+
+    def test_confirmation_is_personalized(self):
+        renderer = confirmation_renderer(self.offer)
+        self.assertTrue(renderer.personalized)
+
+        message = renderer.build(self.registration)
+
+        self.assertIn("Menge: 3", message.body)
+        self.assertEqual(message.to, [self.user.email])
+        self.assertIs(confirmation_renderer(self.offer).html_template, renderer.html_template)
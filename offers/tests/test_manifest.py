@@ -0,0 +1,126 @@
+import sqlite3
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from offers.manifest import apply_checkins, parse_timestamp
+from offers.models import ExportJob, Offer, Registration
+from offers.tasks import run_export_job
+from offers.tests.test_checkin import CheckInTestCase
+from users.models import User
+
+
+class ManifestTestCase(CheckInTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "manifest.sqlite3"
+        self.start, self.end = self.offer.abhol_von, self.offer.abhol_bis
+        second_offer = Offer.objects.create(
+            titel="Rehgulasch",
+            bestell_start=self.offer.bestell_start,
+            bestell_ende=self.offer.bestell_ende,
+            abhol_von=self.start,
+            abhol_bis=self.end,
+            limit_gesamt=10,
+        )
+        Registration(user=self.registrations["Bauer"].user, offer=second_offer, menge=1).confirm()
+
+    def _export(self):
+        out = StringIO()
+        call_command(
+            "export_pickup_manifest", "--von", str(self.start), "--bis", str(self.end), "-o", str(self.path), stdout=out
+        )
+        return out.getvalue()
+
+    def _check_in_offline(self, *codes, at="2026-10-17T10:15:00"):
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.executemany("UPDATE registrations SET abgeholt_at = ? WHERE code = ?", [(at, c) for c in codes])
+        connection.close()
+
+
+class ManifestExportTests(ManifestTestCase):
+    def test_manifest_is_a_self_contained_indexed_database(self):
+        self.assertIn("5 Bestellungen", self._export())
+
+        connection = sqlite3.connect(self.path)
+        self.addCleanup(connection.close)
+        self.assertEqual(connection.execute("SELECT count(*) FROM customers").fetchone(), (4,))
+        self.assertEqual(connection.execute("SELECT count(*) FROM offers").fetchone(), (2,))
+        rows = connection.execute(
+            "SELECT r.menge, o.titel FROM registrations r JOIN customers c ON c.id = r.customer_id "
+            "JOIN offers o ON o.id = r.offer_id WHERE c.last_name = 'bauer' COLLATE NOCASE ORDER BY o.titel"
+        ).fetchall()
+        self.assertEqual(rows, [(1, "Rehgulasch"), (2, "Wildschweinbraten")])
+        plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM customers WHERE last_name = 'x' COLLATE NOCASE")
+        self.assertIn("customers_last_name", str(plan.fetchall()))
+
+    def test_manifest_export_job(self):
+        job = ExportJob.objects.create(format=ExportJob.Format.MANIFEST, abholung_von=self.start, abholung_bis=self.end)
+
+        with self.settings(MEDIA_ROOT=self.path.parent):
+            run_export_job.call(job.pk)
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.Status.DONE)
+            self.assertEqual(job.zeilen, 5)
+            self.assertTrue(job.datei.name.endswith(".sqlite3"))
+
+
+class ManifestSyncTests(ManifestTestCase):
+    def test_sync_is_bulk_and_idempotent(self):
+        self._export()
+        codes = [self.registrations["Bauer"].code, self.registrations["Meier"].code]
+        self._check_in_offline(*codes)
+
+        out = StringIO()
+        call_command("sync_pickup_manifest", str(self.path), stdout=out)
+        self.assertIn("2 Abholungen übernommen, 0 waren bereits erfasst", out.getvalue())
+        call_command("sync_pickup_manifest", str(self.path), stdout=out)
+        self.assertIn("0 Abholungen übernommen, 2 waren bereits erfasst", out.getvalue())
+
+        picked_up = Registration.objects.filter(abgeholt_at__isnull=False)
+        self.assertCountEqual(picked_up.values_list("code", flat=True), codes)
+        self.assertEqual(picked_up.first().abgeholt_at, parse_timestamp("2026-10-17T10:15:00"))
+
+    def test_earliest_check_in_wins_and_unknown_codes_are_reported(self):
+        code = self.registrations["Müller"].code
+
+        # savepoint, one SELECT and one UPDATE for the batch
+        with self.assertNumQueries(4):
+            result = apply_checkins(
+                [
+                    (code, parse_timestamp("2026-10-17T11:00:00")),
+                    (code.lower(), parse_timestamp("2026-10-17T09:00:00")),
+                    ("ZZZZZZZZ", parse_timestamp("2026-10-17T09:00:00")),
+                ]
+            )
+
+        self.assertEqual((result.picked_up, result.already_picked_up, result.unknown), (1, 0, ["ZZZZZZZZ"]))
+        self.assertEqual(Registration.objects.get(code=code).abgeholt_at, parse_timestamp("2026-10-17T09:00:00"))
+
+    def test_api_accepts_manifest_file_and_json(self):
+        self.client.force_login(self.registrations["Bauer"].user)
+        url = reverse("checkin-sync")
+        self.assertEqual(self.client.post(url, {"checkins": []}, content_type="application/json").status_code, 403)
+        staff = User.objects.create_user(email="theke@example.com", password="testpass123", is_staff=True)
+        self.client.force_login(staff)
+        self._export()
+        self._check_in_offline(self.registrations["Bauer"].code)
+
+        with self.path.open("rb") as manifest:
+            response = self.client.post(url, {"manifest": manifest})
+        self.assertEqual(response.json(), {"abgeholt": 1, "bereits_abgeholt": 0, "unbekannt": []})
+
+        payload = {"checkins": [{"code": self.registrations["Bauer"].code, "abgeholt_at": "2026-10-17T10:00:00"}]}
+        response = self.client.post(url, payload, content_type="application/json")
+        self.assertEqual(response.json(), {"abgeholt": 0, "bereits_abgeholt": 1, "unbekannt": []})
+
+        response = self.client.post(url, {"checkins": [{"code": "X"}]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {"manifest": StringIO("kein sqlite")})
+        self.assertEqual(response.status_code, 400)
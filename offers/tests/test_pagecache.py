@@ -0,0 +1,102 @@
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from offers.models import Offer, Registration
+from offers.pagecache import PAGE_CACHE_TIMEOUT, VERSION_TIMEOUT, seconds_until_next_change
+from users.models import User
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.offer = self._create_offer("Rehgulasch")
+        self.other = self._create_offer("Wildschweinbraten")
+        self.user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+        self.list_url = reverse("offers:list")
+        self.detail_url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
+
+    def _create_offer(self, titel):
+        return Offer.objects.create(
+            titel=titel,
+            bestell_start=self.now - timedelta(hours=1),
+            bestell_ende=self.now + timedelta(hours=1),
+            abhol_von=(self.now + timedelta(days=3)).date(),
+            abhol_bis=(self.now + timedelta(days=5)).date(),
+            limit_gesamt=10,
+        )
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url in [self.list_url, self.detail_url]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second["ETag"], first["ETag"])
+            self.assertEqual(second["Cache-Control"], "public, max-age=0, must-revalidate")
+            self.assertIn("Cookie", second["Vary"])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.list_url)["ETag"]
+
+        response = self.client.get(self.list_url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_registration_invalidates_pages_of_its_offer(self):
+        self.assertContains(self.client.get(self.detail_url), "10")
+        other_url = reverse("offers:detail", kwargs={"slug": self.other.slug})
+        self.client.get(other_url)
+        self.client.get(self.list_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Registration(user=self.user, offer=self.offer, menge=3).confirm()
+
+        self.assertContains(self.client.get(self.detail_url), "7")
+        self.assertContains(self.client.get(self.list_url), "Noch verfügbar: 7")
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+    def test_failing_cache_does_not_roll_back_the_order(self):
+        with (
+            patch("offers.pagecache.cache.incr", side_effect=OperationalError("database is locked")),
+            self.assertLogs(level="ERROR"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            Registration(user=self.user, offer=self.offer, menge=3).confirm()
+
+        self.assertTrue(Registration.objects.filter(user=self.user).exists())
+
+    def test_versions_of_unknown_slugs_expire(self):
+        self.assertEqual(self.client.get(reverse("offers:detail", kwargs={"slug": "gibt-es-nicht"})).status_code, 404)
+
+        self.assertIsNotNone(cache.get("offers:stock-version:gibt-es-nicht"))
+        with patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + VERSION_TIMEOUT + 1):
+            self.assertIsNone(cache.get("offers:stock-version:gibt-es-nicht"))
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.get(self.detail_url)
+        self.client.force_login(self.user)
+
+        response = self.client.get(self.detail_url)
+
+        self.assertIsNotNone(response.context["form"])
+        self.assertNotIn("ETag", response)
+
+    def test_lifetime_ends_with_the_next_order_window_change(self):
+        self.offer.bestell_start = timezone.now() + timedelta(seconds=30)
+        self.offer.bestell_ende = timezone.now() + timedelta(hours=1)
+
+        self.assertLessEqual(seconds_until_next_change([self.offer]), 30)
+        self.assertEqual(seconds_until_next_change([]), PAGE_CACHE_TIMEOUT)
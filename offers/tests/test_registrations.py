@@ -1,8 +1,13 @@
+import tempfile
 from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
@@ -69,11 +74,113 @@ class RegistrationRuleTests(TestCase):
         self.assertEqual(rows[0][1], offer.titel)
         self.assertEqual(rows[0][2], 1)
 
-        response = export_registrations_pdf(offer)
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(EXPORT_CACHE_DIR=cache_dir):
+            response = export_registrations_pdf(offer)
+            response.close()
         self.assertIn("vorbestellungen", response["Content-Disposition"])
         self.assertIn("application/pdf", response["Content-Type"])
 
 
+class ReservedCounterTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Rehkeule",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=10,
+        )
+        self.user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+
+    def test_confirm_updates_counter(self):
+        registration = Registration(user=self.user, offer=self.offer, menge=3)
+        registration.confirm()
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 3)
+
+        registration = Registration.objects.get(pk=registration.pk)
+        registration.menge = 5
+        registration.confirm()
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 5)
+        self.assertEqual(self.offer.remaining_quantity(), 5)
+        self.assertEqual(self.offer.remaining_quantity(exclude_registration=registration), 10)
+
+    def test_delete_releases_quantity(self):
+        Registration(user=self.user, offer=self.offer, menge=4).confirm()
+        Registration.objects.filter(offer=self.offer).delete()
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 0)
+
+    def test_offer_save_keeps_counter(self):
+        stale = Offer.objects.get(pk=self.offer.pk)
+        Registration(user=self.user, offer=self.offer, menge=2).confirm()
+        stale.titel = "Rehkeule am Knochen"
+        stale.save()
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 2)
+
+    def _second_offer(self, limit_gesamt):
+        return Offer.objects.create(
+            titel="Wildschweinkeule",
+            bestell_start=self.offer.bestell_start,
+            bestell_ende=self.offer.bestell_ende,
+            abhol_von=self.offer.abhol_von,
+            abhol_bis=self.offer.abhol_bis,
+            limit_gesamt=limit_gesamt,
+        )
+
+    def test_moving_a_registration_moves_its_quantity(self):
+        other = self._second_offer(limit_gesamt=5)
+        Registration(user=self.user, offer=self.offer, menge=3).confirm()
+        registration = Registration.objects.get()
+
+        registration.offer = other
+        registration.full_clean()
+        registration.save()
+
+        self.offer.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.offer.reserved, other.reserved), (0, 3))
+        call_command("rebuild_reserved_counts", "--check", stdout=StringIO())
+
+    def test_move_to_an_offer_without_enough_stock_is_rejected(self):
+        other = self._second_offer(limit_gesamt=2)
+        Registration(user=self.user, offer=self.offer, menge=3).confirm()
+        registration = Registration.objects.get()
+        registration.offer = other
+
+        with self.assertRaises(ValidationError):
+            registration.full_clean()
+        with self.assertRaises(ValidationError):
+            registration.save()
+
+        self.offer.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.offer.reserved, other.reserved), (3, 0))
+        self.assertEqual(Registration.objects.get().offer, self.offer)
+
+    def test_remaining_quantity_does_not_query(self):
+        Registration(user=self.user, offer=self.offer, menge=2).confirm()
+        offer = Offer.objects.get(pk=self.offer.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(offer.remaining_quantity(), 8)
+
+    def test_rebuild_command_fixes_drift(self):
+        Registration(user=self.user, offer=self.offer, menge=2).confirm()
+        Offer.objects.filter(pk=self.offer.pk).update(reserved=7)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_reserved_counts", "--check", stdout=StringIO())
+        call_command("rebuild_reserved_counts", stdout=StringIO())
+
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 2)
+        call_command("rebuild_reserved_counts", "--check", stdout=StringIO())
+
+
 class OfferRegistrationViewTests(TestCase):
     def setUp(self):
         self.now = timezone.now()
@@ -100,6 +207,30 @@ class OfferRegistrationViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "Nur noch 0 Stück verfügbar.")
 
+    def test_detail_view_loads_offer_and_registration_at_once(self):
+        self.client.force_login(self.user)
+        url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
+
+        # session, user and the registration joined with its offer
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.context["form"].fields["menge"].widget.attrs["max"], 10)
+
+    def test_increase_is_limited_to_remaining_stock(self):
+        other = User.objects.create_user(email="other@example.com", password="testpass123")
+        Registration(user=other, offer=self.offer, menge=7).confirm()
+        self.client.force_login(self.user)
+        url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
+
+        response = self.client.post(url, {"menge": 4})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Du kannst höchstens 3 Stück reservieren.")
+        response = self.client.post(url, {"menge": 3})
+        self.assertRedirects(response, reverse("offers:success", kwargs={"slug": self.offer.slug}))
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 10)
+
     def test_detail_view_shows_total_remaining_quantity(self):
         self.client.force_login(self.user)
         url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
@@ -109,3 +240,36 @@ class OfferRegistrationViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("remaining", response.context)
         self.assertEqual(response.context["remaining"], self.offer.remaining_quantity())
+
+
+class OfferListViewTests(TestCase):
+    def _create_offer(self, titel, limit_gesamt=10):
+        now = timezone.now()
+        return Offer.objects.create(
+            titel=titel,
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=limit_gesamt,
+        )
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("offers:list"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_offers(self):
+        offer = self._create_offer("Rehgulasch", limit_gesamt=5)
+        user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+        Registration(user=user, offer=offer, menge=2).confirm()
+        single = self._count_queries()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(4):
+                self._create_offer(f"Wildpaket {index}")
+
+        self.assertEqual(self._count_queries(), single)
+        response = self.client.get(reverse("offers:list"))
+        self.assertContains(response, "Noch verfügbar: 3")
@@ -0,0 +1,145 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from offers.models import Consent, Offer, Registration
+from offers.reservations import Reservation, StockExhausted, claim_stock, register_many, reserve
+from users.models import User
+
+
+class ReservationServiceTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Wildschwein Bratwurst",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=10,
+        )
+        self.first_user = User.objects.create_user(email="a@example.com", password="testpass123")
+        self.second_user = User.objects.create_user(email="b@example.com", password="testpass123")
+
+    def test_claim_stock_is_guarded(self):
+        self.assertTrue(claim_stock(self.offer.pk, 10))
+        self.assertFalse(claim_stock(self.offer.pk, 1))
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 10)
+
+    def test_reserve_creates_registration_and_consent(self):
+        reservation = reserve(Registration(user=self.first_user, offer=self.offer, menge=3))
+
+        self.assertEqual(reservation.status, Reservation.RESERVED)
+        self.assertEqual(reservation.available, 7)
+        self.assertEqual(Consent.objects.filter(user=self.first_user, offer=self.offer).count(), 1)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 3)
+
+    def test_stale_offer_cannot_oversell(self):
+        stale_offer = Offer.objects.get(pk=self.offer.pk)
+        reserve(Registration(user=self.first_user, offer=self.offer, menge=6))
+
+        reservation = reserve(Registration(user=self.second_user, offer=stale_offer, menge=5))
+
+        self.assertEqual(reservation.status, Reservation.SOLD_OUT)
+        self.assertEqual(reservation.available, 4)
+        self.assertIn("Nur noch 4 Stück", reservation.message)
+        self.assertFalse(Registration.objects.filter(user=self.second_user).exists())
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 6)
+
+    def test_partial_reservation(self):
+        stale_offer = Offer.objects.get(pk=self.offer.pk)
+        reserve(Registration(user=self.first_user, offer=self.offer, menge=8))
+
+        reservation = reserve(Registration(user=self.second_user, offer=stale_offer, menge=5), allow_partial=True)
+
+        self.assertEqual(reservation.status, Reservation.PARTIAL)
+        self.assertEqual(reservation.registration.menge, 2)
+        self.assertEqual(reservation.available, 0)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 10)
+
+    def test_increase_claims_only_the_difference(self):
+        registration = reserve(Registration(user=self.first_user, offer=self.offer, menge=4)).registration
+        registration = Registration.objects.get(pk=registration.pk)
+        registration.menge = 6
+
+        reservation = reserve(registration)
+
+        self.assertEqual(reservation.status, Reservation.RESERVED)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 6)
+
+    def test_duplicate_registration_is_rejected(self):
+        reserve(Registration(user=self.first_user, offer=self.offer, menge=1))
+
+        with self.assertRaises(ValidationError):
+            reserve(Registration(user=self.first_user, offer=self.offer, menge=1))
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 1)
+
+    def test_register_many_cannot_oversell(self):
+        stale_offer = Offer.objects.get(pk=self.offer.pk)
+        reserve(Registration(user=self.first_user, offer=self.offer, menge=8))
+        registration = Registration(
+            user=self.second_user, offer=stale_offer, menge=3, zustimmung_verbindlich_at=timezone.now()
+        )
+
+        with self.assertRaises(StockExhausted), transaction.atomic():
+            register_many(stale_offer, [registration])
+
+        self.assertFalse(Registration.objects.filter(user=self.second_user).exists())
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 8)
+
+
+@override_settings(TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}})
+class ReservationRetryTests(TransactionTestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Wildschwein Bratwurst",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=1),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=10,
+        )
+        self.user = User.objects.create_user(email="a@example.com", password="testpass123")
+
+    def _reserve_with_one_lock_error(self, registration):
+        create = Consent.objects.create
+        failures = [OperationalError("database is locked")]
+
+        def locked_once(**kwargs):
+            if failures:
+                raise failures.pop()
+            return create(**kwargs)
+
+        with patch.object(Consent.objects, "create", side_effect=locked_once), self.assertLogs("utils.db", "WARNING"):
+            return reserve(registration)
+
+    def test_retried_reservation_claims_its_stock(self):
+        reservation = self._reserve_with_one_lock_error(Registration(user=self.user, offer=self.offer, menge=3))
+
+        self.assertEqual(reservation.status, Reservation.RESERVED)
+        self.assertEqual(Registration.objects.get().menge, 3)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 3)
+
+    def test_retried_increase_claims_the_difference(self):
+        reserve(Registration(user=self.user, offer=self.offer, menge=4))
+        registration = Registration.objects.get()
+        registration.menge = 6
+
+        self._reserve_with_one_lock_error(registration)
+
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 6)
+        self.assertEqual(Registration.objects.get().menge, 6)
@@ -0,0 +1,85 @@
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from offers.models import Offer, Registration
+from offers.stockfeed import StockBroadcaster, stock_event
+from users.models import User
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}, STOCK_STREAM_ASGI=True
+)
+class StockFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.offers = [
+            Offer.objects.create(
+                titel=titel,
+                bestell_start=now - timedelta(hours=1),
+                bestell_ende=now + timedelta(hours=1),
+                abhol_von=(now + timedelta(days=3)).date(),
+                abhol_bis=(now + timedelta(days=5)).date(),
+                limit_gesamt=10,
+            )
+            for titel in ["Rehgulasch", "Wildschweinbraten"]
+        ]
+        self.user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+        self.url = reverse("offers:stock_stream")
+
+    def _reserve(self, offer, menge):
+        # the stock version is bumped once the order is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            Registration(user=self.user, offer=offer, menge=menge).confirm()
+
+    async def test_stream_starts_with_a_snapshot(self):
+        response = await self.async_client.get(self.url, {"angebot": ["rehgulasch", "wildschweinbraten"]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        events = response.streaming_content
+        self.assertTrue((await anext(events)).startswith(b"retry: "))
+        self.assertEqual(await anext(events), stock_event("rehgulasch", 10).encode())
+        self.assertEqual(await anext(events), stock_event("wildschweinbraten", 10).encode())
+        await events.aclose()
+
+    async def test_stream_needs_known_offers(self):
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 400)
+        self.assertEqual((await self.async_client.get(self.url, {"angebot": "gibt-es-nicht"})).status_code, 404)
+
+    def test_stream_is_off_without_an_asgi_server(self):
+        with self.settings(STOCK_STREAM_ASGI=False):
+            self.assertEqual(self.client.get(self.url, {"angebot": "rehgulasch"}).status_code, 404)
+            self.assertNotContains(self.client.get(reverse("offers:list")), "connectStockBadges")
+        cache.clear()
+
+        self.assertContains(self.client.get(reverse("offers:list")), "connectStockBadges")
+
+    async def test_reservation_is_pushed_to_its_listeners_only(self):
+        broadcaster = StockBroadcaster()
+        reh = await broadcaster.subscribe(["rehgulasch"])
+        braten = await broadcaster.subscribe(["wildschweinbraten"])
+
+        await sync_to_async(self._reserve)(self.offers[0], 3)
+        await broadcaster.poll()
+
+        self.assertEqual(await reh.next_changes(), {"rehgulasch": 7})
+        self.assertEqual(braten.pending, {})
+        broadcaster.unsubscribe(reh)
+        broadcaster.unsubscribe(braten)
+        self.assertEqual(broadcaster.versions, {})
+        broadcaster.task.cancel()
+
+    def test_event_format(self):
+        event = stock_event("rehgulasch", 4)
+
+        self.assertTrue(event.startswith("event: stock\ndata: "))
+        self.assertTrue(event.endswith("\n\n"))
+        self.assertEqual(json.loads(event.split("data: ")[1]), {"angebot": "rehgulasch", "verfuegbar": 4})
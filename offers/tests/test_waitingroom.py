@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from offers.models import Offer, Registration
+from offers.waitingroom import Ticket, cookie_name, issue_ticket
+from users.models import User
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class WaitingRoomTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+        self.user.email_verified_at = self.now
+        self.user.save(update_fields=["email_verified_at"])
+
+    def _create_offer(self, starts_in):
+        return Offer.objects.create(
+            titel="Rehrücken",
+            bestell_start=self.now + starts_in,
+            bestell_ende=self.now + timedelta(hours=2),
+            abhol_von=(self.now + timedelta(days=3)).date(),
+            abhol_bis=(self.now + timedelta(days=5)).date(),
+            limit_gesamt=10,
+            warteraum_rate=2,
+        )
+
+    def test_tickets_are_admitted_at_the_configured_rate(self):
+        offer = self._create_offer(timedelta(minutes=1))
+        start = offer.bestell_start.timestamp()
+
+        tickets = [issue_ticket(offer, self.user) for _index in range(4)]
+
+        self.assertEqual([ticket.number for ticket in tickets], [1, 2, 3, 4])
+        self.assertEqual([ticket.admit_at - start for ticket in tickets], [0.5, 1.0, 1.5, 2.0])
+        self.assertEqual(tickets[3].position(now=start), 4)
+        self.assertEqual(tickets[3].position(now=start + 1.2), 2)
+        self.assertTrue(tickets[3].is_admitted(now=start + 2))
+
+    def test_idle_capacity_is_not_saved_up(self):
+        offer = self._create_offer(timedelta(hours=-1))
+
+        first, second, third = [issue_ticket(offer, self.user) for _index in range(3)]
+
+        self.assertTrue(first.is_admitted())
+        self.assertAlmostEqual(second.admit_at - first.admit_at, 0.5, places=2)
+        self.assertAlmostEqual(third.admit_at - first.admit_at, 1.0, places=2)
+
+    def test_ticket_round_trip(self):
+        ticket = Ticket("rehruecken", 7, 3, 1760000000.5, 20)
+
+        self.assertEqual(Ticket.loads("rehruecken", ticket.dumps()), ticket)
+
+    def test_waiting_visitors_cannot_submit(self):
+        offer = self._create_offer(timedelta(minutes=1))
+        self.client.force_login(self.user)
+        url = reverse("offers:detail", kwargs={"slug": offer.slug})
+
+        response = self.client.get(url)
+
+        self.assertContains(response, "Du bist im Warteraum.")
+        self.assertIn(cookie_name(offer.slug), response.cookies)
+        status = self.client.get(reverse("offers:waiting_room", kwargs={"slug": offer.slug})).json()
+        self.assertFalse(status["eingelassen"])
+        # one minute until the start plus half a second for the first ticket at two per second
+        self.assertIn(status["position"], [120, 121])
+        self.assertIn(status["wartezeit"], [60, 61])
+        response = self.client.post(url, {"menge": 1})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertFalse(Registration.objects.exists())
+
+    def test_admitted_visitors_can_order(self):
+        offer = self._create_offer(timedelta(hours=-1))
+        self.client.force_login(self.user)
+        url = reverse("offers:detail", kwargs={"slug": offer.slug})
+
+        self.assertContains(self.client.get(url), "Verbindlich bestellen")
+        response = self.client.post(url, {"menge": 1})
+
+        self.assertRedirects(response, reverse("offers:success", kwargs={"slug": offer.slug}))
+        self.assertEqual(Registration.objects.get().menge, 1)
+
+    def test_tickets_belong_to_one_user(self):
+        offer = self._create_offer(timedelta(minutes=1))
+        self.client.force_login(self.user)
+        self.client.get(reverse("offers:detail", kwargs={"slug": offer.slug}))
+        other = User.objects.create_user(email="other@example.com", password="testpass123")
+        cookie = self.client.cookies[cookie_name(offer.slug)]
+        self.client.force_login(other)
+        self.client.cookies[cookie_name(offer.slug)] = cookie.value
+
+        response = self.client.get(reverse("offers:waiting_room", kwargs={"slug": offer.slug}))
+
+        self.assertEqual(response.status_code, 404)
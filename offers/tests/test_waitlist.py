@@ -0,0 +1,120 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_tasks import default_task_backend
+
+from offers.models import Offer, Registration, WaitlistEntry
+from offers.waitlist import promote
+from users.models import User
+
+
+@override_settings(TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}})
+class WaitlistTests(TestCase):
+    def setUp(self):
+        default_task_backend.clear()
+        now = timezone.now()
+        self.offer = Offer.objects.create(
+            titel="Rehrücken",
+            bestell_start=now - timedelta(hours=1),
+            bestell_ende=now + timedelta(hours=2),
+            abhol_von=(now + timedelta(days=3)).date(),
+            abhol_bis=(now + timedelta(days=5)).date(),
+            limit_gesamt=2,
+            limit_pro_user=2,
+        )
+        self.buyer = self._create_user("kaeufer@example.com")
+        self.registration = Registration.objects.create(
+            user=self.buyer, offer=self.offer, menge=2, zustimmung_verbindlich_at=now
+        )
+        self.user = self._create_user("kunde@example.com")
+        self.url = reverse("offers:waitlist", kwargs={"slug": self.offer.slug})
+        self.detail_url = reverse("offers:detail", kwargs={"slug": self.offer.slug})
+
+    def _create_user(self, email):
+        user = User.objects.create_user(email=email, password="testpass123")
+        user.email_verified_at = timezone.now()
+        user.save(update_fields=["email_verified_at"])
+        return user
+
+    def _join(self, user, menge):
+        return WaitlistEntry.objects.create(user=user, offer=self.offer, menge=menge, zustimmung_at=timezone.now())
+
+    def _enqueued(self, name):
+        return [result.args for result in default_task_backend.results if result.task.name == name]
+
+    def test_sold_out_offer_can_be_joined(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(self.detail_url), "Auf die Warteliste")
+
+        response = self.client.post(self.url, {"menge": 1})
+
+        self.assertRedirects(response, self.detail_url, fetch_redirect_response=False)
+        self.assertEqual(WaitlistEntry.objects.get(user=self.user).menge, 1)
+        self.assertContains(self.client.get(self.detail_url), "Platz 1 der Warteliste")
+
+        self.client.post(self.url, {"austragen": "1"})
+
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_waitlist_is_closed_while_stock_is_left(self):
+        Offer.objects.filter(pk=self.offer.pk).update(limit_gesamt=3)
+        self.client.force_login(self.user)
+
+        self.client.post(self.url, {"menge": 1})
+
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_released_registration_enqueues_promotion(self):
+        self._join(self.user, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.registration.delete()
+
+        self.assertEqual(self._enqueued("promote_waitlist"), [[self.offer.pk]])
+
+    def test_raised_limit_enqueues_promotion(self):
+        self._join(self.user, 1)
+        offer = Offer.objects.get(pk=self.offer.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save()
+            offer.limit_gesamt = 4
+            offer.save()
+
+        self.assertEqual(self._enqueued("promote_waitlist"), [[self.offer.pk]])
+
+    def test_promotion_follows_sign_up_order(self):
+        users = [self.user, self._create_user("zwei@example.com"), self._create_user("drei@example.com")]
+        for user, menge in zip(users, [2, 2, 1]):
+            self._join(user, menge)
+        Offer.objects.filter(pk=self.offer.pk).update(limit_gesamt=5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promoted = promote(self.offer.pk)
+
+        self.assertEqual(promoted, 2)
+        quantities = dict(Registration.objects.exclude(user=self.buyer).values_list("user__email", "menge"))
+        self.assertEqual(quantities, {"kunde@example.com": 2, "zwei@example.com": 1})
+        self.assertEqual(
+            list(WaitlistEntry.objects.order_by("erstellt_at", "pk").values_list("nachgerueckt", flat=True)),
+            [2, 1, None],
+        )
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.reserved, 5)
+        self.assertEqual(self._enqueued("send_pending_confirmations"), [[self.offer.pk]])
+        self.assertEqual(promote(self.offer.pk), 0)
+        call_command("rebuild_reserved_counts", "--check", stdout=StringIO())
+
+    def test_direct_buyers_leave_the_waitlist(self):
+        self._join(self.buyer, 1)
+        self._join(self.user, 1)
+        Offer.objects.filter(pk=self.offer.pk).update(limit_gesamt=3)
+
+        self.assertEqual(promote(self.offer.pk), 1)
+
+        self.assertEqual(Registration.objects.get(user=self.user).menge, 1)
+        self.assertEqual(WaitlistEntry.objects.get(user=self.buyer).nachgerueckt, 0)
@@ -1,7 +1,15 @@
 from django.urls import path
 from django.views.generic import RedirectView
 
-from offers.views import OfferListView, OfferRegistrationView, OfferSuccessView
+from offers.views import (
+    CheckInView,
+    OfferListView,
+    OfferRegistrationView,
+    OfferSuccessView,
+    StockStreamView,
+    WaitingRoomStatusView,
+    WaitlistView,
+)
 
 app_name = "offers"
 
@@ -9,11 +17,15 @@ urlpatterns = [
     path("", OfferListView.as_view(), name="home"),
     path("angebote", RedirectView.as_view(pattern_name="offers:list", permanent=False)),
     path("angebote/", OfferListView.as_view(), name="list"),
+    path("angebote/bestand/", StockStreamView.as_view(), name="stock_stream"),
     path("angebote/<slug:slug>", RedirectView.as_view(pattern_name="offers:detail", permanent=False)),
     path("angebote/<slug:slug>/", OfferRegistrationView.as_view(), name="detail"),
     path(
         "angebote/<slug:slug>/danke",
         RedirectView.as_view(pattern_name="offers:success", permanent=False),
     ),
+    path("angebote/<slug:slug>/warteliste/", WaitlistView.as_view(), name="waitlist"),
+    path("angebote/<slug:slug>/warteraum/", WaitingRoomStatusView.as_view(), name="waiting_room"),
     path("angebote/<slug:slug>/danke/", OfferSuccessView.as_view(), name="success"),
+    path("checkin/", CheckInView.as_view(), name="checkin"),
 ]
@@ -1,60 +1,117 @@
+import asyncio
+import tempfile
+
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView, TemplateView, View
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-from offers.forms import RegistrationForm
-from offers.models import Offer, Registration
-from offers.services import send_registration_confirmation
+from offers.forms import AllocationEntryForm, RegistrationForm, WaitlistEntryForm
+from offers.manifest import apply_checkins, parse_timestamp, read_manifest_checkins
+from offers.models import AllocationEntry, Offer, OfferAvailability, Registration, WaitlistEntry, normalize_code
+from offers.pagecache import LIST_SCOPE, AnonymousPageCacheMixin, stock_version
+from offers.serializers import CheckInSerializer
+from offers.stockfeed import broadcaster, remaining_by_slug, stock_event
+from offers.tasks import send_confirmation_mail
+from offers.waitingroom import issue_ticket, load_ticket, store_ticket
 
 
-class OfferListView(ListView):
+class OfferListView(AnonymousPageCacheMixin, ListView):
     model = Offer
     template_name = "offers/offer_list.html"
     context_object_name = "angebote"
+    read_only_database = True
 
     def get_queryset(self):
         now = timezone.now()
-        return Offer.objects.filter(bestell_ende__gte=now).order_by("bestell_start")
-class OfferRegistrationView(View):
+        return Offer.objects.filter(bestell_ende__gte=now).with_stock().order_by("bestell_start")
+
+    def page_cache_key(self):
+        return f"offers:page:list:{stock_version(LIST_SCOPE)}"
+
+    def page_cache_offers(self):
+        return self.object_list
+
+
+class OfferRegistrationView(AnonymousPageCacheMixin, View):
     template_name = "offers/offer_detail.html"
+    # only GET is routed, the order itself is written through the default connection
+    read_only_database = True
+
+    def page_cache_key(self):
+        slug = self.kwargs["slug"]
+        return f"offers:page:detail:{slug}:{stock_version(slug)}"
 
-    def get_offer(self):
-        return get_object_or_404(Offer, slug=self.kwargs["slug"])
+    def page_cache_offers(self):
+        return [self.offer]
+
+    def get_availability(self):
+        try:
+            return OfferAvailability.load(self.request.user, self.kwargs["slug"])
+        except Offer.DoesNotExist:
+            raise Http404("Angebot nicht gefunden.")
 
     def get(self, request, *args, **kwargs):
-        offer = self.get_offer()
-        registration_instance = None
+        availability = self.get_availability()
+        offer = self.offer = availability.offer
+        registration_instance = availability.registration
         form = None
-        already_registered = False
+        ticket = None
+        allocation_entry = None
+        waitlist_entry = waitlist_form = None
 
-        if request.user.is_authenticated:
-            try:
-                registration_instance = Registration.objects.get(user=request.user, offer=offer)
-                already_registered = True
-                form = RegistrationForm(request.user, offer, instance=registration_instance)
-            except Registration.DoesNotExist:
-                form = RegistrationForm(request.user, offer)
-        else:
-            form = None
-        return render(
+        if request.user.is_authenticated and offer.is_allocated_later:
+            allocation_entry = AllocationEntry.objects.filter(user=request.user, offer=offer).first()
+            form = AllocationEntryForm(
+                request.user, offer, instance=allocation_entry or AllocationEntry(user=request.user, offer=offer)
+            )
+        elif request.user.is_authenticated:
+            form = RegistrationForm(
+                request.user,
+                offer,
+                instance=registration_instance or availability.new_registration(request.user),
+                availability=availability,
+            )
+            if offer.uses_waiting_room():
+                ticket = load_ticket(request, offer.slug) or issue_ticket(offer, request.user)
+            if registration_instance is None and availability.remaining <= 0:
+                waitlist_entry = WaitlistEntry.objects.filter(
+                    user=request.user, offer=offer, nachgerueckt_am__isnull=True
+                ).first()
+                waitlist_form = WaitlistEntryForm(request.user, offer)
+        response = render(
             request,
             self.template_name,
             {
                 "offer": offer,
                 "form": form,
-                "already_registered": already_registered,
+                "already_registered": registration_instance is not None,
                 "existing_registration": registration_instance,
-                "remaining": offer.remaining_quantity(),
+                "remaining": availability.remaining,
                 "needs_login": not request.user.is_authenticated,
                 "needs_verification": request.user.is_authenticated and request.user.email_verified_at is None,
+                "ticket": ticket,
+                "waiting": ticket is not None and not ticket.is_admitted(),
+                "allocation_entry": allocation_entry,
+                "waitlist_entry": waitlist_entry,
+                "waitlist_form": waitlist_form,
             },
         )
+        if ticket is not None:
+            store_ticket(response, ticket)
+        return response
 
     def post(self, request, *args, **kwargs):
-        offer = self.get_offer()
         if not request.user.is_authenticated:
             login_url = f"{reverse('login')}?next={request.path}"
             return redirect(login_url)
@@ -62,9 +119,25 @@ class OfferRegistrationView(View):
             messages.error(request, "Bitte bestätige zuerst deine E-Mail-Adresse.")
             return redirect("verify")
 
-        existing_registration = Registration.objects.filter(user=request.user, offer=offer).first()
-        original_quantity = existing_registration.menge if existing_registration else None
-        form = RegistrationForm(request.user, offer, request.POST, instance=existing_registration)
+        availability = self.get_availability()
+        offer = availability.offer
+        if offer.is_allocated_later:
+            return self.post_allocation_entry(request, offer, availability)
+        if offer.uses_waiting_room():
+            ticket = load_ticket(request, offer.slug)
+            # turned away before the write transaction, the database only sees the admitted rate
+            if ticket is None or not ticket.is_admitted():
+                messages.info(request, "Du bist noch im Warteraum. Sobald du an der Reihe bist, kannst du bestellen.")
+                return redirect("offers:detail", slug=offer.slug)
+        existing_registration = availability.registration
+        original_quantity = availability.current_quantity if existing_registration else None
+        form = RegistrationForm(
+            request.user,
+            offer,
+            request.POST,
+            instance=existing_registration or availability.new_registration(request.user),
+            availability=availability,
+        )
         if form.is_valid():
             new_quantity = form.cleaned_data["menge"]
             if existing_registration and new_quantity == original_quantity:
@@ -83,11 +156,10 @@ class OfferRegistrationView(View):
                 else:
                     form.add_error(None, exc.message)
             else:
+                send_confirmation_mail.enqueue(registration.pk)
                 if existing_registration is None:
-                    send_registration_confirmation(registration)
                     messages.success(request, "Vielen Dank! Deine verbindliche Reservierung wurde gespeichert.")
                 else:
-                    send_registration_confirmation(registration)
                     messages.success(request, "Deine Reservierung wurde aktualisiert.")
                 return redirect("offers:success", slug=offer.slug)
 
@@ -99,12 +171,139 @@ class OfferRegistrationView(View):
                 "form": form,
                 "already_registered": existing_registration is not None,
                 "existing_registration": existing_registration,
-                "remaining": offer.remaining_quantity(),
+                "remaining": availability.remaining,
                 "needs_login": False,
                 "needs_verification": False,
             },
         )
 
+    def post_allocation_entry(self, request, offer, availability):
+        entry = AllocationEntry.objects.filter(user=request.user, offer=offer).first()
+        form = AllocationEntryForm(
+            request.user, offer, request.POST, instance=entry or AllocationEntry(user=request.user, offer=offer)
+        )
+        if form.is_valid():
+            form.save()
+            ende = timezone.localtime(offer.bestell_ende).strftime("%d.%m.%Y %H:%M")
+            messages.success(
+                request,
+                f"Dein Wunsch über {form.instance.menge} Stück ist vorgemerkt. Nach dem Bestellschluss am {ende} "
+                "wird zugeteilt, das Ergebnis bekommst du per Mail.",
+            )
+            return redirect("offers:detail", slug=offer.slug)
+        return render(
+            request,
+            self.template_name,
+            {
+                "offer": offer,
+                "form": form,
+                "already_registered": availability.registration is not None,
+                "existing_registration": availability.registration,
+                "remaining": availability.remaining,
+                "needs_login": False,
+                "needs_verification": False,
+                "allocation_entry": entry,
+            },
+        )
+
+
+@method_decorator(login_required, name="dispatch")
+class WaitlistView(View):
+    """Signing up for or leaving the waitlist of a sold-out offer, answered on the offer page."""
+
+    def post(self, request, slug):
+        offer = get_object_or_404(Offer, slug=slug)
+        entry = WaitlistEntry.objects.filter(user=request.user, offer=offer).first()
+        if entry is not None and entry.nachgerueckt_am is not None:
+            # promoted before and the registration is gone again, a new sign-up queues up at the end
+            entry.delete()
+            entry = None
+        if "austragen" in request.POST:
+            if entry is not None:
+                entry.delete()
+                messages.info(request, "Du wurdest von der Warteliste ausgetragen.")
+            return redirect("offers:detail", slug=offer.slug)
+
+        form = WaitlistEntryForm(
+            request.user, offer, request.POST, instance=entry or WaitlistEntry(user=request.user, offer=offer)
+        )
+        if form.is_valid():
+            entry = form.save()
+            messages.success(
+                request,
+                f"Du stehst auf Platz {entry.position} der Warteliste. Wird etwas frei, rückst du automatisch nach "
+                "und bekommst eine Bestätigung per Mail.",
+            )
+        else:
+            for errors in form.errors.values():
+                for error in errors:
+                    messages.error(request, error)
+        return redirect("offers:detail", slug=offer.slug)
+
+
+class WaitingRoomStatusView(View):
+    """Queue position and expected wait of the visitor's waiting room ticket, answered from the cookie alone."""
+
+    def get(self, request, slug):
+        ticket = load_ticket(request, slug) if request.user.is_authenticated else None
+        if ticket is None:
+            return JsonResponse({"detail": "Kein Warteraum-Ticket für dieses Angebot."}, status=404)
+        return JsonResponse(
+            {
+                "eingelassen": ticket.is_admitted(),
+                "position": ticket.position(),
+                "wartezeit": round(ticket.wait()),
+            }
+        )
+
+
+class StockStreamView(View):
+    """Server-Sent Events with the remaining stock of the offers given as ``?angebot=<slug>``.
+
+    Needs the ASGI application, every open stream is a coroutine rather than a worker. Answered only with
+    ``STOCK_STREAM_ASGI``, under WSGI a stream would block a whole worker until ``lifetime`` is over.
+    """
+
+    max_offers = 50
+    heartbeat = 15
+    # streams end after a while, the browser reconnects on its own and gets a fresh snapshot
+    lifetime = 600
+
+    async def get(self, request, *args, **kwargs):
+        if not settings.STOCK_STREAM_ASGI:
+            raise Http404("Live-Bestand ist nicht aktiviert.")
+        slugs = request.GET.getlist("angebot")[: self.max_offers]
+        if not slugs:
+            return HttpResponseBadRequest("Mindestens ein Angebot angeben.")
+        subscription = await broadcaster.subscribe(slugs)
+        snapshot = await remaining_by_slug(slugs)
+        if not snapshot:
+            broadcaster.unsubscribe(subscription)
+            raise Http404("Angebot nicht gefunden.")
+        response = StreamingHttpResponse(self.events(subscription, snapshot), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # nginx must pass every event through right away
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def events(self, subscription, snapshot):
+        try:
+            yield f"retry: {self.heartbeat * 1000}\n\n"
+            for slug, remaining in snapshot.items():
+                yield stock_event(slug, remaining)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.lifetime
+            while loop.time() < deadline:
+                try:
+                    changes = await asyncio.wait_for(subscription.next_changes(), self.heartbeat)
+                except TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                for slug, remaining in changes.items():
+                    yield stock_event(slug, remaining)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
 
 class OfferSuccessView(TemplateView):
     template_name = "offers/registration_success.html"
@@ -116,3 +315,77 @@ class OfferSuccessView(TemplateView):
         context["abhol_von"] = offer.abhol_von.strftime("%d.%m.%Y")
         context["abhol_bis"] = offer.abhol_bis.strftime("%d.%m.%Y")
         return context
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class CheckInView(TemplateView):
+    template_name = "offers/checkin.html"
+
+
+class CheckInViewSet(viewsets.ReadOnlyModelViewSet):
+    """Pickup counter: lookup by code or last name prefix and marking registrations as picked up."""
+
+    serializer_class = CheckInSerializer
+    permission_classes = [permissions.IsAdminUser]
+    lookup_field = "code"
+    max_results = 20
+
+    def get_queryset(self):
+        return (
+            Registration.objects.select_related("offer", "user")
+            .only(
+                "code",
+                "menge",
+                "abgeholt_at",
+                "offer__titel",
+                "user__first_name",
+                "user__last_name",
+                "user__postal_code",
+            )
+            .order_by("user__last_name", "user__first_name", "offer__titel")
+        )
+
+    def get_object(self):
+        self.kwargs[self.lookup_field] = normalize_code(self.kwargs[self.lookup_field])
+        return super().get_object()
+
+    def list(self, request, *args, **kwargs):
+        term = request.query_params.get("q", "")
+        registrations = self.get_queryset().lookup(term)[: self.max_results]
+        return Response(self.get_serializer(registrations, many=True).data)
+
+    @action(detail=True, methods=["post"])
+    def abholen(self, request, code=None):
+        code = normalize_code(code)
+        # one UPDATE on the unique code, the counter does not wait for a read first
+        if Registration.objects.filter(code=code).mark_picked_up():
+            return Response({"code": code, "abgeholt": True})
+        registration = get_object_or_404(self.get_queryset(), code=code)
+        return Response(self.get_serializer(registration).data, status=status.HTTP_409_CONFLICT)
+
+    @action(detail=False, methods=["post"])
+    def sync(self, request):
+        """Bulk upload of offline check-ins, either the manifest file or ``{"checkins": [{code, abgeholt_at}]}``."""
+        try:
+            if "manifest" in request.FILES:
+                with tempfile.NamedTemporaryFile(suffix=".sqlite3") as spool:
+                    for chunk in request.FILES["manifest"].chunks():
+                        spool.write(chunk)
+                    spool.flush()
+                    checkins = read_manifest_checkins(spool.name)
+            else:
+                checkins = [
+                    (str(item["code"]), parse_timestamp(item["abgeholt_at"]))
+                    for item in request.data.get("checkins", [])
+                ]
+        except (ValidationError, AttributeError, KeyError, TypeError) as exc:
+            message = exc.messages[0] if isinstance(exc, ValidationError) else "Ungültige Check-in-Daten."
+            return Response({"detail": message}, status=status.HTTP_400_BAD_REQUEST)
+        result = apply_checkins(checkins)
+        return Response(
+            {
+                "abgeholt": result.picked_up,
+                "bereits_abgeholt": result.already_picked_up,
+                "unbekannt": result.unknown,
+            }
+        )
@@ -0,0 +1,100 @@
+"""Waiting room for offers with ``warteraum_rate``: signed queue tickets admitted at a fixed rate.
+
+Every ticket gets a number from a counter in the shared cache and with it the moment it is admitted,
+``rate`` tickets per second in the order they were drawn. The ticket travels as a signed cookie, so checking it
+needs neither the database nor the cache and the write load on the order form stays at ``rate`` per second.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+
+from django.core.cache import cache
+
+ADMISSION_TIMEOUT = 15 * 60
+COOKIE_SALT = "offers.waitingroom"
+
+
+def cookie_name(slug: str) -> str:
+    return f"warteraum-{slug}"
+
+
+@dataclass(frozen=True)
+class Ticket:
+    slug: str
+    user_id: int
+    number: int
+    admit_at: float
+    rate: int
+
+    def wait(self, now: float | None = None) -> float:
+        return max(self.admit_at - (time.time() if now is None else now), 0)
+
+    def position(self, now: float | None = None) -> int:
+        """Place in the queue, 1 is admitted next and 0 means admitted."""
+        return math.ceil(self.wait(now) * self.rate)
+
+    def is_admitted(self, now: float | None = None) -> bool:
+        return self.wait(now) == 0
+
+    def is_expired(self, now: float | None = None) -> bool:
+        # an admitted customer has some time for the form, after that the place goes back to the queue
+        return (time.time() if now is None else now) > self.admit_at + ADMISSION_TIMEOUT
+
+    def dumps(self) -> str:
+        return f"{self.user_id}:{self.number}:{self.admit_at}:{self.rate}"
+
+    @classmethod
+    def loads(cls, slug: str, value: str) -> Ticket:
+        user_id, number, admit_at, rate = value.split(":")
+        return cls(slug, int(user_id), int(number), float(admit_at), int(rate))
+
+
+def _draw_number(offer) -> int:
+    key = f"offers:waitingroom:{offer.pk}:tickets"
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def issue_ticket(offer, user) -> Ticket:
+    rate = offer.warteraum_rate
+    number = _draw_number(offer)
+    now = time.time()
+    base_key = f"offers:waitingroom:{offer.pk}:base"
+    base = cache.get(base_key, offer.bestell_start.timestamp())
+    admit_at = base + number / rate
+    if admit_at < now:
+        # the queue ran empty, unused capacity is not saved up for the next rush
+        cache.set(base_key, now - number / rate, timeout=None)
+        admit_at = now
+    return Ticket(offer.slug, user.pk, number, admit_at, rate)
+
+
+def load_ticket(request, slug: str) -> Ticket | None:
+    """The valid ticket of the logged in user for the offer, checked without loading the offer."""
+    value = request.get_signed_cookie(cookie_name(slug), default=None, salt=COOKIE_SALT)
+    if value is None:
+        return None
+    try:
+        ticket = Ticket.loads(slug, value)
+    except ValueError:
+        return None
+    if ticket.user_id != request.user.pk or ticket.is_expired():
+        return None
+    return ticket
+
+
+def store_ticket(response, ticket: Ticket):
+    response.set_signed_cookie(
+        cookie_name(ticket.slug),
+        ticket.dumps(),
+        salt=COOKIE_SALT,
+        max_age=math.ceil(ticket.wait() + ADMISSION_TIMEOUT),
+        httponly=True,
+        samesite="Lax",
+    )
@@ -0,0 +1,49 @@
+"""Waitlist of sold-out offers.
+
+Released stock (a deleted registration or a raised ``limit_gesamt``) is handed to the waitlist in the order of
+sign-up, all promotions of one release in one transaction. The promoted customers get their confirmation through the
+mail queue instead of reloading the offer page.
+"""
+
+from __future__ import annotations
+
+from django.db import transaction
+from django.utils import timezone
+
+from offers.allocation import wanted_quantity
+from offers.models import Offer, Registration, WaitlistEntry
+from offers.reservations import register_many
+
+
+def open_entries(offer_id: int):
+    return WaitlistEntry.objects.filter(offer_id=offer_id, nachgerueckt_am__isnull=True)
+
+
+def promote(offer_id: int) -> int:
+    """Turns waitlist entries into registrations while stock is left, returns the number of promoted entries."""
+    with transaction.atomic():
+        # locked up front where the database supports it, register_many() guards the claim in any case
+        offer = Offer.objects.select_for_update().filter(pk=offer_id).first()
+        if offer is None or offer.abhol_bis < timezone.localdate():
+            return 0
+        available = offer.remaining_quantity()
+        if available <= 0:
+            return 0
+        registered = set(offer.registrations.values_list("user_id", flat=True))
+        now = timezone.now()
+        closed, registrations = [], []
+        for entry in open_entries(offer.pk).order_by("erstellt_at", "pk").iterator(chunk_size=200):
+            if available <= 0:
+                break
+            # ordered directly in the meantime, the entry is no longer waiting
+            quantity = 0 if entry.user_id in registered else min(wanted_quantity(entry, offer), available)
+            if quantity:
+                registrations.append(
+                    Registration(user_id=entry.user_id, offer=offer, menge=quantity, zustimmung_verbindlich_at=now)
+                )
+                available -= quantity
+            entry.nachgerueckt, entry.nachgerueckt_am = quantity, now
+            closed.append(entry)
+        register_many(offer, registrations)
+        WaitlistEntry.objects.bulk_update(closed, ["nachgerueckt", "nachgerueckt_am"], batch_size=500)
+    return len(registrations)
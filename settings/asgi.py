@@ -1,16 +1,17 @@
 """
-ASGI config for testerei project.
+ASGI config for this project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``. Needed for the live stock stream
+(``offers:stock_stream``), served by uvicorn next to the WSGI workers, see ``deployment/project-stream.sh``.
 
 For more information on this file, see
-https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+https://docs.djangoproject.com/en/dev/howto/deployment/asgi/
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testerei.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 
 application = get_asgi_application()
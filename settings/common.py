@@ -85,6 +85,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "axes.middleware.AxesMiddleware",
+    "utils.middleware.ReadOnlyRoutingMiddleware",
 ]
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
@@ -102,6 +103,7 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "users.context_processors.account",
+                "offers.context_processors.stock_stream",
             ],
             "loaders": [
                 # PyPugJS part:   ##############################
@@ -138,7 +140,22 @@ DATABASES = {
                     PRAGMA cache_size=2000;
                 """,
         },
-    }
+    },
+    # same file for exports, reports and read-only pages, see utils/routers.py
+    "readonly": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "transaction_mode": "DEFERRED",
+            "timeout": 5,  # seconds
+            "init_command": """
+                    PRAGMA query_only=ON;
+                    PRAGMA mmap_size = 134217728;
+                    PRAGMA cache_size=2000;
+                """,
+        },
+        "TEST": {"MIRROR": "default"},
+    },
     # PLEASE, as soon as the project gets a lil more serious => use Postgres!
     # BUT the new WAL mode of SQLite should be good enough for small to medium projects
     #############################################################################################
@@ -152,11 +169,24 @@ DATABASES = {
     #     'ATOMIC_REQUESTS': True,  # enables automatic rollback on broken requests
     # }
 }
+DATABASE_ROUTERS = ["utils.routers.ReadOnlyRouter"]
+# the live stock stream holds its connection for minutes, only switch it on where an ASGI server answers
+# /angebote/bestand/ (settings/deployment/project-stream.sh), a WSGI worker would be blocked for the whole stream
+STOCK_STREAM_ASGI = env.bool("STOCK_STREAM_ASGI", default=False)
 CACHES = {
-    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    # one SQLite file shared by all uwsgi/gunicorn workers, so invalidations reach every process
+    "default": {
+        "BACKEND": "utils.cache.SQLiteCache",
+        "LOCATION": env("CACHE_LOCATION", default=str(BASE_DIR / "cache.sqlite3")),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
     "axes_cache": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
 }
+# database sessions whose save is retried when SQLite's write lock is busy, see utils/db.py
+SESSION_ENGINE = "utils.sessions"
 TASKS = {"default": {"BACKEND": "django_tasks.backends.database.DatabaseBackend"}}
+# tests get their own cache file, see utils/runner.py
+TEST_RUNNER = "utils.runner.TestRunner"
 
 
 # Password validation
@@ -191,6 +221,8 @@ STATICFILES_FINDERS = [
 MEDIA_URL = "/media/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_ROOT = BASE_DIR / "media"
+# rendered single-offer exports, keyed by the registration version of the offer
+EXPORT_CACHE_DIR = MEDIA_ROOT / "export-cache"
 COMPRESS_PRECOMPILERS = (("text/x-sass", "sass {infile} {outfile}"),)
 COMPRESS_ENABLED = True
 COMPRESS_OFFLINE = True
@@ -292,4 +324,6 @@ REST_FRAMEWORK = {
 
 CRONJOBS = [
     ("0 8 * * *", "django.core.management.call_command", ["send_offer_reminders"]),
+    ("*/5 * * * *", "django.core.management.call_command", ["allocate_offers"]),
+    ("30 3 * * *", "django.core.management.call_command", ["cleanup_exports"]),
 ]
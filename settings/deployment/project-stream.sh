@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# ASGI server for the live stock stream (/angebote/bestand/), every open stream is a coroutine instead of a
+# blocked WSGI worker. nginx routes only that path here, see project.nginx. Needs STOCK_STREAM_ASGI=on in .env.
+PROJECT="<project>"  # change me, the same name as in project.nginx
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+cd "${SCRIPT_DIR}/../.."
+exec "${SCRIPT_DIR}/../.venv/bin/uvicorn" settings.asgi:application --uds "/tmp/${PROJECT}-stream.sock" --workers 1
@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# task worker for django_tasks (confirmation mails, waitlist, exports), without it enqueued tasks are never run.
+# Runs next to project.sh, under uWSGI project.yml starts it itself.
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+cd "${SCRIPT_DIR}/../.."
+exec "${SCRIPT_DIR}/../.venv/bin/python" manage.py db_worker
@@ -3,10 +3,12 @@ from django.contrib import admin
 from django.urls import include, path
 from rest_framework import routers
 
+from offers.views import CheckInViewSet
 from users.views import UserViewSet
 
 router = routers.DefaultRouter()
 router.register(r"users", UserViewSet)
+router.register(r"checkin", CheckInViewSet, basename="checkin")
 
 urlpatterns = [
     path("admin/", include("loginas.urls")),
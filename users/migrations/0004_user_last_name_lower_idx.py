@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-16
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_alter_user_managers"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Lower("last_name"), name="user_last_name_lower_idx"
+            ),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 from django.core.mail import EmailMultiAlternatives
 from django.db import models
+from django.db.models.functions import Lower
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -72,6 +73,8 @@ class User(AbstractBaseUser, BaseModel, PermissionsMixin):
     class Meta(BaseModel.Meta):
         verbose_name = _("Benutzer")
         verbose_name_plural = _("Benutzer")
+        # prefix lookups at the pickup counter
+        indexes = [models.Index(Lower("last_name"), name="user_last_name_lower_idx")]
 
     def __str__(self):
         return self.get_full_name() or self.email
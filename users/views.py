@@ -26,6 +26,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
 class ProfileView(LoginRequiredMixin, TemplateView):
     template_name = "users/profile.html"
+    read_only_database = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
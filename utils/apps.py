@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class UtilsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "utils"
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from django.db.backends.signals import connection_created
+        from django_tasks.signals import task_finished
+
+        from utils.db import flush_lock_stats, install_lock_wait_recorder
+
+        connection_created.connect(install_lock_wait_recorder)
+        request_finished.connect(flush_lock_stats)
+        task_finished.connect(flush_lock_stats)
@@ -0,0 +1,146 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+"""
+NOT_EXPIRED = "(expires IS NULL OR expires > ?)"
+
+
+class SQLiteCache(BaseCache):
+    """Cache in a local SQLite file, shared by all worker processes of the host without an extra service.
+
+    Integers are stored as SQLite integers so ``incr()`` is a single atomic UPDATE, everything else is pickled.
+    Expired entries are invisible right away and removed when the cache grows past ``MAX_ENTRIES``. The size is only
+    checked every ``CULL_EVERY`` writes of a process (default 100), counting the rows is a scan of the whole table.
+
+        CACHES = {"default": {"BACKEND": "utils.cache.SQLiteCache", "LOCATION": BASE_DIR / "cache.sqlite3"}}
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = str(location)
+        self.busy_timeout = int(params.get("OPTIONS", {}).get("BUSY_TIMEOUT", 5000))
+        self.cull_every = int(params.get("OPTIONS", {}).get("CULL_EVERY", 100))
+        self._writes = 0
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # uwsgi forks the workers after loading the app, a connection must never cross a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.location, timeout=self.busy_timeout / 1000, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # fetchall() finishes the statement, an open cursor would keep the read transaction alive
+        rows = self.connection.execute(
+            f"SELECT value FROM cache WHERE key = ? AND {NOT_EXPIRED}", (key, time.time())
+        ).fetchall()
+        return self._decode(rows[0][0]) if rows else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(
+            "INSERT INTO cache VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+            (key, self._encode(value), self.get_backend_timeout(timeout)),
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # an expired entry counts as missing, so it is overwritten in the same statement
+        return bool(
+            self._write(
+                "INSERT INTO cache VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+                "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+                (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+            )
+        )
+
+    def _write(self, sql, params) -> int:
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            changed = connection.execute(sql, params).rowcount
+            self._writes += 1
+            if self._writes % self.cull_every == 0:
+                self._cull(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return changed
+
+    def _cull(self, connection):
+        [(count,)] = connection.execute("SELECT count(*) FROM cache").fetchall()
+        if count <= self._max_entries:
+            return
+        connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        [(count,)] = connection.execute("SELECT count(*) FROM cache").fetchall()
+        if count > self._max_entries:
+            # like Django's own backends, drop 1/CULL_FREQUENCY of the entries, the ones expiring first
+            limit = count if self._cull_frequency == 0 else count // self._cull_frequency
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)",
+                (limit,),
+            )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self.connection.execute(
+            f"UPDATE cache SET expires = ? WHERE key = ? AND {NOT_EXPIRED}",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = self.connection.execute(
+            f"UPDATE cache SET value = value + ? WHERE key = ? AND typeof(value) = 'integer' AND {NOT_EXPIRED} "
+            "RETURNING value",
+            (delta, key, time.time()),
+        ).fetchall()
+        if not rows:
+            if self._exists(key):
+                raise TypeError(f"Value of key '{key}' is not an integer.")
+            raise ValueError(f"Key '{key}' not found.")
+        return rows[0][0]
+
+    def has_key(self, key, version=None):
+        return self._exists(self.make_and_validate_key(key, version=version))
+
+    def _exists(self, key) -> bool:
+        rows = self.connection.execute(f"SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}", (key, time.time()))
+        return bool(rows.fetchall())
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self.connection.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount)
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
@@ -0,0 +1,200 @@
+"""Write lock contention on the SQLite database: how long writers wait for the lock, and retrying when they give up.
+
+With ``transaction_mode: EXCLUSIVE`` every transaction starts with ``BEGIN EXCLUSIVE``, which blocks for up to the
+connection ``timeout`` while another process writes. ``record_lock_wait`` is installed as execute wrapper on every
+connection and times exactly these statements, plus writes outside of a transaction, which take the lock implicitly.
+Each process collects its numbers in memory and adds them to counters in the shared cache from time to time, so
+``manage.py db_lock_stats`` shows all workers together.
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the wait histogram in milliseconds, the last bucket takes everything above
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+WAIT_THRESHOLD_MS = 5
+FLUSH_INTERVAL = 10
+CACHE_PREFIX = "db:locks:"
+COUNTERS = ("acquisitions", "waits", "timeouts", "retries", "failures")
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def is_lock_error(exc: BaseException | None) -> bool:
+    """True for ``database is locked``, also when a caller wrapped it into its own exception."""
+    while exc is not None:
+        if isinstance(exc, OperationalError) and "database is locked" in str(exc):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class LockStats:
+    """Lock waits of this process since the last flush."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        milliseconds = seconds * 1000
+        with self._lock:
+            self.counters["acquisitions"] += 1
+            self.counters["waits"] += milliseconds > WAIT_THRESHOLD_MS
+            self.counters["timeouts"] += timed_out
+            self.buckets[bisect.bisect_left(BUCKETS_MS, milliseconds)] += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.counters["retries"] += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.counters["failures"] += 1
+
+    def flush(self, force: bool = False):
+        """Adds the collected numbers to the shared counters, at most every ``FLUSH_INTERVAL`` seconds."""
+        with self._lock:
+            if not force and time.monotonic() - self._flushed_at < FLUSH_INTERVAL:
+                return
+            counters, buckets = self.counters, self.buckets
+            self._reset()
+            self._flushed_at = time.monotonic()
+        deltas = {**counters, **{f"bucket:{index}": count for index, count in enumerate(buckets)}}
+        try:
+            for name, delta in deltas.items():
+                if delta:
+                    _add(CACHE_PREFIX + name, delta)
+        except Exception:
+            # the statistics must never break the request that happens to flush them
+            logger.exception("Flushing the lock statistics failed")
+
+
+def _add(key: str, delta: int):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, delta)
+
+
+stats = LockStats()
+atexit.register(stats.flush, force=True)
+
+
+def flush_lock_stats(**kwargs):
+    """Receiver for ``request_finished`` and ``task_finished``."""
+    stats.flush()
+
+
+def percentile(buckets: list[int], fraction: float) -> int | None:
+    """Upper bound in milliseconds of the bucket holding the given fraction of all waits, None above the last."""
+    total = sum(buckets)
+    if not total:
+        return 0
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= fraction * total:
+            return BUCKETS_MS[index] if index < len(BUCKETS_MS) else None
+    return None
+
+
+def lock_stats() -> dict:
+    """Counters of all processes from the shared cache, without what is not flushed yet."""
+    keys = [CACHE_PREFIX + name for name in COUNTERS]
+    keys += [f"{CACHE_PREFIX}bucket:{index}" for index in range(len(BUCKETS_MS) + 1)]
+    values = cache.get_many(keys)
+    result = {name: values.get(CACHE_PREFIX + name, 0) for name in COUNTERS}
+    buckets = [values.get(f"{CACHE_PREFIX}bucket:{index}", 0) for index in range(len(BUCKETS_MS) + 1)]
+    result["p95_ms"] = percentile(buckets, 0.95)
+    result["buckets"] = buckets
+    return result
+
+
+def reset_lock_stats():
+    cache.delete_many([CACHE_PREFIX + name for name in COUNTERS])
+    cache.delete_many([f"{CACHE_PREFIX}bucket:{index}" for index in range(len(BUCKETS_MS) + 1)])
+
+
+def takes_write_lock(sql: str, connection) -> bool:
+    statement = sql.lstrip()[:15].upper()
+    if statement.startswith(("BEGIN EXCLUSIVE", "BEGIN IMMEDIATE")):
+        return True
+    return not connection.in_atomic_block and statement.startswith(WRITE_STATEMENTS)
+
+
+def record_lock_wait(execute, sql, params, many, context):
+    """Execute wrapper timing the statements that wait for the write lock."""
+    if not takes_write_lock(sql, context["connection"]):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+    except OperationalError as exc:
+        timed_out = is_lock_error(exc)
+        stats.record_wait(time.perf_counter() - started, timed_out=timed_out)
+        if timed_out:
+            logger.warning("Write lock not acquired after %.1f s: %s", time.perf_counter() - started, sql[:80])
+        raise
+    stats.record_wait(time.perf_counter() - started)
+    return result
+
+
+def install_lock_wait_recorder(sender, connection, **kwargs):
+    """Receiver for ``connection_created``, the wrapper list survives reconnects of the same connection."""
+    if connection.vendor == "sqlite" and record_lock_wait not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_lock_wait)
+
+
+def retry_on_lock(func=None, *, attempts=3, base_delay=0.05, max_delay=1.0, using=DEFAULT_DB_ALIAS):
+    """Calls ``func`` again after ``database is locked``, waiting a random share of an exponentially growing delay.
+
+    Only for idempotent work that opens its own transactions. Inside an outer ``atomic()`` the error is passed on
+    unchanged, the outer transaction is broken anyway and has to be retried as a whole.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as exc:
+                    if not is_lock_error(exc) or transaction.get_connection(using).in_atomic_block:
+                        raise
+                    if attempt == attempts:
+                        # counted once per call that gave up, not per attempt
+                        stats.record_failure()
+                        raise
+                # full jitter, so the writers that timed out together do not come back together
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+                stats.record_retry()
+                logger.warning(
+                    "%s: database is locked, attempt %s of %s in %.0f ms",
+                    func.__qualname__,
+                    attempt + 1,
+                    attempts,
+                    delay * 1000,
+                )
+                time.sleep(delay)
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from utils.db import BUCKETS_MS, WAIT_THRESHOLD_MS, lock_stats, reset_lock_stats, stats
+
+
+class Command(BaseCommand):
+    help = "Zeigt, wie lange Schreibzugriffe aller Worker auf die Schreibsperre der Datenbank gewartet haben."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zähler nach der Ausgabe auf null setzen.")
+
+    def handle(self, *args, **options):
+        stats.flush(force=True)
+        result = lock_stats()
+        p95 = f"über {BUCKETS_MS[-1]} ms" if result["p95_ms"] is None else f"≤ {result['p95_ms']} ms"
+        self.stdout.write(
+            f"Schreibsperren: {result['acquisitions']}, davon {result['waits']} länger als {WAIT_THRESHOLD_MS} ms"
+        )
+        self.stdout.write(f"Wartezeit p95: {p95}")
+        self.stdout.write(f"Wiederholungen: {result['retries']}, Fehlschläge: {result['failures']}")
+        if options["verbosity"] > 1:
+            bounds = [f"≤ {bound} ms" for bound in BUCKETS_MS] + [f"> {BUCKETS_MS[-1]} ms"]
+            for bound, count in zip(bounds, result["buckets"]):
+                if count:
+                    self.stdout.write(f"  {bound}: {count}")
+        if result["failures"]:
+            self.stdout.write(self.style.WARNING("Es sind Schreibzugriffe an der Sperre gescheitert."))
+        if options["reset"]:
+            reset_lock_stats()
@@ -0,0 +1,33 @@
+from django.urls import Resolver404, resolve
+
+from utils.routers import read_only
+
+
+def is_read_only_view(match) -> bool:
+    if match.namespace == "admin":
+        return bool(match.url_name) and match.url_name.endswith("_changelist")
+    view = getattr(match.func, "view_class", match.func)
+    return getattr(view, "read_only_database", False)
+
+
+class ReadOnlyRoutingMiddleware:
+    """Serves GET requests of read-only views and admin changelists from the read-only connection.
+
+    Views opt in with ``read_only_database = True``. Template responses are rendered inside the middleware chain, so
+    their queries are routed as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info, getattr(request, "urlconf", None))
+        except Resolver404:
+            return self.get_response(request)
+        if not is_read_only_view(match):
+            return self.get_response(request)
+        with read_only():
+            return self.get_response(request)
@@ -0,0 +1,52 @@
+"""Routing reads of reports and read-only pages to a second, read-only connection on the same SQLite file.
+
+The default connection starts every transaction with ``BEGIN EXCLUSIVE``. The ``readonly`` alias opens the same file
+with ``query_only`` and deferred transactions, so its readers only ever take a WAL snapshot and never wait for or
+hold the write lock. As both aliases are one database there is no replication lag, committed rows are visible on the
+next query. Reads are only routed inside ``read_only()``, set by ``ReadOnlyRoutingMiddleware`` for read-only views
+and by the exports.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+READ_ONLY_DB = "readonly"
+
+_read_only = ContextVar("read_only_database", default=False)
+
+
+def routes_to_read_only() -> bool:
+    # inside a write transaction the reads must see its own uncommitted rows, so they stay on its connection
+    return _read_only.get() and READ_ONLY_DB in settings.DATABASES and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+@contextmanager
+def read_only(snapshot: bool = False):
+    """Reads of the block go to the read-only connection, with ``snapshot`` all of them in one read transaction."""
+    token = _read_only.set(True)
+    try:
+        if snapshot and routes_to_read_only():
+            with transaction.atomic(using=READ_ONLY_DB):
+                yield
+        else:
+            yield
+    finally:
+        _read_only.reset(token)
+
+
+class ReadOnlyRouter:
+    def db_for_read(self, model, **hints):
+        return READ_ONLY_DB if routes_to_read_only() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # objects read through the read-only alias are saved through the default connection all the same
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ONLY_DB
@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from utils.db import stats
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests against a throwaway cache file instead of the ``cache.sqlite3`` the server uses."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix="test-cache-")
+        self._cache_settings = override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "utils.cache.SQLiteCache",
+                    "LOCATION": str(Path(self._cache_dir) / "cache.sqlite3"),
+                    "OPTIONS": {"MAX_ENTRIES": 10000},
+                },
+                "axes_cache": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+            }
+        )
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        # the lock statistics would otherwise be flushed into the real cache at exit
+        stats.flush(force=True)
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
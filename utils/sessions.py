@@ -0,0 +1,11 @@
+from django.contrib.sessions.backends import db
+
+from utils.db import retry_on_lock
+
+
+class SessionStore(db.SessionStore):
+    """Database sessions that try again when the write lock is busy, storing the same session twice is harmless."""
+
+    @retry_on_lock
+    def save(self, must_create=False):
+        super().save(must_create=must_create)
@@ -1 +1,263 @@
-# Create your tests here.
+import multiprocessing
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.sessions.backends.base import UpdateError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users.models import User
+from utils import db
+from utils.cache import SQLiteCache
+from utils.routers import READ_ONLY_DB, ReadOnlyRouter, read_only
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = Path(directory.name) / "cache.sqlite3"
+        self.cache = self._cache()
+
+    def _cache(self, **options):
+        return SQLiteCache(self.location, {"OPTIONS": options})
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set("angebot", {"titel": "Rehkeule", "verfuegbar": 3})
+
+        other_worker = self._cache()
+        self.assertEqual(other_worker.get("angebot"), {"titel": "Rehkeule", "verfuegbar": 3})
+        other_worker.delete("angebot")
+        self.assertIsNone(self.cache.get("angebot"))
+
+    def test_timeout(self):
+        self.cache.set("kurz", "wert", timeout=0.05)
+        self.cache.set("dauerhaft", "wert", timeout=None)
+        self.assertTrue(self.cache.has_key("kurz"))
+
+        time.sleep(0.1)
+
+        self.assertEqual(self.cache.get("kurz", "abgelaufen"), "abgelaufen")
+        self.assertEqual(self.cache.get("dauerhaft"), "wert")
+        self.assertFalse(self.cache.touch("kurz"))
+        self.assertTrue(self.cache.add("kurz", "neu"))
+        self.assertFalse(self.cache.add("kurz", "noch neuer"))
+        self.assertEqual(self.cache.get("kurz"), "neu")
+
+    def test_incr(self):
+        self.cache.set("zahl", 1)
+        self.cache.set("text", "1")
+
+        self.assertEqual(self.cache.incr("zahl", 5), 6)
+        self.assertEqual(self.cache.decr("zahl"), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr("fehlt")
+        with self.assertRaises(TypeError):
+            self.cache.incr("text")
+        self.cache.set("wahr", True)
+        self.assertIs(self.cache.get("wahr"), True)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set("counter", 0)
+
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=increment, args=(self.location, 100)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual(self.cache.get("counter"), 400)
+
+    def test_size_limit_drops_expired_and_soonest_expiring_entries(self):
+        cache = self._cache(MAX_ENTRIES=10, CULL_FREQUENCY=2, CULL_EVERY=1)
+        cache.set("abgelaufen", 1, timeout=0.01)
+        time.sleep(0.02)
+        for index in range(11):
+            cache.set(f"eintrag-{index}", index, timeout=100 + index)
+        cache.set("dauerhaft", "bleibt", timeout=None)
+
+        [(count,)] = cache.connection.execute("SELECT count(*) FROM cache").fetchall()
+        self.assertLessEqual(count, 10)
+        self.assertEqual(cache.get("dauerhaft"), "bleibt")
+        self.assertIsNone(cache.get("eintrag-0"))
+        self.assertEqual(cache.get("eintrag-10"), 10)
+
+    def test_clear(self):
+        self.cache.set_many({"a": 1, "b": 2})
+
+        self.cache.clear()
+
+        self.assertEqual(self.cache.get_many(["a", "b"]), {})
+
+
+def locked():
+    return OperationalError("database is locked")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class LockWaitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(db, "stats", db.LockStats())
+        self.stats = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = SimpleNamespace(in_atomic_block=False)
+
+    def _execute(self, sql, seconds=0.0, error=None):
+        def execute(sql, params, many, context):
+            time.sleep(seconds)
+            if error is not None:
+                raise error
+            return "ok"
+
+        return db.record_lock_wait(execute, sql, None, False, {"connection": self.connection})
+
+    def test_only_statements_taking_the_write_lock_are_timed(self):
+        self._execute("BEGIN EXCLUSIVE", seconds=0.03)
+        self._execute('SELECT "offers_offer"."id" FROM "offers_offer"')
+        self._execute('UPDATE "offers_offer" SET "reserved" = 1')
+        self.connection.in_atomic_block = True
+        self._execute('INSERT INTO "offers_registration" VALUES (1)')
+
+        self.assertEqual(self.stats.counters["acquisitions"], 2)
+        self.assertEqual(self.stats.counters["waits"], 1)
+
+    def test_counters_of_all_processes_are_shared(self):
+        for _index in range(19):
+            self.stats.record_wait(0.0005)
+        with self.assertRaises(OperationalError), self.assertLogs("utils.db", "WARNING"):
+            self._execute("BEGIN EXCLUSIVE", seconds=0.03, error=locked())
+        other_worker = db.LockStats()
+        other_worker.record_wait(0.0004)
+
+        self.stats.flush(force=True)
+        other_worker.flush(force=True)
+
+        result = db.lock_stats()
+        self.assertEqual((result["acquisitions"], result["waits"], result["timeouts"]), (21, 1, 1))
+        self.assertEqual(result["p95_ms"], 1)
+        self.assertEqual(db.percentile([0] * 13 + [1], 0.95), None)
+
+    def test_flush_waits_for_the_interval(self):
+        self.stats.record_wait(0.002)
+
+        self.stats.flush()
+
+        self.assertEqual(db.lock_stats()["acquisitions"], 0)
+
+    @mock.patch("utils.db.time.sleep")
+    def test_locked_calls_are_retried_with_growing_delays(self, sleep):
+        outcomes = [locked(), locked(), "gespeichert"]
+
+        @db.retry_on_lock(attempts=3, base_delay=0.1)
+        def write():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with self.assertLogs("utils.db", "WARNING") as logs:
+            self.assertEqual(write(), "gespeichert")
+        self.assertIn("attempt 3 of 3", logs.output[-1])
+        self.assertEqual(self.stats.counters["retries"], 2)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertLessEqual(first, 0.1)
+        self.assertLessEqual(second, 0.2)
+
+    @mock.patch("utils.db.time.sleep")
+    def test_retries_give_up(self, sleep):
+        calls = []
+
+        @db.retry_on_lock(attempts=2)
+        def write():
+            calls.append(1)
+            # the session backend reports the lock as its own error
+            raise UpdateError from locked()
+
+        with self.assertRaises(UpdateError), self.assertLogs("utils.db", "WARNING"):
+            write()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((self.stats.counters["retries"], self.stats.counters["failures"]), (1, 1))
+
+        @db.retry_on_lock
+        def broken():
+            calls.append(1)
+            raise OperationalError("no such table: offers_offer")
+
+        with self.assertRaises(OperationalError):
+            broken()
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.stats.counters["failures"], 1)
+
+    def test_command(self):
+        self.stats.record_wait(0.05)
+        out = StringIO()
+
+        call_command("db_lock_stats", "--reset", stdout=out)
+
+        self.assertIn("Schreibsperren: 1, davon 1 länger als 5 ms", out.getvalue())
+        self.assertIn("Wartezeit p95: ≤ 50 ms", out.getvalue())
+        self.assertEqual(db.lock_stats()["acquisitions"], 0)
+
+
+class ReadOnlyRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReadOnlyRouter()
+
+    def test_reads_are_routed_inside_read_only_blocks(self):
+        self.assertEqual(self.router.db_for_read(User), "default")
+        with read_only():
+            self.assertEqual(self.router.db_for_read(User), READ_ONLY_DB)
+            self.assertEqual(self.router.db_for_write(User), "default")
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_reads_inside_a_write_transaction_stay_on_its_connection(self):
+        with mock.patch.object(connections["default"], "in_atomic_block", True), read_only():
+            self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_read_only_alias_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate(READ_ONLY_DB, "offers"))
+        self.assertTrue(self.router.allow_migrate("default", "offers"))
+
+
+class ReadOnlyConnectionTests(TransactionTestCase):
+    databases = {"default", READ_ONLY_DB}
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="kunde@example.com", password="testpass123")
+
+    def test_read_only_connection_refuses_writes(self):
+        with self.assertRaisesMessage(OperationalError, "readonly"):
+            User.objects.using(READ_ONLY_DB).filter(pk=self.user.pk).update(first_name="Erika")
+
+        with read_only(snapshot=True):
+            self.assertTrue(connections[READ_ONLY_DB].in_atomic_block)
+            user = User.objects.get(pk=self.user.pk)
+        user.first_name = "Erika"
+        user.save()
+
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, "Erika")
+
+    def test_read_only_views_are_served_from_the_read_only_connection(self):
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connections[READ_ONLY_DB]) as queries:
+            response = self.client.get(reverse("users:profile"))
+
+        self.assertContains(response, "kunde@example.com")
+        self.assertTrue(any("users_user" in query["sql"] for query in queries))